@@ -1,3 +1,3 @@
-from .main import app
+from .cli import main
 
-app(prog_name="libertai")
+main()
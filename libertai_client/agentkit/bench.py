@@ -0,0 +1,138 @@
+import asyncio
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+import aiohttp
+
+
+@dataclass
+class BenchResult:
+    """Outcome of a load run. Latencies are in seconds, for successful requests only."""
+
+    duration: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter[int] = field(default_factory=Counter)
+    errors: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values()) + sum(self.errors.values())
+
+    @property
+    def failures(self) -> int:
+        """Requests that raised or answered with a 5xx status."""
+        server_errors = sum(n for status, n in self.statuses.items() if status >= 500)
+        return server_errors + sum(self.errors.values())
+
+    @property
+    def error_rate(self) -> float:
+        return self.failures / self.requests if self.requests else 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.duration if self.duration > 0 else 0.0
+
+    def percentile(self, q: float) -> float | None:
+        """Nearest-rank percentile of the latencies, `q` between 0 and 100."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        rank = max(1, math.ceil(q / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "duration": self.duration,
+            "throughput": self.throughput,
+            "error_rate": self.error_rate,
+            "latency": {
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99),
+                "max": max(self.latencies, default=None),
+            },
+            "statuses": {str(status): n for status, n in sorted(self.statuses.items())},
+            "errors": dict(self.errors),
+        }
+
+
+async def run_load(
+    url: str,
+    method: str = "GET",
+    concurrency: int = 10,
+    rps: float | None = None,
+    total: int | None = None,
+    duration: float | None = None,
+    timeout: float = 30.0,
+    body: bytes | None = None,
+    headers: dict[str, str] | None = None,
+) -> BenchResult:
+    """Send requests to `url` until `total` requests or `duration` seconds are reached.
+
+    Without `rps`, `concurrency` workers send requests back to back. With
+    `rps`, requests start on a fixed schedule, at most `concurrency` at a time,
+    and latency is measured from the scheduled start so that a slow server
+    can't hide its queueing delay by slowing the generator down.
+    """
+    if total is None and duration is None:
+        raise ValueError("Either a request count or a duration is required")
+    result = BenchResult()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    started_at = time.monotonic()
+    deadline = started_at + duration if duration is not None else math.inf
+    issued = 0
+
+    def take_slot() -> int | None:
+        nonlocal issued
+        if (total is not None and issued >= total) or time.monotonic() >= deadline:
+            return None
+        issued += 1
+        return issued - 1
+
+    async def send(session: aiohttp.ClientSession, scheduled_at: float) -> None:
+        try:
+            async with session.request(method, url, data=body, headers=headers) as resp:
+                await resp.read()
+                result.statuses[resp.status] += 1
+                if resp.status < 500:
+                    result.latencies.append(time.monotonic() - scheduled_at)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            result.errors[type(e).__name__] += 1
+
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=client_timeout
+    ) as session:
+        if rps is None:
+
+            async def worker() -> None:
+                while take_slot() is not None:
+                    await send(session, time.monotonic())
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        else:
+            semaphore = asyncio.Semaphore(concurrency)
+            tasks: set[asyncio.Task[None]] = set()
+
+            async def limited(scheduled_at: float) -> None:
+                async with semaphore:
+                    await send(session, scheduled_at)
+
+            while (slot := take_slot()) is not None:
+                scheduled_at = started_at + slot / rps
+                if scheduled_at >= deadline:
+                    break
+                delay = scheduled_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(limited(scheduled_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+
+    result.duration = time.monotonic() - started_at
+    return result
@@ -2,11 +2,8 @@ import time
 
 import httpx
 
-from libertai_client.agentkit.chain.constants import (
-    BASE_RPC_URL,
-    USDC_ADDRESS,
-    USDC_DECIMALS,
-)
+from libertai_client.agentkit.chain.constants import USDC_ADDRESS, USDC_DECIMALS
+from libertai_client.config import config
 
 # keccak256("balanceOf(address)")[:4]
 _BALANCE_OF_SELECTOR = "0x70a08231"
@@ -17,7 +14,7 @@ def get_usdc_balance(address: str) -> float:
     data = _BALANCE_OF_SELECTOR + padded
 
     resp = httpx.post(
-        BASE_RPC_URL,
+        config.BASE_RPC_URL,
         json={
             "jsonrpc": "2.0",
             "id": 1,
@@ -1,11 +1,6 @@
-BASE_RPC_URL = "https://mainnet.base.org"
 BASE_CHAIN_ID = 8453
 
 USDC_ADDRESS = "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
 USDC_DECIMALS = 6
 
-LIBERTAI_API_BASE = "https://api.libertai.io"
-
-ALEPH_API_URLS = ["https://api2.aleph.im", "https://api3.aleph.im"]
-
 ALEPH_CREDITS_DECIMALS = 6
@@ -0,0 +1,271 @@
+import math
+import posixpath
+import re
+import shlex
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+COMPOSE_FILE_NAMES = ["docker-compose.yml", "docker-compose.yaml"]
+# Read by compose itself for variable interpolation, so it can affect every service
+PROJECT_ENV_FILE = ".env"
+
+
+@dataclass
+class ComposeService:
+    """The parts of a compose service that tie it to files of the agent directory.
+
+    Paths are relative to the agent directory, in POSIX form, with "" for the
+    directory itself.
+    """
+
+    name: str
+    image: str | None = None
+    build_context: str | None = None
+    # Only set when the Dockerfile lives outside the build context
+    dockerfile: str | None = None
+    env_files: list[str] = field(default_factory=list)
+    bind_mounts: list[str] = field(default_factory=list)
+    published_ports: list[int] = field(default_factory=list)
+    # Highest of the limit and the reservation, None when the service sets neither
+    cpus: float | None = None
+    memory_mib: int | None = None
+    replicas: int = 1
+    # Resource settings that couldn't be read, e.g. interpolated, as "key: value"
+    unreadable_resources: list[str] = field(default_factory=list)
+
+
+@dataclass
+class RestartPlan:
+    """Compose services to rebuild or recreate after some files changed."""
+
+    everything: bool = False
+    rebuild: list[str] = field(default_factory=list)
+    recreate: list[str] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.everything or self.rebuild or self.recreate)
+
+    @property
+    def summary(self) -> str:
+        if self.everything:
+            return "all services"
+        return ", ".join(self.rebuild + self.recreate) or "nothing"
+
+    def commands(self) -> list[str]:
+        if self.everything:
+            return ["docker compose up -d --build --remove-orphans"]
+        commands = []
+        rebuild = " ".join(shlex.quote(name) for name in self.rebuild)
+        recreate = " ".join(shlex.quote(name) for name in self.recreate)
+        if self.rebuild:
+            commands.append(f"docker compose up -d --build --no-deps {rebuild}")
+        if self.recreate:
+            commands.append(f"docker compose up -d --no-deps --force-recreate {recreate}")
+        return commands
+
+
+def find_compose_file(agent_path: Path) -> Path | None:
+    for name in COMPOSE_FILE_NAMES:
+        if (agent_path / name).exists():
+            return agent_path / name
+    return None
+
+
+def _project_path(path: str) -> str | None:
+    """Normalize a path of the compose file, None when it points outside the project."""
+    if posixpath.isabs(path):
+        return None
+    normalized = posixpath.normpath(path)
+    if normalized == ".":
+        return ""
+    if normalized == ".." or normalized.startswith("../"):
+        return None
+    return normalized
+
+
+def _contains(directory: str, path: str) -> bool:
+    return directory == "" or path == directory or path.startswith(f"{directory}/")
+
+
+_MEMORY_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+# Compose units are binary whatever their spelling: "512m", "512mb", "512Mi", "512MiB"
+_MEMORY = re.compile(r"^([0-9]*\.?[0-9]+)\s*([kmgt]?)i?b?$")
+
+
+def parse_memory(value: str | float) -> int:
+    """Compose memory size ("512m", "1.5g", "256Mi", bytes as a number) in MiB, rounded up.
+
+    Raises ValueError for anything else, like a `${VARIABLE}` compose interpolates.
+    """
+    match = _MEMORY.match(str(value).strip().lower())
+    if match is None:
+        raise ValueError(f"Unreadable memory size {value!r}")
+    size, unit = match.groups()
+    return math.ceil(float(size) * _MEMORY_UNITS[unit] / 1024**2)
+
+
+def parse_cpus(value: str | float) -> float:
+    """Compose CPU count ("0.5", 2), raises ValueError for anything else."""
+    cpus = float(value)
+    if not math.isfinite(cpus) or cpus < 0:
+        raise ValueError(f"Unreadable CPU count {value!r}")
+    return cpus
+
+
+def _max(*values: float | None) -> float | None:
+    present = [value for value in values if value is not None]
+    return max(present) if present else None
+
+
+def _parse_resources(service: ComposeService, definition: dict[str, Any]) -> None:
+    deploy = definition.get("deploy") or {}
+    resources = deploy.get("resources") or {}
+    limits = resources.get("limits") or {}
+    reservations = resources.get("reservations") or {}
+
+    def read(
+        settings: dict[str, Any], parse: Callable[[str | float], float]
+    ) -> float | None:
+        values = []
+        for key, value in settings.items():
+            if value is None:
+                continue
+            try:
+                values.append(parse(value))
+            except ValueError:
+                # Sized as if the service declared nothing, rather than failing the deploy
+                service.unreadable_resources.append(f"{key}: {value}")
+        return _max(*values)
+
+    service.cpus = read(
+        {
+            "deploy.resources.limits.cpus": limits.get("cpus"),
+            "deploy.resources.reservations.cpus": reservations.get("cpus"),
+            "cpus": definition.get("cpus"),
+        },
+        parse_cpus,
+    )
+    memory_mib = read(
+        {
+            "deploy.resources.limits.memory": limits.get("memory"),
+            "deploy.resources.reservations.memory": reservations.get("memory"),
+            "mem_limit": definition.get("mem_limit"),
+            "mem_reservation": definition.get("mem_reservation"),
+        },
+        parse_memory,
+    )
+    service.memory_mib = int(memory_mib) if memory_mib is not None else None
+
+    if isinstance(deploy.get("replicas"), int):
+        service.replicas = max(0, deploy["replicas"])
+
+
+def _parse_service(name: str, definition: dict[str, Any]) -> ComposeService:
+    service = ComposeService(name=name)
+    if isinstance(definition.get("image"), str):
+        service.image = definition["image"]
+
+    build = definition.get("build")
+    if isinstance(build, str):
+        service.build_context = _project_path(build)
+    elif isinstance(build, dict):
+        service.build_context = _project_path(build.get("context", "."))
+        dockerfile = build.get("dockerfile")
+        if service.build_context is not None and isinstance(dockerfile, str):
+            path = _project_path(posixpath.join(service.build_context, dockerfile))
+            if path is not None and not _contains(service.build_context, path):
+                service.dockerfile = path
+
+    env_files = definition.get("env_file") or []
+    for env_file in [env_files] if isinstance(env_files, str) else env_files:
+        source = env_file.get("path") if isinstance(env_file, dict) else env_file
+        if isinstance(source, str) and (path := _project_path(source)) is not None:
+            service.env_files.append(path)
+
+    for volume in definition.get("volumes") or []:
+        if isinstance(volume, dict):
+            source = volume.get("source") if volume.get("type") == "bind" else None
+        else:
+            source = str(volume).split(":")[0]
+            # Named volumes don't start like a path
+            if not source.startswith((".", "/")):
+                source = None
+        if source is not None and (path := _project_path(source)) is not None:
+            service.bind_mounts.append(path)
+
+    for port in definition.get("ports") or []:
+        if isinstance(port, dict):
+            published = port.get("published")
+        else:
+            # HOST:CONTAINER or IP:HOST:CONTAINER, a bare port gets a random host port
+            parts = str(port).split("/")[0].rsplit(":", 2)
+            published = parts[-2] if len(parts) > 1 else None
+        if published is not None and str(published).isdigit():
+            service.published_ports.append(int(published))
+
+    _parse_resources(service, definition)
+    return service
+
+
+def load_services(compose_file: Path) -> list[ComposeService]:
+    with open(compose_file) as f:
+        document = yaml.safe_load(f) or {}
+    services = document.get("services") or {}
+    return [
+        _parse_service(name, definition or {}) for name, definition in services.items()
+    ]
+
+
+def pullable_images(services: list[ComposeService]) -> list[str]:
+    """Images compose pulls rather than builds, which don't depend on the agent code."""
+    return sorted(
+        {
+            service.image
+            for service in services
+            if service.image and service.build_context is None and service.replicas
+        }
+    )
+
+
+def diff_manifests(old: dict[str, str], new: dict[str, str]) -> set[str]:
+    """Paths added, removed or modified between two path to checksum manifests."""
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+
+def plan_restart(
+    compose_file_name: str,
+    services: list[ComposeService],
+    changed_paths: Iterable[str],
+) -> RestartPlan:
+    """Work out which services must be rebuilt or recreated for the changed files.
+
+    Files inside a build context or the service's Dockerfile rebuild it, env
+    files and bind mounted files only recreate it. Changes to the compose file
+    or the project `.env` restart everything, and files no service refers to
+    restart nothing.
+    """
+    plan = RestartPlan()
+    rebuild: set[str] = set()
+    recreate: set[str] = set()
+    for changed in changed_paths:
+        path = Path(changed).as_posix()
+        if path in (compose_file_name, PROJECT_ENV_FILE):
+            return RestartPlan(everything=True)
+        for service in services:
+            if (
+                service.build_context is not None
+                and _contains(service.build_context, path)
+            ) or path == service.dockerfile:
+                rebuild.add(service.name)
+            elif path in service.env_files or any(
+                _contains(mount, path) for mount in service.bind_mounts
+            ):
+                recreate.add(service.name)
+    plan.rebuild = sorted(rebuild)
+    plan.recreate = sorted(recreate - rebuild)
+    return plan
@@ -0,0 +1,704 @@
+"""Deploy pipeline of AgentKit agents, without any terminal UI.
+
+`agentkit deploy` is a thin layer over `Deployer`: progress is reported as
+`DeployEvent`s passed to a callback and the outcome comes back as a
+`DeployResult`. A deployer only touches its own agent directory, journal and
+SSH session, so many can run concurrently on one event loop.
+"""
+
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal, TypeVar
+
+from aleph.sdk.chains.ethereum import ETHAccount
+from dotenv import dotenv_values
+from libertai_x402 import create_payment_client
+
+from libertai_client.agentkit.chain.balance import (
+    get_usdc_balance,
+    wait_for_usdc_funding,
+)
+from libertai_client.agentkit.chain.wallet import generate_wallet, load_existing_wallet
+from libertai_client.agentkit.compose import (
+    ComposeService,
+    RestartPlan,
+    diff_manifests,
+    find_compose_file,
+    load_services,
+    plan_restart,
+    pullable_images,
+)
+from libertai_client.agentkit.infra.aleph import (
+    DEFAULT_CRN,
+    INSTANCE_BOOT_TIMEOUT,
+    ExistingResources,
+    MessageHandle,
+    buy_credits,
+    check_existing_resources,
+    create_instance,
+    delete_existing_resources,
+    fetch_crns,
+    fetch_instance_ip,
+    get_aleph_account,
+    get_credit_balance,
+    get_user_ssh_pubkey,
+    is_message_live,
+    notify_allocation,
+    pick_crns,
+    wait_for_instance,
+)
+from libertai_client.agentkit.infra.ssh import (
+    agent_manifest,
+    deploy_code,
+    install_docker,
+    is_code_deployed,
+    is_docker_installed,
+    manifest_digest,
+    pull_images,
+    read_remote_manifest,
+    start_agent,
+    upload_agent,
+    verify_service,
+    wait_for_ssh,
+    write_remote_manifest,
+)
+from libertai_client.agentkit.journal import DeployJournal
+from libertai_client.agentkit.replicas import Replica, deploy_replicas
+from libertai_client.agentkit.sizing import Sizing, size_instance
+from libertai_client.agentkit.state import AgentState, ReplicaEndpoint
+from libertai_client.utils.poll import Deadline
+from libertai_client.utils.sftp import TransferProgress
+from libertai_client.utils.ssh import AsyncSSHClient
+
+if TYPE_CHECKING:
+    from libertai_client.agentkit.pool import PoolInstance, WarmPool
+
+T = TypeVar("T")
+
+MIN_USDC_FUNDING = 1.0
+
+
+class DeployError(Exception):
+    """A deploy step failed, the underlying exception is chained when there is one."""
+
+    def __init__(self, step: str, message: str) -> None:
+        super().__init__(message)
+        self.step = step
+
+
+EventKind = Literal[
+    # A new phase of the deploy, e.g. "Aleph credits..."
+    "section",
+    "step_started",
+    "step_progress",
+    "step_finished",
+    # Something done, worth seeing
+    "info",
+    # Detail of what is going on, e.g. a skipped step
+    "note",
+    "warning",
+    # The wallet needs MIN_USDC_FUNDING USDC, the deploy waits until it arrives
+    "funding_required",
+    # The replicas changed, `replicas` holds all of them
+    "replicas",
+]
+
+
+@dataclass
+class DeployEvent:
+    kind: EventKind
+    message: str = ""
+    elapsed: float | None = None
+    progress: TransferProgress | None = None
+    replicas: list[Replica] | None = None
+
+
+@dataclass
+class DeployResult:
+    address: str
+    wallet_created: bool = False
+    instance_hash: str | None = None
+    instance_ip: str | None = None
+    sizing: Sizing | None = None
+    # The instance was created but no code deployed, see `register_only`
+    registered_only: bool = False
+    replicas: list[Replica] = field(default_factory=list)
+    # (label, seconds) of every step that ran
+    steps: list[tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return all(replica.ok for replica in self.replicas)
+
+
+class Deployer:
+    """Deploys the agent of a directory to Aleph Cloud, paying with credits.
+
+    `confirm_delete` is asked before deleting the wallet's existing resources,
+    they are deleted without asking when it isn't set. With a `pool`, a
+    single-instance deploy claims a warm instance when one fits instead of
+    creating one. `run` raises DeployError when a step fails.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        ssh_pubkey_path: Path | None = None,
+        credits_amount: float = 1.0,
+        register_only: bool = False,
+        resume: bool = False,
+        refresh_metadata: bool = False,
+        full_rebuild: bool = False,
+        replicas: int = 1,
+        vcpus: int | None = None,
+        memory: int | None = None,
+        on_event: Callable[[DeployEvent], None] | None = None,
+        confirm_delete: Callable[[ExistingResources], Awaitable[bool]] | None = None,
+        pool: "WarmPool | None" = None,
+    ) -> None:
+        if replicas > 1 and (resume or register_only):
+            raise ValueError("--replicas can't be combined with --resume or --register-only.")
+        self.path = path.resolve()
+        self.compose_file = find_compose_file(self.path)
+        if not register_only and self.compose_file is None:
+            raise ValueError(
+                "No docker-compose.yml found in agent directory. "
+                "A docker-compose.yml is required for deployment."
+            )
+        self.ssh_pubkey_path = ssh_pubkey_path
+        self.credits_amount = credits_amount
+        self.register_only = register_only
+        self.resume = resume
+        self.refresh_metadata = refresh_metadata
+        self.full_rebuild = full_rebuild
+        self.replicas = replicas
+        self.vcpus = vcpus
+        self.memory = memory
+        self.on_event = on_event
+        self.confirm_delete = confirm_delete
+        self.pool = pool
+        self.services: list[ComposeService] = []
+        self.steps: list[tuple[str, float]] = []
+
+    def _emit(self, kind: EventKind, message: str = "", **details: object) -> None:
+        if self.on_event is not None:
+            self.on_event(DeployEvent(kind, message, **details))  # type: ignore[arg-type]
+
+    async def _step(self, label: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self._emit("step_started", label)
+        started_at = time.monotonic()
+        try:
+            result = await fn()
+        except Exception as e:
+            raise DeployError(label, f"{type(e).__name__}: {e or repr(e)}") from e
+        elapsed = time.monotonic() - started_at
+        self.steps.append((label, elapsed))
+        self._emit("step_finished", label, elapsed=elapsed)
+        return result
+
+    async def _transfer_step(
+        self,
+        label: str,
+        fn: Callable[[Callable[[TransferProgress], None]], Awaitable[TransferProgress]],
+    ) -> TransferProgress:
+        self._emit("step_started", label)
+        started_at = time.monotonic()
+        try:
+            result = await fn(
+                lambda progress: self._emit("step_progress", label, progress=progress)
+            )
+        except Exception as e:
+            raise DeployError(label, f"{type(e).__name__}: {e or repr(e)}") from e
+        elapsed = time.monotonic() - started_at
+        self.steps.append((label, elapsed))
+        self._emit("step_finished", label, elapsed=elapsed, progress=result)
+        return result
+
+    def _setup_wallet(self, result: DeployResult) -> str:
+        """Load the wallet of the agent, or create it and save it to .env.prod."""
+        self._emit("section", "Setting up Base wallet...")
+        try:
+            existing = load_existing_wallet(self.path)
+            if existing:
+                result.address, private_key = existing
+                self._emit("info", f"Using existing wallet: {result.address}")
+                return private_key
+            result.address, private_key = generate_wallet()
+            result.wallet_created = True
+            self._emit("info", f"Wallet generated: {result.address}")
+        except Exception as e:
+            raise DeployError("Setting up Base wallet", f"{type(e).__name__}: {e}") from e
+
+        self._emit("section", "Configuring agent environment...")
+        env_path = self.path / ".env.prod"
+        try:
+            existing_env: dict[str, str | None] = {}
+            if env_path.exists():
+                existing_env = dict(dotenv_values(env_path))
+            existing_env["WALLET_PRIVATE_KEY"] = private_key
+            env_content = "\n".join(f"{k}={v}" for k, v in existing_env.items() if v) + "\n"
+            os.makedirs(self.path, exist_ok=True)
+            fd = os.open(env_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(env_content)
+        except Exception as e:
+            raise DeployError(
+                "Configuring agent environment", f"{type(e).__name__}: {e}"
+            ) from e
+        self._emit("info", f"Saved to {env_path}")
+        self._emit("warning", "It contains the wallet private key, keep it secure")
+        return private_key
+
+    def _open_journal(self, address: str) -> DeployJournal:
+        journal = DeployJournal.load(self.path)
+        if journal is not None and journal.address != address:
+            journal = None
+        if self.resume:
+            if journal is None:
+                self._emit("warning", "No deploy journal found, starting a fresh deploy")
+            else:
+                self._emit("note", f"Resuming previous deploy: {journal.summary}")
+        elif journal is not None and journal.instance_hash is not None:
+            self._emit("note", "A previous deploy was interrupted, use --resume to continue it")
+            journal = None
+        else:
+            journal = None
+        return journal or DeployJournal.start(self.path, address)
+
+    async def run(self) -> DeployResult:
+        result = DeployResult(address="", steps=self.steps)
+        private_key = self._setup_wallet(result)
+        address = result.address
+        journal = self._open_journal(address)
+
+        # Existing Aleph resources
+        account = get_aleph_account(private_key)
+        crn = DEFAULT_CRN
+        resources = await self._step(
+            "Checking for existing Aleph resources",
+            lambda: check_existing_resources(account),
+        )
+        forgets: list[MessageHandle] = []
+        # A warm instance claimed by a previous deploy is owned by the pool wallet
+        previous = self.pool.claimed_by(self.path) if self.pool is not None else None
+        if previous is not None and previous.instance_hash == journal.instance_hash:
+            self._emit("note", f"Reusing warm instance {journal.instance_hash}")
+            previous = None
+        elif journal.instance_hash is not None:
+            instance_hash = journal.instance_hash
+            # A crash can leave the instance message pending, it isn't listed yet
+            if instance_hash in resources.instance_hashes or await self._step(
+                "Checking the journaled instance",
+                lambda: is_message_live(instance_hash),
+            ):
+                self._emit("note", f"Reusing instance {journal.instance_hash}")
+                resources = ExistingResources(
+                    instance_hashes=[
+                        h for h in resources.instance_hashes if h != journal.instance_hash
+                    ]
+                )
+            else:
+                self._emit("warning", "Journaled instance no longer exists, creating a new one")
+                journal.invalidate_instance()
+        if previous is not None:
+            assert previous.instance_hash is not None
+            resources.instance_hashes.append(previous.instance_hash)
+        if resources.has_any:
+            self._emit("warning", f"Found existing resources: {resources.summary}")
+            if self.confirm_delete is not None and not await self.confirm_delete(resources):
+                raise DeployError(
+                    "Deleting existing resources",
+                    "Cannot proceed with existing resources. Use a different wallet.",
+                )
+            # Nothing waits for the forgets to be processed, the new instance doesn't depend on them
+            forgets = await self._step(
+                "Deleting existing resources",
+                lambda: self._delete_resources(account, resources, previous),
+            )
+
+        ssh_pubkey = await self._step(
+            "Reading the SSH public key", lambda: asyncio.to_thread(self._read_ssh_pubkey)
+        )
+        if not ssh_pubkey and journal.instance_hash is None:
+            raise DeployError(
+                "Resolving SSH public key",
+                "No SSH public key found. Use --ssh-key or generate one (e.g. ssh-keygen)",
+            )
+
+        if self.compose_file is not None:
+            compose_file = self.compose_file
+            self.services = await self._step(
+                f"Reading {compose_file.name}",
+                lambda: asyncio.to_thread(load_services, compose_file),
+            )
+        sizing = result.sizing = size_instance(
+            self.services, vcpus=self.vcpus, memory=self.memory
+        )
+        claimed = None
+        if self.pool is not None and journal.instance_hash is None and self.replicas == 1:
+            assert ssh_pubkey is not None
+            claimed = await self._claim(journal, ssh_pubkey, sizing)
+
+        if claimed is None:
+            await self._buy_credits(journal, address, private_key)
+            if self.replicas > 1:
+                self._emit("section", f"Creating {self.replicas} Aleph Cloud instances...")
+            else:
+                self._emit("section", "Creating Aleph Cloud instance...")
+
+            if journal.instance_hash is None:
+                self._emit("note", f"Instance size: {sizing.vcpus} vCPU, {sizing.memory} MiB")
+                for line in sizing.rationale:
+                    self._emit("note", f"  {line}")
+
+        if self.replicas > 1:
+            assert ssh_pubkey is not None
+            result.replicas = await self._deploy_replicas(account, ssh_pubkey, sizing)
+            journal.clear()
+            # Replicas land on several CRNs, the state file is how later commands find them
+            endpoints = [
+                ReplicaEndpoint(
+                    instance_hash=replica.instance_hash,
+                    instance_ip=replica.instance_ip,
+                    crn_url=replica.crn.url,
+                    crn_hash=replica.crn.hash,
+                )
+                for replica in result.replicas
+                if replica.ok and replica.instance_hash and replica.instance_ip
+            ]
+            if endpoints:
+                AgentState.record(
+                    self.path,
+                    "running",
+                    endpoints[0].instance_hash,
+                    endpoints[0].instance_ip,
+                    replicas=endpoints,
+                )
+            else:
+                AgentState.clear(self.path)
+            await self._report_forgets(forgets)
+            return result
+
+        instance_msg: MessageHandle | None = None
+        if journal.instance_hash is not None:
+            instance_hash = journal.instance_hash
+        else:
+            instance_msg = await self._step(
+                "Creating Aleph instance",
+                lambda: create_instance(
+                    account,
+                    crn,
+                    vcpus=sizing.vcpus,
+                    memory=sizing.memory,
+                    ssh_pubkey=ssh_pubkey,
+                    refresh_metadata=self.refresh_metadata,
+                ),
+            )
+            instance_hash = instance_msg.item_hash
+            journal.record(instance_hash=instance_hash)
+        result.instance_hash = instance_hash
+        self._emit("note", f"Instance: {instance_hash}")
+
+        if not journal.allocation_notified:
+            if instance_msg is not None and not instance_msg.done:
+                # The CRN only accepts instances the network has processed
+                await self._step(
+                    "Waiting for the network to process the instance", instance_msg.confirmed
+                )
+            await self._step(
+                "Notifying CRN for allocation",
+                lambda: notify_allocation(crn, instance_hash),
+            )
+            journal.record(allocation_notified=True)
+
+        # The IP and SSH waits share one budget instead of stacking timeouts
+        boot_deadline = Deadline(INSTANCE_BOOT_TIMEOUT)
+        live_ip = ""
+        if journal.instance_ip is not None:
+            live_ip = await self._step(
+                "Checking instance IP",
+                lambda: fetch_instance_ip(crn, instance_hash),
+            )
+        if live_ip and live_ip == journal.instance_ip:
+            instance_ip = live_ip
+        else:
+            instance_ip = await self._step(
+                "Waiting for instance to come up",
+                lambda: wait_for_instance(crn, instance_hash, boot_deadline),
+            )
+            if journal.instance_ip is not None:
+                journal.invalidate_host()
+            journal.record(instance_ip=instance_ip)
+        result.instance_ip = instance_ip
+        self._emit("note", f"Instance IP: {instance_ip}")
+
+        if self.register_only:
+            result.registered_only = True
+            await self._report_forgets(forgets)
+            return result
+
+        # Agent code, over SSH
+        self._emit("section", "Deploying agent code...")
+        client = await self._step(
+            "Waiting for SSH",
+            lambda: AsyncSSHClient.open(
+                wait_for_ssh, instance_ip, self.ssh_pubkey_path, deadline=boot_deadline
+            ),
+        )
+        async with client:
+            await self._deploy_code(client, journal)
+        journal.clear()
+        AgentState.record(self.path, "running", instance_hash, instance_ip, replicas=[])
+        await self._report_forgets(forgets)
+        return result
+
+    async def _delete_resources(
+        self,
+        account: ETHAccount,
+        resources: ExistingResources,
+        previous: "PoolInstance | None",
+    ) -> list[MessageHandle]:
+        if previous is not None:
+            assert self.pool is not None
+            await self.pool.release(self.path, confirm=False)
+            resources = ExistingResources(
+                instance_hashes=[
+                    h for h in resources.instance_hashes if h != previous.instance_hash
+                ]
+            )
+        return await delete_existing_resources(account, resources)
+
+    def _read_ssh_pubkey(self) -> str | None:
+        if self.ssh_pubkey_path is not None:
+            return self.ssh_pubkey_path.expanduser().read_text().strip()
+        return get_user_ssh_pubkey()
+
+    async def _report_forgets(self, forgets: list[MessageHandle]) -> None:
+        """Warn about the forgets already known to have failed, without waiting for the others."""
+        for handle in forgets:
+            if not handle.done:
+                continue
+            try:
+                await handle.confirmed()
+            except Exception as e:
+                self._emit(
+                    "warning",
+                    f"Deleting {handle.item_hash} failed ({e}), "
+                    "it will be retried on the next deploy",
+                )
+
+    async def _buy_credits(self, journal: DeployJournal, address: str, private_key: str) -> None:
+        """Make sure the wallet holds the credits paying for the instance."""
+        # USDC balance
+        credits_done = journal.credits_purchased or journal.instance_hash is not None
+        if credits_done:
+            self._emit("note", "Credits already purchased, skipping USDC check")
+        else:
+            usdc_balance = await self._step(
+                "Checking the USDC balance",
+                lambda: asyncio.to_thread(get_usdc_balance, address),
+            )
+            if usdc_balance < MIN_USDC_FUNDING:
+                self._emit("section", "Fund your agent wallet")
+                self._emit("funding_required", address)
+                usdc_balance = await self._step(
+                    "Waiting for USDC",
+                    lambda: asyncio.to_thread(wait_for_usdc_funding, address, MIN_USDC_FUNDING),
+                )
+                self._emit("info", f"Received {usdc_balance:.2f} USDC")
+            else:
+                self._emit("note", f"USDC balance: {usdc_balance:.2f} — sufficient")
+
+        # Aleph credits
+        self._emit("section", "Aleph credits...")
+        if credits_done:
+            self._emit("note", "Credits already purchased for this deploy, skipping purchase")
+        else:
+            try:
+                balance_usd = await get_credit_balance(address)
+                self._emit("note", f"Current balance: ${balance_usd:.2f}")
+            except Exception:
+                balance_usd = 0.0
+                self._emit("note", "Could not fetch credit balance, will purchase")
+            if balance_usd < self.credits_amount:
+                payment_client = create_payment_client(private_key)
+                purchase = await self._step(
+                    f"Buying ${self.credits_amount:.2f} of Aleph credits",
+                    lambda: buy_credits(payment_client, address, self.credits_amount),
+                )
+                journal.record(credits_purchased=True)
+                self._emit("note", f"Credits purchased: {purchase}")
+            else:
+                self._emit("note", f"Balance ${balance_usd:.2f} — sufficient, skipping purchase")
+
+    async def _claim(
+        self, journal: DeployJournal, ssh_pubkey: str, sizing: Sizing
+    ) -> "PoolInstance | None":
+        """Take over a warm pool instance, recorded in the journal as already provisioned."""
+        pool = self.pool
+        assert pool is not None
+        while (
+            instance := pool.claim(self.path, ssh_pubkey, sizing.vcpus, sizing.memory)
+        ) is not None:
+            self._emit("section", "Claiming a warm instance...")
+            if await self._step("Checking the warm instance", lambda: pool.check(instance)):
+                self._emit(
+                    "note", f"Instance size: {instance.vcpus} vCPU, {instance.memory} MiB"
+                )
+                journal.record(
+                    credits_purchased=True,
+                    instance_hash=instance.instance_hash,
+                    allocation_notified=True,
+                    instance_ip=instance.instance_ip,
+                    docker_installed=True,
+                )
+                return instance
+            self._emit("warning", "The warm instance is gone, trying another one")
+        if pool.instances()[1]:
+            self._emit("note", "No warm instance fits this agent, creating one")
+        return None
+
+    async def _deploy_code(self, client: AsyncSSHClient, journal: DeployJournal) -> None:
+        # Docker and the pulled images don't depend on the code, they get ready
+        # on their own channels while the code uploads and extracts
+        assert self.compose_file is not None
+        images = pullable_images(self.services)
+        if journal.docker_installed and not await client.call(is_docker_installed):
+            journal.record(docker_installed=False)
+        docker_label = "Installing Docker" if not journal.docker_installed else ""
+        if images:
+            pulling = f"pulling {len(images)} image{'s' if len(images) > 1 else ''}"
+            docker_label = f"{docker_label} and {pulling}" if docker_label else pulling.capitalize()
+        docker_ready = asyncio.create_task(_prepare_docker(client, journal, images))
+        try:
+            manifest = await asyncio.to_thread(agent_manifest, self.path)
+            digest = manifest_digest(manifest)
+            if journal.code_uploaded and journal.code_digest != digest:
+                self._emit("note", "Agent code changed since the last attempt, uploading it again")
+                journal.record(code_uploaded=False)
+            if journal.code_uploaded and not await client.call(is_code_deployed):
+                journal.record(code_uploaded=False)
+            if journal.code_uploaded:
+                self._emit("note", "Agent code already deployed, skipping upload")
+            else:
+                await self._transfer_step(
+                    "Uploading agent code",
+                    lambda on_progress: client.call(upload_agent, self.path, on_progress),
+                )
+                await self._step(
+                    "Deploying agent code",
+                    lambda: client.call(deploy_code),
+                )
+                journal.record(code_uploaded=True, code_digest=digest)
+
+            restart_plan: RestartPlan | None = None
+            previous_manifest = (
+                None if self.full_rebuild else await client.call(read_remote_manifest)
+            )
+            if previous_manifest is not None:
+                restart_plan = plan_restart(
+                    self.compose_file.name,
+                    self.services,
+                    diff_manifests(previous_manifest, manifest),
+                )
+
+            if docker_label:
+                pull_error = await self._step(docker_label, lambda: docker_ready)
+            else:
+                self._emit("note", "Docker already installed, skipping")
+                pull_error = await docker_ready
+            if pull_error is not None:
+                self._emit(
+                    "warning", f"Pre-pulling images failed, compose will retry: {pull_error}"
+                )
+        finally:
+            docker_ready.cancel()
+
+        if restart_plan is not None and not restart_plan.everything:
+            if restart_plan.is_empty:
+                self._emit("note", "No service files changed, keeping the running containers")
+            else:
+                self._emit(
+                    "note",
+                    f"Rebuilding {restart_plan.summary}, unchanged services keep running",
+                )
+        await self._step(
+            "Starting agent",
+            lambda: client.call(start_agent, restart_plan),
+        )
+        is_active = await self._step(
+            "Verifying agent is running",
+            lambda: client.call(verify_service),
+        )
+        if not is_active:
+            raise DeployError(
+                "Verifying agent is running",
+                "RuntimeError: libertai-agentkit service failed to start",
+            )
+        # A resume after a failure here starts the agent again and writes it
+        await self._step(
+            "Recording the deployed code",
+            lambda: client.call(write_remote_manifest, manifest),
+        )
+
+    async def _deploy_replicas(
+        self, account: ETHAccount, ssh_pubkey: str, sizing: Sizing
+    ) -> list[Replica]:
+        count = self.replicas
+        candidates = await self._step(
+            "Fetching the CRN list",
+            lambda: fetch_crns(refresh=self.refresh_metadata),
+        )
+        crns = pick_crns(candidates)
+        if len(crns) < count:
+            raise DeployError(
+                "Picking CRNs",
+                f"ValueError: Only {len(crns)} suitable CRNs available for {count} replicas",
+            )
+        images = pullable_images(self.services)
+
+        # Rows are updated in place as the replicas progress concurrently
+        rows = [Replica(slot=slot, crn=crn) for slot, crn in enumerate(crns[:count])]
+        self._emit("replicas", replicas=list(rows))
+
+        def on_update(replica: Replica) -> None:
+            rows[replica.slot] = replica
+            self._emit("replicas", replicas=list(rows))
+
+        started_at = time.monotonic()
+        results = await deploy_replicas(
+            account,
+            self.path,
+            count,
+            crns,
+            ssh_pubkey,
+            self.ssh_pubkey_path,
+            on_update=on_update,
+            vcpus=sizing.vcpus,
+            memory=sizing.memory,
+            refresh_metadata=self.refresh_metadata,
+            images=images,
+        )
+        self.steps.append((f"Deploying {count} replicas", time.monotonic() - started_at))
+        self._emit("replicas", replicas=results)
+        return results
+
+
+async def _prepare_docker(
+    client: AsyncSSHClient, journal: DeployJournal, images: list[str]
+) -> str | None:
+    """Install Docker if needed then pull the images, returns why the pull failed if it did."""
+    if not journal.docker_installed:
+        await client.call(install_docker)
+        journal.record(docker_installed=True)
+    try:
+        await client.call(pull_images, images)
+    except Exception as e:
+        # Not fatal, compose pulls whatever is missing when it starts
+        return str(e).splitlines()[0]
+    return None
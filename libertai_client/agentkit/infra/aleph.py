@@ -1,20 +1,20 @@
 import asyncio
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 from ipaddress import IPv6Interface
 from pathlib import Path
 from typing import Any
 
-from aiohttp import ClientSession
+from aiohttp import ClientError, ClientSession
 from aleph.sdk.chains.ethereum import ETHAccount
 from aleph.sdk.client.authenticated_http import (
     AlephHttpClient,
     AuthenticatedAlephHttpClient,
 )
 from aleph.sdk.conf import settings
-from aleph.sdk.query.filters import MessageFilter
 from aleph_message.models import (
+    AlephMessage,
     Chain,
-    InstanceMessage,
     ItemHash,
     MessageType,
     Payment,
@@ -26,19 +26,32 @@ from aleph_message.models.execution.environment import (
     HypervisorType,
     NodeRequirements,
 )
+from aleph_message.status import MessageStatus
 
-from libertai_client.agentkit.chain.constants import (
-    ALEPH_API_URLS,
-    ALEPH_CREDITS_DECIMALS,
-    LIBERTAI_API_BASE,
-)
+from libertai_client.agentkit.chain.constants import ALEPH_CREDITS_DECIMALS
+from libertai_client.config import config
+from libertai_client.utils.cache import metadata_cache
+from libertai_client.utils.http import http_sessions
+from libertai_client.utils.poll import Backoff, Deadline, poll
 
-ALEPH_API_URL = ALEPH_API_URLS[0]
+ALEPH_API_URL = config.ALEPH_API_URLS[0]
 ALEPH_CHANNEL = "libertai-agentkit"
+MESSAGES_PAGE_SIZE = 200
+INACTIVE_MESSAGE_STATUSES = {"forgotten", "removing", "removed", "rejected"}
+# Rootfs images are immutable STORE messages, their size only changes with a new image
+ROOTFS_METADATA_TTL = 7 * 24 * 3600
 
 PATH_EXECUTIONS_LIST = "/about/executions/list"
 PATH_INSTANCE_NOTIFY = "/control/allocation/notify"
 
+ALLOCATION_TIMEOUT = 30
+# How long a submitted message may stay pending before its confirmation fails
+MESSAGE_CONFIRMATION_TIMEOUT = 300
+# Forgets posted at once when cleaning up many instances
+FORGET_CONCURRENCY = 16
+# Budget shared by the IP and SSH waits of a new instance
+INSTANCE_BOOT_TIMEOUT = 600
+
 
 @dataclass
 class CRNInfo:
@@ -48,12 +61,64 @@ class CRNInfo:
 
 
 DEFAULT_CRN = CRNInfo(
-    url="https://crn10.leviathan.so",
+    url=config.CRN_URL,
     hash="dc3d1d194a990b5c54380c3c0439562fefa42f5a46807cba1c500ec3affecf04",
     receiver_address="0xf0c0ddf11a0dCE6618B5DF8d9fAE3D95e72E04a9",
 )
 
 
+# Scores and availability move slowly, a few minutes of staleness is harmless
+CRN_LIST_TTL = 10 * 60
+
+
+async def fetch_crns(refresh: bool = False) -> list[CRNInfo]:
+    """Active CRNs able to host an instance paid in credits, best scored first."""
+
+    async def fetch() -> list[dict[str, str]]:
+        async with http_sessions.session() as session:
+            async with session.get(
+                config.CRN_LIST_URL, params={"filter_inactive": "true"}
+            ) as resp:
+                resp.raise_for_status()
+                data = await resp.json(content_type=None)
+        crns = []
+        for crn in sorted(
+            data.get("crns", []), key=lambda c: c.get("score") or 0, reverse=True
+        ):
+            receiver = crn.get("payment_receiver_address") or crn.get("stream_reward")
+            ipv6_check = crn.get("ipv6_check") or {}
+            if not (crn.get("qemu_support") and ipv6_check.get("vm")):
+                continue
+            if not (crn.get("address") and receiver):
+                continue
+            crns.append(
+                {
+                    "url": crn["address"].rstrip("/"),
+                    "hash": crn["hash"],
+                    "receiver_address": receiver,
+                }
+            )
+        return crns
+
+    entries = await metadata_cache.get_or_fetch(
+        f"crn-list:{config.CRN_LIST_URL}", CRN_LIST_TTL, fetch, refresh=refresh
+    )
+    return [CRNInfo(**entry) for entry in entries]
+
+
+def pick_crns(candidates: list[CRNInfo], exclude: set[str] | None = None) -> list[CRNInfo]:
+    """Distinct CRNs in order of preference, starting with DEFAULT_CRN."""
+    exclude = exclude or set()
+    picked: list[CRNInfo] = []
+    seen: set[str] = set()
+    for crn in [DEFAULT_CRN, *candidates]:
+        if crn.hash in seen or crn.hash in exclude:
+            continue
+        seen.add(crn.hash)
+        picked.append(crn)
+    return picked
+
+
 def get_aleph_account(private_key: str) -> ETHAccount:
     key_bytes = bytes.fromhex(private_key.removeprefix("0x"))
     return ETHAccount(key_bytes, chain=Chain.BASE)
@@ -84,32 +149,201 @@ class ExistingResources:
         return "none"
 
 
-async def check_existing_resources(account: ETHAccount) -> ExistingResources:
-    async with AlephHttpClient(api_server=ALEPH_API_URL) as client:
-        msgs = await client.get_messages(
-            message_filter=MessageFilter(
-                message_types=[MessageType.instance],
-                addresses=[account.get_address()],
-                channels=[ALEPH_CHANNEL],
-            )
-        )
-        instance_hashes = [m.item_hash for m in msgs.messages]
+async def iter_message_hashes(
+    session: ClientSession,
+    address: str,
+    message_type: MessageType = MessageType.instance,
+    channel: str = ALEPH_CHANNEL,
+    page_size: int = MESSAGES_PAGE_SIZE,
+) -> AsyncIterator[str]:
+    """Yield the hashes of the live messages of an address, one page at a time.
+
+    The messages API can't select fields, so pages are read as raw JSON and only
+    the item hash is kept instead of validating every message into a model.
+    Stops after the last page, or as soon as the caller stops iterating.
+    """
+    params = {
+        "msgTypes": message_type.value,
+        "addresses": address,
+        "channels": channel,
+        "msgStatuses": "processed",
+        "pagination": str(page_size),
+    }
+    page = 1
+    while True:
+        async with session.get(
+            f"{ALEPH_API_URL}/api/v0/messages.json",
+            params={**params, "page": str(page)},
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+        messages = data.get("messages") or []
+        for message in messages:
+            # Older API nodes ignore the status filter
+            if message.get("status", "processed") in INACTIVE_MESSAGE_STATUSES:
+                continue
+            if message.get("forgotten_by"):
+                continue
+            yield message["item_hash"]
+        if len(messages) < page_size or page * page_size >= data.get(
+            "pagination_total", 0
+        ):
+            return
+        page += 1
+
+
+async def check_existing_resources(
+    account: ETHAccount, session: ClientSession | None = None
+) -> ExistingResources:
+    if session is None:
+        async with http_sessions.session() as own_session:
+            return await check_existing_resources(account, own_session)
+    instance_hashes = [
+        h async for h in iter_message_hashes(session, account.get_address())
+    ]
     return ExistingResources(instance_hashes=instance_hashes)
 
 
+class MessageRejectedError(RuntimeError):
+    pass
+
+
+async def fetch_message_status(session: ClientSession, item_hash: str) -> str | None:
+    """Processing status of a message, None while the API node doesn't know it yet."""
+    async with session.get(f"{ALEPH_API_URL}/api/v0/messages/{item_hash}/status") as resp:
+        if resp.status == 404:
+            return None
+        resp.raise_for_status()
+        data = await resp.json()
+    return data.get("status")
+
+
+async def wait_for_message(item_hash: str, deadline: Deadline | None = None) -> str:
+    """Poll the status of a message until the network processed or rejected it."""
+    async with http_sessions.session() as session:
+
+        async def check() -> str | None:
+            status = await fetch_message_status(session, item_hash)
+            if status == "rejected":
+                raise MessageRejectedError(f"Message {item_hash} was rejected")
+            # A message forgotten since was processed first
+            return None if status in (None, "pending") else status
+
+        return await poll(
+            check,
+            f"Confirmation of message {item_hash}",
+            deadline or Deadline(MESSAGE_CONFIRMATION_TIMEOUT),
+            Backoff(initial=0.5, factor=1.5, maximum=5.0),
+            retry_on=(ClientError,),
+        )
+
+
+async def is_message_live(item_hash: str, deadline: Deadline | None = None) -> bool:
+    """Whether a message the network may still be processing ends up processed.
+
+    Pending messages are missing from the processed ones `iter_message_hashes`
+    lists, this waits for them rather than taking them for gone.
+    """
+    async with http_sessions.session() as session:
+        status = await fetch_message_status(session, item_hash)
+    if status == "processed":
+        return True
+    if status in INACTIVE_MESSAGE_STATUSES:
+        return False
+    try:
+        status = await wait_for_message(item_hash, deadline)
+    except MessageRejectedError:
+        return False
+    return status not in INACTIVE_MESSAGE_STATUSES
+
+
+class MessageHandle:
+    """A message signed and posted without waiting for the network to process it.
+
+    Its confirmation is polled by a background task started with the handle, so
+    only the steps depending on the message await `confirmed()`. A rejection
+    that nobody awaits is dropped, like with a message posted without `sync`.
+    """
+
+    def __init__(self, message: AlephMessage, status: MessageStatus) -> None:
+        self.message = message
+        self.item_hash = str(message.item_hash)
+        self._confirmation: asyncio.Future[str]
+        if status == MessageStatus.PROCESSED:
+            self._confirmation = asyncio.get_running_loop().create_future()
+            self._confirmation.set_result("processed")
+        else:
+            self._confirmation = asyncio.create_task(wait_for_message(self.item_hash))
+            self._confirmation.add_done_callback(_retrieve_exception)
+
+    @property
+    def done(self) -> bool:
+        return self._confirmation.done()
+
+    async def confirmed(self) -> str:
+        """Wait for the network to process the message, raises if it gets rejected.
+
+        Several steps can await the same handle, cancelling one of them leaves
+        the polling running for the others.
+        """
+        return await asyncio.shield(self._confirmation)
+
+
+def _retrieve_exception(future: "asyncio.Future[str]") -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+async def confirm_all(handles: list[MessageHandle]) -> None:
+    """Wait for every message to be processed, raising the first rejection."""
+    await asyncio.gather(*(handle.confirmed() for handle in handles))
+
+
 async def delete_existing_resources(
     account: ETHAccount, resources: ExistingResources
-) -> None:
-    if resources.instance_hashes:
-        async with AuthenticatedAlephHttpClient(
-            account=account, api_server=ALEPH_API_URL
-        ) as client:
-            for h in resources.instance_hashes:
-                await client.forget(
-                    hashes=[h],
+) -> list[MessageHandle]:
+    """Post a forget per instance, concurrently, without waiting for them to be processed."""
+    if not resources.instance_hashes:
+        return []
+    semaphore = asyncio.Semaphore(FORGET_CONCURRENCY)
+    async with AuthenticatedAlephHttpClient(
+        account=account, api_server=ALEPH_API_URL
+    ) as client:
+
+        async def forget(item_hash: str) -> MessageHandle:
+            async with semaphore:
+                message, status = await client.forget(
+                    hashes=[ItemHash(item_hash)],
                     reason="Cleanup before redeployment",
                     channel=ALEPH_CHANNEL,
+                    sync=False,
                 )
+            return MessageHandle(message, status)
+
+        return list(
+            await asyncio.gather(*(forget(h) for h in resources.instance_hashes))
+        )
+
+
+async def get_rootfs_size(
+    client: AlephHttpClient, rootfs: str, refresh: bool = False
+) -> int:
+    """Size of a rootfs volume, read from its STORE message and cached on disk."""
+
+    async def fetch() -> int:
+        rootfs_message: StoreMessage = await client.get_message(
+            item_hash=rootfs, message_type=StoreMessage
+        )
+        if rootfs_message.content.size is not None:
+            return rootfs_message.content.size
+        return settings.DEFAULT_ROOTFS_SIZE
+
+    return await metadata_cache.get_or_fetch(
+        f"aleph:{ALEPH_API_URL}:rootfs-size:{rootfs}",
+        ROOTFS_METADATA_TTL,
+        fetch,
+        refresh=refresh,
+    )
 
 
 async def create_instance(
@@ -118,21 +352,16 @@ async def create_instance(
     vcpus: int = 2,
     memory: int = 4096,
     ssh_pubkey: str | None = None,
-) -> InstanceMessage:
+    refresh_metadata: bool = False,
+) -> MessageHandle:
+    """Post the instance message, `confirmed()` tells when the CRN can be notified."""
     async with AuthenticatedAlephHttpClient(
         account=account, api_server=ALEPH_API_URL
     ) as client:
         rootfs = settings.DEBIAN_12_QEMU_ROOTFS_ID
-        rootfs_message: StoreMessage = await client.get_message(
-            item_hash=rootfs, message_type=StoreMessage
-        )
-        rootfs_size = (
-            rootfs_message.content.size
-            if rootfs_message.content.size is not None
-            else settings.DEFAULT_ROOTFS_SIZE
-        )
+        rootfs_size = await get_rootfs_size(client, rootfs, refresh=refresh_metadata)
         ssh_keys = [ssh_pubkey] if ssh_pubkey else []
-        instance_message, _status = await client.create_instance(
+        instance_message, status = await client.create_instance(
             rootfs=rootfs,
             rootfs_size=rootfs_size,
             hypervisor=HypervisorType.qemu,
@@ -150,31 +379,39 @@ async def create_instance(
             metadata={"name": "libertai-agentkit"},
             vcpus=vcpus,
             memory=memory,
-            sync=True,
         )
-        return instance_message
+        return MessageHandle(instance_message, status)
+
+
+class AllocationError(ValueError):
+    pass
 
 
 async def notify_allocation(
-    crn: CRNInfo, instance_hash: str, max_retries: int = 5, retry_delay: int = 3
+    crn: CRNInfo, instance_hash: str, deadline: Deadline | None = None
 ) -> None:
-    for attempt in range(max_retries):
-        async with ClientSession() as session:
+    async with http_sessions.session() as session:
+
+        async def attempt() -> bool:
             async with session.post(
                 f"{crn.url}{PATH_INSTANCE_NOTIFY}",
                 json={"instance": instance_hash},
             ) as resp:
                 if resp.ok:
-                    return
-                error = await resp.text()
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
-                    continue
-                raise ValueError(f"Allocation failed: {error}")
+                    return True
+                raise AllocationError(f"Allocation failed: {await resp.text()}")
+
+        await poll(
+            attempt,
+            "CRN allocation",
+            deadline or Deadline(ALLOCATION_TIMEOUT),
+            Backoff(initial=1.0, maximum=5.0),
+            retry_on=(AllocationError, ClientError),
+        )
 
 
 async def fetch_instance_ip(crn: CRNInfo, instance_hash: str) -> str:
-    async with ClientSession() as session:
+    async with http_sessions.session() as session:
         async with session.get(f"{crn.url}{PATH_EXECUTIONS_LIST}") as resp:
             resp.raise_for_status()
             executions = await resp.json()
@@ -194,25 +431,34 @@ async def fetch_instance_ip(crn: CRNInfo, instance_hash: str) -> str:
             return str(interface.ip + 1)
 
 
+async def find_instance_ip(account: ETHAccount, crn: CRNInfo) -> str:
+    """IP of the wallet's agent instance running on the CRN."""
+    async with http_sessions.session() as session:
+        async for instance_hash in iter_message_hashes(session, account.get_address()):
+            ip = await fetch_instance_ip(crn, instance_hash)
+            if ip:
+                return ip
+    raise ValueError(f"No running instance found for {account.get_address()}")
+
+
 async def wait_for_instance(
-    crn: CRNInfo, instance_hash: str, max_attempts: int = 30, interval: int = 10
+    crn: CRNInfo, instance_hash: str, deadline: Deadline | None = None
 ) -> str:
-    for attempt in range(max_attempts):
-        ip = await fetch_instance_ip(crn, instance_hash)
-        if ip:
-            return ip
-        if attempt < max_attempts - 1:
-            await asyncio.sleep(interval)
-    raise TimeoutError(
-        f"Instance {instance_hash} did not get an IP after {max_attempts} attempts"
+    return await poll(
+        lambda: fetch_instance_ip(crn, instance_hash),
+        f"Instance {instance_hash} getting an IP",
+        deadline or Deadline(INSTANCE_BOOT_TIMEOUT),
+        # Fast first checks, a freshly allocated instance is often up within seconds
+        Backoff(initial=0.5, factor=1.5, maximum=10.0),
+        retry_on=(ClientError, TimeoutError),
     )
 
 
 async def get_credit_balance(address: str) -> float:
     """Fetch credit balance in USD from Aleph API."""
-    for base_url in ALEPH_API_URLS:
+    for base_url in config.ALEPH_API_URLS:
         try:
-            async with ClientSession() as session:
+            async with http_sessions.session() as session:
                 async with session.get(
                     f"{base_url}/api/v0/addresses/{address}/balance"
                 ) as resp:
@@ -230,7 +476,7 @@ async def buy_credits(
 ) -> dict:
     """Buy Aleph credits via x402 payment. payment_client is an httpx.AsyncClient from libertai_x402."""
     resp = await payment_client.post(
-        f"{LIBERTAI_API_BASE}/libertai/aleph-credits",
+        f"{config.LIBERTAI_API_BASE}/libertai/aleph-credits",
         json={"address": address, "amount": amount},
         timeout=60.0,
     )
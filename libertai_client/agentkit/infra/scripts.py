@@ -16,3 +16,18 @@ set -euo pipefail
 cd /opt/libertai-agentkit
 docker compose up -d --build
 """
+
+
+def start_services_script(commands: list[str]) -> str:
+    """Variant of START_AGENT_SCRIPT rebuilding only some services.
+
+    The final `up -d` starts anything still missing without rebuilding or
+    recreating services whose images and configuration didn't change.
+    """
+    lines = "\n".join(commands)
+    return f"""#!/bin/bash
+set -euo pipefail
+cd /opt/libertai-agentkit
+{lines}
+docker compose up -d
+"""
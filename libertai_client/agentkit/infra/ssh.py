@@ -1,20 +1,43 @@
+import hashlib
+import json
 import os
+import posixpath
+import re
+import shlex
+import socket
 import tarfile
 import tempfile
-import time
+import threading
+from collections.abc import Callable, Iterable, Iterator
 from pathlib import Path
+from typing import Any
 
 import paramiko
 from pathspec import PathSpec
 
+from libertai_client.agentkit.compose import RestartPlan
 from libertai_client.agentkit.infra.scripts import (
     DEPLOY_CODE_SCRIPT,
     INSTALL_DOCKER_SCRIPT,
     START_AGENT_SCRIPT,
+    start_services_script,
+)
+from libertai_client.config import config
+from libertai_client.utils.artifacts import artifact_cache, manifest_key, write_tar_gz
+from libertai_client.utils.poll import Backoff, Deadline, poll_blocking
+from libertai_client.utils.sftp import (
+    SFTP_MAX_PACKET_SIZE,
+    TransferProgress,
+    put_file,
 )
 
-AGENT_ZIP_BLACKLIST = [".git/**", ".idea/**", ".vscode/**", "__pycache__/**", ".venv/**", "node_modules/**"]
+AGENT_ZIP_BLACKLIST = [".git/**", ".idea/**", ".vscode/**", "__pycache__/**", ".venv/**", "node_modules/**", ".libertai/**"]
 AGENT_ZIP_WHITELIST = [".env", ".env.prod"]
+AGENT_REMOTE_DIR = "/opt/libertai-agentkit"
+# Kept outside AGENT_REMOTE_DIR, which is wiped on every deploy
+AGENT_MANIFEST_PATH = "/var/lib/libertai-agentkit/manifest.json"
+# docker stats clears the screen before each refresh, even when not on a terminal
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
 
 
 def _resolve_private_key(ssh_pubkey_path: Path) -> str:
@@ -45,67 +68,163 @@ def _run_script(client: paramiko.SSHClient, script: str, label: str) -> None:
         raise RuntimeError(f"{label} failed (exit {exit_status}):\n{err}")
 
 
+def tcp_probe(host: str, port: int, timeout: float) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
 def wait_for_ssh(
-    host: str, ssh_pubkey_path: Path | None = None, timeout: int = 300
+    host: str,
+    ssh_pubkey_path: Path | None = None,
+    timeout: float = 300,
+    deadline: Deadline | None = None,
+    cancelled: threading.Event | None = None,
 ) -> paramiko.SSHClient:
     import logging
 
-    logging.getLogger("paramiko.transport").setLevel(logging.CRITICAL)
     if ssh_pubkey_path is not None:
         key_path = _resolve_private_key(ssh_pubkey_path)
     else:
         key_path = _auto_detect_ssh_key()
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    deadline = time.time() + timeout
-    last_error: Exception | None = None
-    while time.time() < deadline:
-        remaining = deadline - time.time()
-        if remaining <= 0:
-            break
-        per_attempt = min(30.0, remaining)
+    deadline = deadline or Deadline(timeout)
+
+    def attempt() -> paramiko.SSHClient:
+        # A closed or filtered port fails here in milliseconds, without paying
+        # for a full key exchange on a host that is still booting
+        if not tcp_probe(host, config.SSH_PORT, deadline.cap(5.0) or 0.1):
+            raise ConnectionError(f"Port {config.SSH_PORT} is not reachable yet")
+        per_attempt = deadline.cap(30.0) or 1.0
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
             client.connect(
                 hostname=host,
+                port=config.SSH_PORT,
                 username="root",
                 key_filename=key_path,
                 timeout=per_attempt,
                 banner_timeout=per_attempt,
                 auth_timeout=per_attempt,
             )
-            logging.getLogger("paramiko.transport").setLevel(logging.WARNING)
-            return client
-        except Exception as e:
-            last_error = e
-            time.sleep(10)
-    logging.getLogger("paramiko.transport").setLevel(logging.WARNING)
-    raise TimeoutError(
-        f"SSH connection to {host} timed out after {timeout}s: {last_error}"
-    )
+        except BaseException:
+            client.close()
+            raise
+        return client
+
+    logging.getLogger("paramiko.transport").setLevel(logging.CRITICAL)
+    try:
+        return poll_blocking(
+            attempt,
+            f"SSH connection to {host}",
+            deadline,
+            Backoff(initial=0.5, maximum=5.0),
+            retry_on=(OSError, EOFError, paramiko.SSHException),
+            cancelled=cancelled,
+        )
+    finally:
+        logging.getLogger("paramiko.transport").setLevel(logging.WARNING)
 
 
-def upload_agent(client: paramiko.SSHClient, agent_path: Path) -> None:
+def agent_file_filter(agent_path: Path) -> Callable[[str], bool]:
+    """Predicate telling whether a path relative to the agent directory is shipped."""
     gitignore_path = agent_path / ".gitignore"
     if gitignore_path.exists():
         patterns = gitignore_path.read_text().splitlines()
     else:
         patterns = []
     spec = PathSpec.from_lines("gitwildmatch", patterns + AGENT_ZIP_BLACKLIST)
-    with tempfile.NamedTemporaryFile(suffix=".tar.gz", delete=False) as tmp:
-        tmp_path = tmp.name
-    try:
-        with tarfile.open(tmp_path, "w:gz") as tf:
-            for root, _, files in os.walk(agent_path):
-                for fname in files:
-                    full = os.path.join(root, fname)
-                    rel = os.path.relpath(full, agent_path)
-                    if not spec.match_file(rel) or rel in AGENT_ZIP_WHITELIST:
-                        tf.add(full, arcname=rel)
-        sftp = client.open_sftp()
-        sftp.put(tmp_path, "/tmp/libertai-agentkit.tar.gz")
-        sftp.close()
-    finally:
-        os.unlink(tmp_path)
+    return lambda rel: not spec.match_file(rel) or rel in AGENT_ZIP_WHITELIST
+
+
+def iter_agent_files(agent_path: Path) -> Iterator[str]:
+    """Relative paths of the files shipped with the agent."""
+    is_agent_file = agent_file_filter(agent_path)
+    for root, _, files in os.walk(agent_path):
+        for fname in files:
+            rel = os.path.relpath(os.path.join(root, fname), agent_path)
+            if is_agent_file(rel):
+                yield rel
+
+
+def pack_agent(agent_path: Path) -> Path:
+    """Archive of the shipped files, packed once per version of the tree."""
+    files = list(iter_agent_files(agent_path))
+    archive, _cached = artifact_cache.get_or_pack(
+        manifest_key(agent_path, files, "agentkit.tar.gz"),
+        ".tar.gz",
+        lambda f: write_tar_gz(agent_path, files, f),
+    )
+    return archive
+
+
+def upload_agent(
+    client: paramiko.SSHClient,
+    agent_path: Path,
+    on_progress: Callable[[TransferProgress], None] | None = None,
+) -> TransferProgress:
+    return put_file(
+        client,
+        str(pack_agent(agent_path)),
+        "/tmp/libertai-agentkit.tar.gz",
+        on_progress=on_progress,
+    )
+
+
+def push_files(client: paramiko.SSHClient, agent_path: Path, paths: Iterable[str]) -> int:
+    """Mirror some agent files into the deployed copy over a single exec channel.
+
+    Files that still exist locally are streamed as a tarball, paths gone
+    locally are removed remotely, whole directories included. Directories that
+    still exist are skipped, their files are listed on their own. Returns the
+    size of the tarball sent.
+    """
+    existing = []
+    deleted = []
+    for rel in sorted(set(paths)):
+        local = agent_path / rel
+        if local.is_file():
+            existing.append(rel)
+        elif not local.exists():
+            deleted.append(rel)
+
+    command = f"cd {AGENT_REMOTE_DIR}"
+    if existing:
+        command += " && tar xzf -"
+    if deleted:
+        command += " && rm -rf -- " + " ".join(shlex.quote(rel) for rel in deleted)
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as archive:
+        if existing:
+            with tarfile.open(fileobj=archive, mode="w:gz") as tf:
+                for rel in existing:
+                    tf.add(agent_path / rel, arcname=rel)
+        size = archive.tell()
+        archive.seek(0)
+
+        stdin, stdout, stderr = client.exec_command(command)
+        if existing:
+            while chunk := archive.read(SFTP_MAX_PACKET_SIZE):
+                stdin.channel.sendall(chunk)
+        stdin.channel.shutdown_write()
+        exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        err = stderr.read().decode()
+        raise RuntimeError(f"Syncing files failed (exit {exit_status}):\n{err}")
+    return size
+
+
+def restart_services(client: paramiko.SSHClient, plan: RestartPlan) -> None:
+    if plan.is_empty:
+        return
+    command = " && ".join([f"cd {AGENT_REMOTE_DIR}", *plan.commands()])
+    _stdin, stdout, stderr = client.exec_command(command)
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        err = stderr.read().decode()
+        raise RuntimeError(f"Restarting {plan.summary} failed (exit {exit_status}):\n{err}")
 
 
 def deploy_code(client: paramiko.SSHClient) -> None:
@@ -116,16 +235,184 @@ def install_docker(client: paramiko.SSHClient) -> None:
     _run_script(client, INSTALL_DOCKER_SCRIPT, "install-docker")
 
 
-def start_agent(client: paramiko.SSHClient) -> None:
-    _run_script(client, START_AGENT_SCRIPT, "start-agent")
+def pull_images(client: paramiko.SSHClient, images: list[str]) -> None:
+    """Pull images ahead of `docker compose up`, a few at a time."""
+    if not images:
+        return
+    quoted = " ".join(shlex.quote(image) for image in images)
+    _stdin, stdout, stderr = client.exec_command(
+        f"printf '%s\\n' {quoted} | xargs -n1 -P4 docker pull -q"
+    )
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        err = stderr.read().decode()
+        raise RuntimeError(f"Pulling images failed (exit {exit_status}):\n{err}")
+
+
+def start_agent(client: paramiko.SSHClient, plan: RestartPlan | None = None) -> None:
+    """Start the agent, rebuilding everything unless a plan narrows it down."""
+    if plan is None or plan.everything:
+        _run_script(client, START_AGENT_SCRIPT, "start-agent")
+    else:
+        _run_script(client, start_services_script(plan.commands()), "start-agent")
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def agent_manifest(agent_path: Path) -> dict[str, str]:
+    """sha256 of every shipped file, keyed by its path relative to the agent directory."""
+    return {
+        Path(rel).as_posix(): _file_digest(agent_path / rel)
+        for rel in iter_agent_files(agent_path)
+    }
+
+
+def manifest_digest(manifest: dict[str, str]) -> str:
+    """sha256 of a whole manifest, it changes with any shipped file."""
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+
+
+def update_manifest(manifest: dict[str, str], agent_path: Path, paths: Iterable[str]) -> None:
+    """Bring the entries of some synced paths up to date, like `push_files` did remotely."""
+    for rel in paths:
+        key = Path(rel).as_posix()
+        local = agent_path / rel
+        if local.is_file():
+            manifest[key] = _file_digest(local)
+        elif not local.exists():
+            manifest.pop(key, None)
+            for entry in [entry for entry in manifest if entry.startswith(f"{key}/")]:
+                del manifest[entry]
+
+
+def read_remote_manifest(client: paramiko.SSHClient) -> dict[str, str] | None:
+    """Manifest of the code the running containers were last built from, if any."""
+    _stdin, stdout, _stderr = client.exec_command(f"cat {AGENT_MANIFEST_PATH}")
+    output = stdout.read()
+    if stdout.channel.recv_exit_status() != 0:
+        return None
+    try:
+        manifest = json.loads(output)
+    except ValueError:
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def write_remote_manifest(client: paramiko.SSHClient, manifest: dict[str, str]) -> None:
+    directory = posixpath.dirname(AGENT_MANIFEST_PATH)
+    stdin, stdout, stderr = client.exec_command(
+        f"mkdir -p {directory} && cat > {AGENT_MANIFEST_PATH}.tmp"
+        f" && mv {AGENT_MANIFEST_PATH}.tmp {AGENT_MANIFEST_PATH}"
+    )
+    stdin.channel.sendall(json.dumps(manifest).encode())
+    stdin.channel.shutdown_write()
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        err = stderr.read().decode()
+        raise RuntimeError(f"Writing the deploy manifest failed (exit {exit_status}):\n{err}")
+
+
+def _check_command(client: paramiko.SSHClient, command: str) -> bool:
+    _stdin, stdout, _stderr = client.exec_command(command)
+    return stdout.channel.recv_exit_status() == 0
+
+
+def is_code_deployed(client: paramiko.SSHClient) -> bool:
+    return _check_command(client, f"test -d {AGENT_REMOTE_DIR}")
+
+
+def is_docker_installed(client: paramiko.SSHClient) -> bool:
+    return _check_command(client, "docker compose version")
 
 
 def verify_service(client: paramiko.SSHClient) -> bool:
     _stdin, stdout, _stderr = client.exec_command(
-        "cd /opt/libertai-agentkit && docker compose ps --format json"
+        f"cd {AGENT_REMOTE_DIR} && docker compose ps --format json"
     )
     output = stdout.read().strip()
     stdout.channel.recv_exit_status()
     if not output:
         return False
     return b'"running"' in output
+
+
+def _compose(client: paramiko.SSHClient, command: str, label: str) -> None:
+    _stdin, stdout, stderr = client.exec_command(
+        f"cd {AGENT_REMOTE_DIR} && docker compose {command}"
+    )
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        err = stderr.read().decode()
+        raise RuntimeError(f"{label} failed (exit {exit_status}):\n{err}")
+
+
+def pause_agent(client: paramiko.SSHClient) -> None:
+    """Stop the containers, keeping them with their images and the build cache."""
+    _compose(client, "stop", "Stopping the agent containers")
+
+
+def resume_agent(client: paramiko.SSHClient) -> None:
+    """Start the containers again, only what went missing since the pause is rebuilt."""
+    _compose(client, "up -d", "Starting the agent containers")
+
+
+def service_states(client: paramiko.SSHClient) -> dict[str, str]:
+    """State of the container of every compose service, e.g. "running" or "exited"."""
+    _stdin, stdout, _stderr = client.exec_command(
+        f"cd {AGENT_REMOTE_DIR} && docker compose ps -a --format json"
+    )
+    output = stdout.read().decode().strip()
+    stdout.channel.recv_exit_status()
+    # Older compose versions print one JSON array instead of one object per line
+    try:
+        entries = json.loads(output) if output.startswith("[") else [
+            json.loads(line) for line in output.splitlines() if line.strip()
+        ]
+    except ValueError:
+        return {}
+    return {
+        str(entry.get("Service", "?")): str(entry.get("State", "unknown"))
+        for entry in entries
+        if isinstance(entry, dict)
+    }
+
+
+def container_services(client: paramiko.SSHClient) -> dict[str, str]:
+    """Compose service of every running container, keyed by container name."""
+    _stdin, stdout, _stderr = client.exec_command(
+        "docker ps --format '{{.Names}} {{.Label \"com.docker.compose.service\"}}'"
+    )
+    services = {}
+    for line in stdout.read().decode().splitlines():
+        name, _, service = line.strip().partition(" ")
+        if name:
+            services[name] = service or name
+    stdout.channel.recv_exit_status()
+    return services
+
+
+def stream_container_stats(
+    client: paramiko.SSHClient, on_report: Callable[[dict[str, Any]], object]
+) -> None:
+    """Run `docker stats` on a channel kept open, passing on each container report.
+
+    Blocks until the channel closes, which happens when the connection drops
+    or the client gets closed.
+    """
+    _stdin, stdout, _stderr = client.exec_command(
+        "docker stats --format '{{json .}}'"
+    )
+    for line in stdout:
+        line = _ANSI_ESCAPE.sub("", line).strip()
+        if not line:
+            continue
+        try:
+            on_report(json.loads(line))
+        except ValueError:
+            continue
@@ -0,0 +1,101 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+
+STATE_DIR_NAME = ".libertai"
+JOURNAL_FILE_NAME = "deploy-journal.json"
+
+
+@dataclass
+class DeployJournal:
+    """On-disk record of the deploy steps that already succeeded for an agent.
+
+    Every update is written atomically so an interrupted deploy leaves either the
+    previous or the new journal on disk, never a truncated one.
+    """
+
+    path: Path = field(repr=False)
+    address: str
+    credits_purchased: bool = False
+    instance_hash: str | None = None
+    allocation_notified: bool = False
+    instance_ip: str | None = None
+    code_uploaded: bool = False
+    # `manifest_digest` of the uploaded code, a resume uploads it again if it changed
+    code_digest: str | None = None
+    docker_installed: bool = False
+
+    @staticmethod
+    def file_path(agent_path: Path) -> Path:
+        return agent_path / STATE_DIR_NAME / JOURNAL_FILE_NAME
+
+    @classmethod
+    def load(cls, agent_path: Path) -> "DeployJournal | None":
+        journal_path = cls.file_path(agent_path)
+        try:
+            data = json.loads(journal_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        known = {f.name for f in fields(cls)} - {"path"}
+        if not isinstance(data, dict) or "address" not in data:
+            return None
+        return cls(path=journal_path, **{k: v for k, v in data.items() if k in known})
+
+    @classmethod
+    def start(cls, agent_path: Path, address: str) -> "DeployJournal":
+        journal = cls(path=cls.file_path(agent_path), address=address)
+        journal.save()
+        return journal
+
+    def save(self) -> None:
+        data = asdict(self)
+        data.pop("path")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def record(self, **updates: object) -> None:
+        for key, value in updates.items():
+            if not hasattr(self, key) or key == "path":
+                raise AttributeError(f"Unknown journal entry '{key}'")
+            setattr(self, key, value)
+        self.save()
+
+    def invalidate_instance(self) -> None:
+        """Drop the instance and everything that was done on it."""
+        self.record(
+            instance_hash=None,
+            allocation_notified=False,
+            instance_ip=None,
+            code_uploaded=False,
+            code_digest=None,
+            docker_installed=False,
+        )
+
+    def invalidate_host(self) -> None:
+        """Drop the remote work done on the instance, e.g. after its IP changed."""
+        self.record(code_uploaded=False, code_digest=None, docker_installed=False)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+    @property
+    def summary(self) -> str:
+        done = [
+            label
+            for label, value in [
+                ("credits bought", self.credits_purchased),
+                ("instance created", self.instance_hash),
+                ("allocation notified", self.allocation_notified),
+                ("IP assigned", self.instance_ip),
+                ("code uploaded", self.code_uploaded),
+                ("Docker installed", self.docker_installed),
+            ]
+            if value
+        ]
+        return ", ".join(done) if done else "nothing completed"
@@ -0,0 +1,433 @@
+"""Warm pool of Docker-ready instances, claimed by deploys instead of creating one.
+
+Pool instances are created and paid for by a dedicated pool wallet and
+tracked in a registry under the cache directory. Every change to the registry
+happens under an exclusive file lock, so concurrent deploys and refills in
+other processes never claim or count the same instance twice.
+
+`python -m libertai_client.agentkit.pool` refills the pool to the size of the
+last `agentkit pool fill`, deploys start it in the background after a claim.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Literal
+
+from aleph.sdk.chains.ethereum import ETHAccount
+from libertai_x402 import create_payment_client
+
+from libertai_client.agentkit.chain.balance import (
+    get_usdc_balance,
+    wait_for_usdc_funding,
+)
+from libertai_client.agentkit.chain.wallet import generate_wallet, load_existing_wallet
+from libertai_client.agentkit.deployer import (
+    MIN_USDC_FUNDING,
+    DeployError,
+    DeployEvent,
+    EventKind,
+)
+from libertai_client.agentkit.infra.aleph import (
+    DEFAULT_CRN,
+    ExistingResources,
+    buy_credits,
+    confirm_all,
+    create_instance,
+    delete_existing_resources,
+    fetch_instance_ip,
+    get_aleph_account,
+    get_credit_balance,
+    notify_allocation,
+    wait_for_instance,
+)
+from libertai_client.agentkit.infra.ssh import install_docker, wait_for_ssh
+from libertai_client.config import config
+from libertai_client.utils.poll import Deadline
+from libertai_client.utils.ssh import AsyncSSHClient
+from libertai_client.utils.system import write_file_atomic
+
+REGISTRY_FILE_NAME = "registry.json"
+LOCK_FILE_NAME = "registry.lock"
+REFILL_LOG_FILE_NAME = "refill.log"
+# Boot, SSH and the Docker installation of a pool instance, nobody waits on it
+INSTANCE_READY_TIMEOUT = 900
+
+PoolStatus = Literal["provisioning", "ready", "claimed", "failed"]
+
+
+@dataclass
+class PoolInstance:
+    id: str
+    vcpus: int
+    memory: int
+    ssh_pubkey: str
+    status: PoolStatus = "provisioning"
+    instance_hash: str | None = None
+    instance_ip: str | None = None
+    created_at: float = field(default_factory=time.time)
+    # Process provisioning the instance, the entry is stale once it is gone
+    pid: int | None = None
+    # Agent directory of the deploy that claimed the instance
+    claimed_by: str | None = None
+    error: str | None = None
+
+    @property
+    def stale(self) -> bool:
+        return self.status == "provisioning" and not _is_running(self.pid)
+
+
+@dataclass
+class PoolSettings:
+    """What `agentkit pool fill` was last asked for, background refills reuse it."""
+
+    size: int = 0
+    vcpus: int = 2
+    memory: int = 4096
+    ssh_pubkey: str = ""
+    ssh_pubkey_path: str | None = None
+    credits_amount: float = 1.0
+
+
+def _is_running(pid: int | None) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WarmPool:
+    """Registry and provisioning of the warm instances.
+
+    Like `Deployer`, it reports progress as `DeployEvent`s. With
+    `background_refill` off, claims leave the refill to the caller.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        *,
+        background_refill: bool = True,
+        on_event: Callable[[DeployEvent], None] | None = None,
+    ) -> None:
+        self.directory = directory or config.CACHE_DIR / "pool"
+        self.background_refill = background_refill
+        self.on_event = on_event
+
+    def _emit(self, kind: EventKind, message: str = "") -> None:
+        if self.on_event is not None:
+            self.on_event(DeployEvent(kind, message))
+
+    def _load(self) -> tuple[PoolSettings, list[PoolInstance]]:
+        try:
+            data = json.loads((self.directory / REGISTRY_FILE_NAME).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        known = {f.name for f in fields(PoolInstance)}
+        settings = PoolSettings(**data.get("settings", {}))
+        instances = [
+            PoolInstance(**{k: v for k, v in entry.items() if k in known})
+            for entry in data.get("instances", [])
+        ]
+        return settings, instances
+
+    @contextmanager
+    def _registry(self) -> Iterator[tuple[PoolSettings, list[PoolInstance]]]:
+        """Load the registry under the lock, changes are saved when the block exits."""
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(self.directory / LOCK_FILE_NAME, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            settings, instances = self._load()
+            before = _serialize(settings, instances)
+            yield settings, instances
+            content = _serialize(settings, instances)
+            if content != before:
+                write_file_atomic(self.directory / REGISTRY_FILE_NAME, content)
+
+    def _update(self, instance_id: str, **updates: object) -> None:
+        with self._registry() as (_settings, instances):
+            for instance in instances:
+                if instance.id == instance_id:
+                    for key, value in updates.items():
+                        setattr(instance, key, value)
+
+    def wallet(self) -> tuple[str, str]:
+        """Address and private key of the pool wallet, created on first use."""
+        existing = load_existing_wallet(self.directory)
+        if existing:
+            return existing
+        # Under the lock so that concurrent first fills agree on one wallet
+        with self._registry():
+            existing = load_existing_wallet(self.directory)
+            if existing:
+                return existing
+            address, private_key = generate_wallet()
+            fd = os.open(self.directory / ".env.prod", os.O_WRONLY | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(f"WALLET_PRIVATE_KEY={private_key}\n")
+        return address, private_key
+
+    def instances(self) -> tuple[PoolSettings, list[PoolInstance]]:
+        """Snapshot of the registry, without the lock since writes replace it atomically."""
+        return self._load()
+
+    def claimed_by(self, agent_path: Path) -> PoolInstance | None:
+        _settings, instances = self.instances()
+        for instance in instances:
+            if instance.status == "claimed" and instance.claimed_by == str(agent_path):
+                return instance
+        return None
+
+    def claim(
+        self, agent_path: Path, ssh_pubkey: str, vcpus: int, memory: int
+    ) -> PoolInstance | None:
+        """Hand the smallest ready instance fitting the size over to an agent."""
+
+        def fits(instance: PoolInstance) -> bool:
+            return (
+                instance.status == "ready"
+                and instance.ssh_pubkey == ssh_pubkey
+                and instance.vcpus >= vcpus
+                and instance.memory >= memory
+            )
+
+        # Most deploys find no pool at all, they don't need the lock to tell
+        if not any(fits(instance) for instance in self.instances()[1]):
+            return None
+        with self._registry() as (_settings, instances):
+            candidates = [instance for instance in instances if fits(instance)]
+            if not candidates:
+                return None
+            instance = min(candidates, key=lambda i: (i.vcpus, i.memory, i.created_at))
+            instance.status = "claimed"
+            instance.claimed_by = str(agent_path)
+        if self.background_refill:
+            self.refill_in_background()
+        return instance
+
+    async def check(self, instance: PoolInstance) -> bool:
+        """Whether a claimed instance still runs, it is dropped from the pool otherwise."""
+        assert instance.instance_hash is not None
+        try:
+            ip = await fetch_instance_ip(DEFAULT_CRN, instance.instance_hash)
+        except Exception:
+            ip = ""
+        if ip and ip == instance.instance_ip:
+            return True
+        self._update(instance.id, status="failed", error="Instance gone after being claimed")
+        return False
+
+    async def delete(
+        self, selected: Callable[[PoolInstance], bool], confirm: bool = True
+    ) -> list[PoolInstance]:
+        """Delete the selected instances and drop them from the registry.
+
+        With `confirm`, waits for the network to process the forgets.
+        """
+        with self._registry() as (_settings, instances):
+            doomed = [i for i in instances if selected(i) and not _busy(i)]
+            instances[:] = [i for i in instances if i not in doomed]
+        hashes = [i.instance_hash for i in doomed if i.instance_hash is not None]
+        if hashes:
+            account = get_aleph_account(self.wallet()[1])
+            forgets = await delete_existing_resources(
+                account, ExistingResources(instance_hashes=hashes)
+            )
+            if confirm:
+                await confirm_all(forgets)
+        return doomed
+
+    async def release(self, agent_path: Path, confirm: bool = True) -> list[PoolInstance]:
+        """Delete the instance claimed by an agent."""
+        return await self.delete(lambda i: i.claimed_by == str(agent_path), confirm)
+
+    async def drain(self) -> list[PoolInstance]:
+        """Stop refilling and delete every instance no agent claimed."""
+        with self._registry() as (settings, _instances):
+            settings.size = 0
+        return await self.delete(lambda i: i.status != "claimed")
+
+    def refill_in_background(self) -> None:
+        log_path = self.directory / REFILL_LOG_FILE_NAME
+        with open(log_path, "ab") as log:
+            subprocess.Popen(
+                [sys.executable, "-m", "libertai_client.agentkit.pool"],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+            )
+
+    def _reserve(
+        self, settings_update: PoolSettings | None
+    ) -> tuple[PoolSettings, list[PoolInstance]]:
+        """Add the entries missing to reach the pool size, owned by this process."""
+        with self._registry() as (settings, instances):
+            if settings_update is not None:
+                for name, value in asdict(settings_update).items():
+                    setattr(settings, name, value)
+            # Entries left by a refill that died are taken over when they got
+            # an instance, they don't cost anything otherwise
+            instances[:] = [i for i in instances if not i.stale or i.instance_hash]
+            resumed = [i for i in instances if i.stale]
+            for instance in resumed:
+                instance.pid = os.getpid()
+            available = [i for i in instances if i.status in ("provisioning", "ready")]
+            added = [
+                PoolInstance(
+                    id=uuid.uuid4().hex[:12],
+                    vcpus=settings.vcpus,
+                    memory=settings.memory,
+                    ssh_pubkey=settings.ssh_pubkey,
+                    pid=os.getpid(),
+                )
+                for _ in range(max(0, settings.size - len(available)))
+            ]
+            instances.extend(added)
+            return settings, resumed + added
+
+    async def fill(
+        self, settings: PoolSettings | None = None, wait_for_funding: bool = True
+    ) -> list[PoolInstance]:
+        """Provision instances until the pool has `settings.size` of them ready or on the way.
+
+        Without `settings`, those of the last fill are used. Returns the
+        instances this call provisioned.
+        """
+        settings, reserved = self._reserve(settings)
+        if not reserved:
+            self._emit("note", f"Pool already holds {settings.size} instances")
+            return []
+
+        try:
+            address, private_key = self.wallet()
+            self._emit("section", "Pool wallet credits...")
+            self._emit("note", f"Pool wallet: {address}")
+            await self._fund(
+                address, private_key, settings.credits_amount * len(reserved), wait_for_funding
+            )
+        except BaseException as e:
+            for instance in reserved:
+                if instance.instance_hash is None:
+                    self._update(instance.id, status="failed", error=str(e) or repr(e))
+            raise
+
+        self._emit("section", f"Provisioning {len(reserved)} warm instances...")
+        account = get_aleph_account(private_key)
+        ssh_key_path = Path(settings.ssh_pubkey_path) if settings.ssh_pubkey_path else None
+        self._emit("step_started", "Creating Docker-ready instances")
+        started_at = time.monotonic()
+        results = await asyncio.gather(
+            *(self._provision(account, instance, ssh_key_path) for instance in reserved)
+        )
+        ready = sum(1 for instance in results if instance.status == "ready")
+        if not ready:
+            raise DeployError("Creating Docker-ready instances", str(results[0].error))
+        self._emit("step_finished", "Creating Docker-ready instances")
+        self._emit(
+            "info" if ready == len(results) else "warning",
+            f"{ready}/{len(results)} instances ready in {time.monotonic() - started_at:.1f}s",
+        )
+        return results
+
+    async def _fund(
+        self, address: str, private_key: str, amount: float, wait_for_funding: bool
+    ) -> None:
+        try:
+            balance_usd = await get_credit_balance(address)
+        except Exception:
+            balance_usd = 0.0
+        self._emit("note", f"Current balance: ${balance_usd:.2f}")
+        if balance_usd >= amount:
+            return
+        usdc_balance = await asyncio.to_thread(get_usdc_balance, address)
+        if usdc_balance < MIN_USDC_FUNDING:
+            if not wait_for_funding:
+                raise DeployError(
+                    "Funding the pool wallet",
+                    f"The pool wallet {address} needs {MIN_USDC_FUNDING} USDC, "
+                    "run `libertai agentkit pool fill` to fund it",
+                )
+            self._emit("funding_required", address)
+            usdc_balance = await asyncio.to_thread(
+                wait_for_usdc_funding, address, MIN_USDC_FUNDING
+            )
+            self._emit("info", f"Received {usdc_balance:.2f} USDC")
+        payment_client = create_payment_client(private_key)
+        await buy_credits(payment_client, address, amount)
+        self._emit("note", f"Bought ${amount:.2f} of Aleph credits")
+
+    async def _provision(
+        self, account: ETHAccount, instance: PoolInstance, ssh_key_path: Path | None
+    ) -> PoolInstance:
+        try:
+            if instance.instance_hash is None:
+                message = await create_instance(
+                    account,
+                    DEFAULT_CRN,
+                    vcpus=instance.vcpus,
+                    memory=instance.memory,
+                    ssh_pubkey=instance.ssh_pubkey,
+                )
+                instance.instance_hash = message.item_hash
+                self._update(instance.id, instance_hash=instance.instance_hash)
+                await message.confirmed()
+            await notify_allocation(DEFAULT_CRN, instance.instance_hash)
+            deadline = Deadline(INSTANCE_READY_TIMEOUT)
+            instance.instance_ip = await wait_for_instance(
+                DEFAULT_CRN, instance.instance_hash, deadline
+            )
+            self._update(instance.id, instance_ip=instance.instance_ip)
+            async with await AsyncSSHClient.open(
+                wait_for_ssh, instance.instance_ip, ssh_key_path, deadline=deadline
+            ) as client:
+                await client.call(install_docker)
+        except Exception as e:
+            instance.status = "failed"
+            instance.error = f"{type(e).__name__}: {e or repr(e)}"
+            self._emit("warning", f"Instance {instance.id} failed: {instance.error}")
+        else:
+            instance.status = "ready"
+            self._emit("note", f"Instance {instance.id} ready at {instance.instance_ip}")
+        self._update(
+            instance.id,
+            status=instance.status,
+            error=instance.error,
+            pid=None,
+        )
+        return instance
+
+
+def _serialize(settings: PoolSettings, instances: list[PoolInstance]) -> bytes:
+    content = {
+        "settings": asdict(settings),
+        "instances": [asdict(instance) for instance in instances],
+    }
+    return json.dumps(content, indent=2).encode()
+
+
+def _busy(instance: PoolInstance) -> bool:
+    return instance.status == "provisioning" and not instance.stale
+
+
+def _print_event(event: DeployEvent) -> None:
+    if event.kind not in ("step_started", "step_progress"):
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {event.kind}: {event.message}", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(WarmPool(on_event=_print_event).fill(wait_for_funding=False))
@@ -0,0 +1,183 @@
+import asyncio
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from aleph.sdk.chains.ethereum import ETHAccount
+
+from libertai_client.agentkit.infra.aleph import (
+    INSTANCE_BOOT_TIMEOUT,
+    CRNInfo,
+    ExistingResources,
+    create_instance,
+    delete_existing_resources,
+    notify_allocation,
+    wait_for_instance,
+)
+from libertai_client.agentkit.infra.ssh import (
+    agent_manifest,
+    deploy_code,
+    install_docker,
+    is_docker_installed,
+    pull_images,
+    start_agent,
+    upload_agent,
+    verify_service,
+    wait_for_ssh,
+    write_remote_manifest,
+)
+from libertai_client.utils.poll import Deadline
+from libertai_client.utils.ssh import AsyncSSHClient
+
+
+@dataclass
+class Replica:
+    slot: int
+    crn: CRNInfo
+    instance_hash: str | None = None
+    instance_ip: str | None = None
+    status: str = "pending"
+    attempts: int = 0
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "running"
+
+
+async def provision_replica(
+    replica: Replica,
+    account: ETHAccount,
+    agent_path: Path,
+    ssh_pubkey: str,
+    ssh_pubkey_path: Path | None,
+    on_update: Callable[[Replica], None],
+    vcpus: int,
+    memory: int,
+    refresh_metadata: bool = False,
+    images: list[str] | None = None,
+) -> None:
+    """Create an instance on the replica's CRN and bring the agent up on it."""
+    images = images or []
+
+    def update(status: str) -> None:
+        replica.status = status
+        on_update(replica)
+
+    crn = replica.crn
+    update("creating instance")
+    instance_message = await create_instance(
+        account,
+        crn,
+        vcpus=vcpus,
+        memory=memory,
+        ssh_pubkey=ssh_pubkey,
+        refresh_metadata=refresh_metadata,
+    )
+    instance_hash = replica.instance_hash = instance_message.item_hash
+    update("confirming instance")
+    await instance_message.confirmed()
+    update("allocating")
+    await notify_allocation(crn, instance_hash)
+    boot_deadline = Deadline(INSTANCE_BOOT_TIMEOUT)
+    update("waiting for IP")
+    instance_ip = replica.instance_ip = await wait_for_instance(
+        crn, instance_hash, boot_deadline
+    )
+
+    update("waiting for SSH")
+    client = await AsyncSSHClient.open(
+        wait_for_ssh, instance_ip, ssh_pubkey_path, deadline=boot_deadline
+    )
+    async with client:
+
+        async def prepare_docker() -> None:
+            if not await client.call(is_docker_installed):
+                await client.call(install_docker)
+            try:
+                await client.call(pull_images, images)
+            except RuntimeError:
+                # Compose pulls whatever is missing when it starts
+                pass
+
+        async def ship_code() -> None:
+            await client.call(upload_agent, agent_path)
+            await client.call(deploy_code)
+
+        # Docker and the pulled images don't depend on the code
+        update("uploading code, preparing Docker")
+        await asyncio.gather(ship_code(), prepare_docker())
+        update("starting agent")
+        await client.call(start_agent)
+        if not await client.call(verify_service):
+            raise RuntimeError("libertai-agentkit service failed to start")
+        manifest = await asyncio.to_thread(agent_manifest, agent_path)
+        await client.call(write_remote_manifest, manifest)
+    update("running")
+
+
+async def deploy_replicas(
+    account: ETHAccount,
+    agent_path: Path,
+    count: int,
+    crns: list[CRNInfo],
+    ssh_pubkey: str,
+    ssh_pubkey_path: Path | None = None,
+    on_update: Callable[[Replica], None] | None = None,
+    max_attempts: int = 3,
+    vcpus: int = 2,
+    memory: int = 4096,
+    refresh_metadata: bool = False,
+    images: list[str] | None = None,
+) -> list[Replica]:
+    """Deploy the agent on `count` distinct CRNs concurrently.
+
+    A replica that fails is torn down and retried on the next unused CRN, up to
+    `max_attempts` times, while the other replicas carry on undisturbed.
+    """
+    if len(crns) < count:
+        raise ValueError(f"Only {len(crns)} suitable CRNs available for {count} replicas")
+    spare_crns = list(crns[count:])
+
+    def notify(replica: Replica) -> None:
+        if on_update is not None:
+            on_update(replica)
+
+    async def run_slot(replica: Replica) -> Replica:
+        while True:
+            replica.attempts += 1
+            try:
+                await provision_replica(
+                    replica,
+                    account,
+                    agent_path,
+                    ssh_pubkey,
+                    ssh_pubkey_path,
+                    notify,
+                    vcpus,
+                    memory,
+                    refresh_metadata,
+                    images,
+                )
+                return replica
+            except Exception as e:
+                replica.error = f"{type(e).__name__}: {e or repr(e)}"
+            if replica.instance_hash is not None:
+                try:
+                    await delete_existing_resources(
+                        account, ExistingResources(instance_hashes=[replica.instance_hash])
+                    )
+                except Exception:
+                    # A leftover instance shows up and gets cleaned on the next deploy
+                    pass
+            if replica.attempts >= max_attempts or not spare_crns:
+                replica.status = "failed"
+                notify(replica)
+                return replica
+            replica.crn = spare_crns.pop(0)
+            replica.instance_hash = replica.instance_ip = None
+            replica.status = "replacing"
+            notify(replica)
+
+    replicas = [Replica(slot=slot, crn=crn) for slot, crn in enumerate(crns[:count])]
+    return list(await asyncio.gather(*(run_slot(replica) for replica in replicas)))
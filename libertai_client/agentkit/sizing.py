@@ -0,0 +1,124 @@
+import math
+from dataclasses import dataclass, field
+
+from libertai_client.agentkit.compose import ComposeService
+
+# Aleph prices instances in compute units of 1 vCPU and 2 GiB of memory
+COMPUTE_UNIT_MEMORY_MIB = 2048
+MAX_COMPUTE_UNITS = 12
+# Assumed for services that set neither a limit nor a reservation
+DEFAULT_SERVICE_CPUS = 0.5
+DEFAULT_SERVICE_MEMORY_MIB = 512
+# The guest OS and the Docker daemon
+SYSTEM_CPUS = 0.25
+SYSTEM_MEMORY_MIB = 512
+HEADROOM = 0.25
+
+DEFAULT_VCPUS = 2
+DEFAULT_MEMORY_MIB = 4096
+
+
+@dataclass
+class Sizing:
+    vcpus: int
+    memory: int
+    rationale: list[str] = field(default_factory=list)
+
+
+def _format_cpus(cpus: float) -> str:
+    return f"{cpus:g} vCPU"
+
+
+def size_instance(
+    services: list[ComposeService] | None,
+    vcpus: int | None = None,
+    memory: int | None = None,
+) -> Sizing:
+    """Pick the instance size from the compose resource settings, plus headroom.
+
+    The result is rounded up to whole compute units. Without any declared
+    limit there is nothing to size from and the default size is kept rather
+    than assuming the services are small. `vcpus` and `memory` (MiB) override
+    the computed values, the compose file isn't looked at when both are given.
+    """
+    rationale: list[str] = []
+    if vcpus is not None and memory is not None:
+        return Sizing(
+            vcpus=vcpus,
+            memory=memory,
+            rationale=[f"{vcpus} vCPU, {memory} MiB set by --vcpus and --memory"],
+        )
+    running = [service for service in services or [] if service.replicas]
+    unreadable = [
+        f"{service.name}: ignored unreadable {setting}, treated as no limit"
+        for service in running
+        for setting in service.unreadable_resources
+    ]
+    if not any(s.cpus is not None or s.memory_mib is not None for s in running):
+        reason = (
+            "No compose service declares CPU or memory limits"
+            if running
+            else "No compose services to size from"
+        )
+        sizing = Sizing(
+            vcpus=DEFAULT_VCPUS,
+            memory=DEFAULT_MEMORY_MIB,
+            rationale=[
+                *unreadable,
+                f"{reason}, using the default {DEFAULT_VCPUS} vCPU, {DEFAULT_MEMORY_MIB} MiB",
+            ],
+        )
+    else:
+        total_cpus = SYSTEM_CPUS
+        total_memory = SYSTEM_MEMORY_MIB
+        for service in running:
+            cpus = service.cpus if service.cpus is not None else DEFAULT_SERVICE_CPUS
+            memory_mib = (
+                service.memory_mib
+                if service.memory_mib is not None
+                else DEFAULT_SERVICE_MEMORY_MIB
+            )
+            total_cpus += cpus * service.replicas
+            total_memory += memory_mib * service.replicas
+            source = (
+                "assumed, no limits set"
+                if service.cpus is None and service.memory_mib is None
+                else "from compose"
+            )
+            replicas = f" x{service.replicas}" if service.replicas > 1 else ""
+            rationale.append(
+                f"{service.name}{replicas}: {_format_cpus(cpus)}, {memory_mib} MiB ({source})"
+            )
+        rationale.extend(unreadable)
+        rationale.append(
+            f"system: {_format_cpus(SYSTEM_CPUS)}, {SYSTEM_MEMORY_MIB} MiB, "
+            f"plus {HEADROOM:.0%} headroom"
+        )
+        needed_cpus = total_cpus * (1 + HEADROOM)
+        needed_memory = total_memory * (1 + HEADROOM)
+        units = max(
+            1,
+            math.ceil(needed_cpus),
+            math.ceil(needed_memory / COMPUTE_UNIT_MEMORY_MIB),
+        )
+        if units > MAX_COMPUTE_UNITS:
+            rationale.append(
+                f"capped at {MAX_COMPUTE_UNITS} compute units, "
+                f"{needed_cpus:.1f} vCPU / {needed_memory:.0f} MiB requested"
+            )
+            units = MAX_COMPUTE_UNITS
+        rationale.append(
+            f"needs {needed_cpus:.2f} vCPU / {needed_memory:.0f} MiB, "
+            f"{units} compute unit{'s' if units > 1 else ''}"
+        )
+        sizing = Sizing(
+            vcpus=units, memory=units * COMPUTE_UNIT_MEMORY_MIB, rationale=rationale
+        )
+
+    if vcpus is not None:
+        sizing.vcpus = vcpus
+        sizing.rationale.append(f"vCPUs set to {vcpus} by --vcpus")
+    if memory is not None:
+        sizing.memory = memory
+        sizing.rationale.append(f"memory set to {memory} MiB by --memory")
+    return sizing
@@ -0,0 +1,95 @@
+import json
+import time
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Literal
+
+from libertai_client.agentkit.journal import STATE_DIR_NAME
+from libertai_client.utils.system import write_file_atomic
+
+STATE_FILE_NAME = "state.json"
+
+AgentStatus = Literal["running", "paused"]
+
+
+@dataclass
+class ReplicaEndpoint:
+    """Where one replica of the agent runs, as deployed with `--replicas`."""
+
+    instance_hash: str
+    instance_ip: str
+    crn_url: str
+    crn_hash: str
+
+
+@dataclass
+class AgentState:
+    """Last known state of a deployed agent, kept next to its deploy journal.
+
+    Written by deploy, pause and resume, removed by stop. The instance itself
+    is the source of truth, `agentkit status` compares both.
+    """
+
+    path: Path = field(repr=False)
+    status: AgentStatus
+    instance_hash: str | None = None
+    instance_ip: str | None = None
+    replicas: list[ReplicaEndpoint] = field(default_factory=list)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def hosts(self) -> list[str]:
+        """IP of every instance running the agent, the first one being the primary."""
+        if self.replicas:
+            return [replica.instance_ip for replica in self.replicas]
+        return [self.instance_ip] if self.instance_ip is not None else []
+
+    @staticmethod
+    def file_path(agent_path: Path) -> Path:
+        return agent_path / STATE_DIR_NAME / STATE_FILE_NAME
+
+    @classmethod
+    def load(cls, agent_path: Path) -> "AgentState | None":
+        state_path = cls.file_path(agent_path)
+        try:
+            data = json.loads(state_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        known = {f.name for f in fields(cls)} - {"path"}
+        if not isinstance(data, dict) or data.get("status") not in ("running", "paused"):
+            return None
+        values = {k: v for k, v in data.items() if k in known}
+        try:
+            values["replicas"] = [ReplicaEndpoint(**r) for r in values.get("replicas", [])]
+        except TypeError:
+            return None
+        return cls(path=state_path, **values)
+
+    @classmethod
+    def record(
+        cls,
+        agent_path: Path,
+        status: AgentStatus,
+        instance_hash: str | None = None,
+        instance_ip: str | None = None,
+        replicas: list[ReplicaEndpoint] | None = None,
+    ) -> "AgentState":
+        """Save a new state, keeping the known instances when none are given."""
+        previous = cls.load(agent_path)
+        state = cls(
+            path=cls.file_path(agent_path),
+            status=status,
+            instance_hash=instance_hash or (previous.instance_hash if previous else None),
+            instance_ip=instance_ip or (previous.instance_ip if previous else None),
+            replicas=(
+                replicas if replicas is not None else (previous.replicas if previous else [])
+            ),
+        )
+        data = asdict(state)
+        data.pop("path")
+        write_file_atomic(state.path, json.dumps(data, indent=2).encode())
+        return state
+
+    @classmethod
+    def clear(cls, agent_path: Path) -> None:
+        cls.file_path(agent_path).unlink(missing_ok=True)
@@ -0,0 +1,153 @@
+import re
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+# docker stats reports memory in binary units and I/O in decimal ones
+_SIZE_UNITS = {
+    "b": 1,
+    "kb": 1000,
+    "mb": 1000**2,
+    "gb": 1000**3,
+    "tb": 1000**4,
+    "kib": 1024,
+    "mib": 1024**2,
+    "gib": 1024**3,
+    "tib": 1024**4,
+}
+_SIZE = re.compile(r"^\s*([0-9.]+)\s*([a-zA-Z]*)\s*$")
+
+
+def parse_size(text: str) -> float:
+    """Size as printed by docker ("12.3MiB", "1.2kB", "0B") in bytes, 0 when unreadable."""
+    match = _SIZE.match(text)
+    if match is None:
+        return 0.0
+    value, unit = match.groups()
+    return float(value) * _SIZE_UNITS.get(unit.lower() or "b", 1)
+
+
+def parse_percent(text: str) -> float:
+    try:
+        return float(text.strip().rstrip("%"))
+    except ValueError:
+        return 0.0
+
+
+def _pair(text: str) -> tuple[float, float]:
+    first, _, second = text.partition("/")
+    return parse_size(first), parse_size(second)
+
+
+@dataclass
+class ContainerSample:
+    """One `docker stats` report of a container. Network counters are cumulative."""
+
+    host: str
+    container: str
+    service: str
+    at: float
+    cpu_percent: float
+    memory: float
+    memory_limit: float
+    net_rx: float
+    net_tx: float
+
+    @classmethod
+    def from_report(
+        cls, host: str, report: dict[str, Any], service: str | None, at: float
+    ) -> "ContainerSample":
+        name = str(report.get("Name") or report.get("Container") or "?")
+        memory, memory_limit = _pair(str(report.get("MemUsage", "")))
+        net_rx, net_tx = _pair(str(report.get("NetIO", "")))
+        return cls(
+            host=host,
+            container=name,
+            service=service or name,
+            at=at,
+            cpu_percent=parse_percent(str(report.get("CPUPerc", ""))),
+            memory=memory,
+            memory_limit=memory_limit,
+            net_rx=net_rx,
+            net_tx=net_tx,
+        )
+
+
+@dataclass
+class UsageRow:
+    """Resource use summed over the containers of a service, an instance or everything."""
+
+    scope: str
+    name: str
+    containers: int = 0
+    cpu_percent: float = 0.0
+    memory: float = 0.0
+    net_rx_rate: float = 0.0
+    net_tx_rate: float = 0.0
+
+    def add(self, sample: ContainerSample, rates: tuple[float, float]) -> None:
+        self.containers += 1
+        self.cpu_percent += sample.cpu_percent
+        self.memory += sample.memory
+        self.net_rx_rate += rates[0]
+        self.net_tx_rate += rates[1]
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class StatsAggregator:
+    """Latest sample of every container across instances.
+
+    Only the last sample and the network rates derived from the one before are
+    kept per container, and containers that stop reporting are dropped, so
+    memory doesn't grow however long the session runs.
+    """
+
+    def __init__(self, stale_after: float = 15.0) -> None:
+        self.stale_after = stale_after
+        self._latest: dict[tuple[str, str], ContainerSample] = {}
+        self._rates: dict[tuple[str, str], tuple[float, float]] = {}
+
+    def add(self, sample: ContainerSample) -> None:
+        key = (sample.host, sample.container)
+        previous = self._latest.get(key)
+        if previous is not None:
+            elapsed = sample.at - previous.at
+            if elapsed <= 0:
+                return
+            # Counters restart from zero when the container is recreated
+            self._rates[key] = (
+                max(0.0, sample.net_rx - previous.net_rx) / elapsed,
+                max(0.0, sample.net_tx - previous.net_tx) / elapsed,
+            )
+        self._latest[key] = sample
+
+    def forget_host(self, host: str) -> None:
+        for key in [key for key in self._latest if key[0] == host]:
+            del self._latest[key]
+            self._rates.pop(key, None)
+
+    def rows(self, now: float) -> list[UsageRow]:
+        """Rows per service across instances, per instance, then the overall total."""
+        for key, sample in list(self._latest.items()):
+            if now - sample.at > self.stale_after:
+                del self._latest[key]
+                self._rates.pop(key, None)
+
+        services: dict[str, UsageRow] = {}
+        hosts: dict[str, UsageRow] = defaultdict(lambda: UsageRow("instance", ""))
+        total = UsageRow("total", "total")
+        for key, sample in sorted(self._latest.items()):
+            rates = self._rates.get(key, (0.0, 0.0))
+            services.setdefault(sample.service, UsageRow("service", sample.service)).add(
+                sample, rates
+            )
+            hosts[sample.host].name = sample.host
+            hosts[sample.host].add(sample, rates)
+            total.add(sample, rates)
+        return [
+            *(services[name] for name in sorted(services)),
+            *(hosts[host] for host in sorted(hosts)),
+            total,
+        ]
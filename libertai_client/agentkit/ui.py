@@ -4,7 +4,15 @@ from typing import Any, NoReturn
 
 import typer
 from rich.console import Console
+from rich.live import Live
+from rich.markup import escape
+from rich.panel import Panel
 from rich.status import Status
+from rich.table import Table
+
+from libertai_client.agentkit.deployer import MIN_USDC_FUNDING, DeployError, DeployEvent
+from libertai_client.agentkit.replicas import Replica
+from libertai_client.utils.sftp import format_bytes
 
 console = Console()
 
@@ -29,3 +37,97 @@ async def _run_step(
         return result
     except Exception as e:
         _fail(label, e)
+
+
+def replicas_table(replicas: list[Replica]) -> Table:
+    table = Table("#", "CRN", "Instance IP", "Status", box=None, padding=(0, 2))
+    for replica in replicas:
+        if replica.ok:
+            status = "[green]running[/green]"
+        elif replica.status == "failed":
+            status = f"[red]failed[/red] [dim]{replica.error}[/dim]"
+        elif replica.error is not None:
+            status = f"{replica.status} [dim](retry {replica.attempts}, {replica.error})[/dim]"
+        else:
+            status = replica.status
+        table.add_row(
+            str(replica.slot + 1), replica.crn.url, replica.instance_ip or "-", status
+        )
+    return table
+
+
+class DeployRenderer:
+    """Prints the events of a `Deployer` the way `agentkit deploy` shows its progress."""
+
+    def __init__(self) -> None:
+        self.step = 0
+        self._status: Status | None = None
+        self._live: Live | None = None
+
+    def __call__(self, event: DeployEvent) -> None:
+        if event.kind != "replicas" and self._live is not None:
+            self._live.stop()
+            self._live = None
+        message = escape(event.message)
+        if event.kind == "section":
+            self.step += 1
+            if self.step > 1:
+                console.print()
+            console.print(f"[bold]Step {self.step}:[/bold] {message}")
+            console.print()
+        elif event.kind == "step_started":
+            self._status = Status(f"{message}...", console=console, spinner="dots")
+            self._status.start()
+        elif event.kind == "step_progress" and self._status is not None:
+            assert event.progress is not None
+            self._status.update(f"{message}... {event.progress.describe()}")
+        elif event.kind == "step_finished":
+            self._stop_status()
+            details = ""
+            if event.progress is not None:
+                details = (
+                    f" [dim]({format_bytes(event.progress.total)} "
+                    f"at {format_bytes(event.progress.rate)}/s)[/dim]"
+                )
+            console.print(f"  [green]✔[/green] {message}{details}")
+        elif event.kind == "info":
+            console.print(f"  [green]{message}[/green]")
+        elif event.kind == "note":
+            console.print(f"  [dim]{message}[/dim]")
+        elif event.kind == "warning":
+            console.print(f"  [yellow]{message}[/yellow]")
+        elif event.kind == "funding_required":
+            console.print(
+                Panel(
+                    f"[bold]Send USDC (Base) to:[/bold]\n\n"
+                    f"  [cyan]{message}[/cyan]\n\n"
+                    f"This USDC will be used to buy Aleph Cloud credits.\n\n"
+                    f"[dim]Minimum required: {MIN_USDC_FUNDING} USDC[/dim]",
+                    title="[bold yellow]Fund Agent Wallet[/bold yellow]",
+                    border_style="yellow",
+                )
+            )
+            console.print()
+        elif event.kind == "replicas":
+            assert event.replicas is not None
+            if self._live is None:
+                self._live = Live(console=console, refresh_per_second=8)
+                self._live.start()
+            self._live.update(replicas_table(event.replicas))
+
+    def _stop_status(self) -> None:
+        if self._status is not None:
+            self._status.stop()
+            self._status = None
+
+    def close(self) -> None:
+        self._stop_status()
+        if self._live is not None:
+            self._live.stop()
+            self._live = None
+
+    def fail(self, error: DeployError) -> NoReturn:
+        self.close()
+        console.print(f"  [red]✘[/red] {escape(error.step)}")
+        console.print(f"    [red]{escape(str(error))}[/red]")
+        raise typer.Exit(1)
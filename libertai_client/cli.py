@@ -0,0 +1,105 @@
+"""Entry point of the `libertai` script.
+
+This module stays free of heavy imports: when the daemon is running, the
+commands it can serve are sent over its socket and the SDKs are never loaded
+in this process. Everything else, or everything when the daemon isn't
+running, runs in-process as usual.
+"""
+
+import json
+import os
+import re
+import socket
+import sys
+from collections.abc import Iterator
+from typing import Any
+
+from libertai_client.config import config
+
+# Non-interactive commands, they must not prompt for input
+DAEMON_COMMANDS = {
+    ("agent", "deploy"),
+    ("agent", "list"),
+    ("agent", "status"),
+    ("agentkit", "bench"),
+    ("agentkit", "dev"),
+    ("agentkit", "pause"),
+    ("agentkit", "resume"),
+    ("agentkit", "status"),
+}
+# Options that keep a command in the foreground or only print local help
+LOCAL_OPTIONS = {"--watch", "--help", "--install-completion", "--show-completion"}
+# The daemon's consoles pick their colors once, strip them for pipes and files
+_ANSI_STYLE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def daemon_eligible(argv: list[str]) -> bool:
+    return tuple(argv[:2]) in DAEMON_COMMANDS and not any(
+        arg.split("=")[0] in LOCAL_OPTIONS for arg in argv
+    )
+
+
+def connect_daemon(timeout: float | None = None) -> socket.socket:
+    """Connect to the daemon socket, raises OSError when the daemon isn't running."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(str(config.DAEMON_SOCKET))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def daemon_request(sock: socket.socket, message: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """Send one JSON request over a connected socket and yield the replies."""
+    sock.sendall(json.dumps(message).encode() + b"\n")
+    with sock.makefile("rb") as replies:
+        for line in replies:
+            yield json.loads(line)
+
+
+def run_on_daemon(sock: socket.socket, argv: list[str]) -> int:
+    request: dict[str, Any] = {
+        "op": "run",
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "tty": sys.stdout.isatty(),
+    }
+    if request["tty"]:
+        request["columns"], request["lines"] = os.get_terminal_size(sys.stdout.fileno())
+    with sock:
+        try:
+            for reply in daemon_request(sock, request):
+                for name, stream in (("stdout", sys.stdout), ("stderr", sys.stderr)):
+                    if name in reply:
+                        text = reply[name]
+                        stream.write(text if stream.isatty() else _ANSI_STYLE.sub("", text))
+                        stream.flush()
+                if "exit" in reply:
+                    return int(reply["exit"])
+        except OSError:
+            pass
+    print("Lost the connection to the libertai daemon.", file=sys.stderr)
+    return 1
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    if config.USE_DAEMON and daemon_eligible(argv):
+        try:
+            sock = connect_daemon(timeout=1)
+        except OSError:
+            pass
+        else:
+            # Once the command was handed over it must not run a second time here
+            sock.settimeout(None)
+            try:
+                sys.exit(run_on_daemon(sock, argv))
+            except KeyboardInterrupt:
+                # Closing the connection cancels the command in the daemon
+                sys.exit(130)
+
+    from libertai_client.main import app
+
+    app(prog_name="libertai")
@@ -1,19 +1,34 @@
-import os
-from http import HTTPStatus
+import json
+import shlex
+import uuid
 from pathlib import Path
 from typing import Annotated
 
 import aiohttp
-import paramiko
 import rich
 import typer
 from dotenv import dotenv_values
 from paramiko import AuthenticationException
 from rich.console import Console
+from rich.status import Status
+from rich.table import Table
 
 from libertai_client.config import config
 from libertai_client.interfaces.agent import GetAgentResponse
-from libertai_client.utils.agent import parse_agent_config_env, create_agent_zip
+from libertai_client.utils.agent import (
+    fetch_deploy_script,
+    pack_agent_zip,
+    parse_agent_config_env,
+)
+from libertai_client.utils.backend import (
+    BackendError,
+    fetch_agent,
+    fetch_agents,
+    load_cached_agent,
+)
+from libertai_client.utils.http import http_sessions
+from libertai_client.utils.sftp import format_bytes, put_file
+from libertai_client.utils.ssh import connect, ssh_sessions
 from libertai_client.utils.system import (
     get_full_path,
 )
@@ -21,6 +36,7 @@ from libertai_client.utils.typer import AsyncTyper, validate_optional_file_path_
 
 app = AsyncTyper(name="agent", help="Deploy and manage agents")
 
+console = Console()
 err_console = Console(stderr=True)
 
 
@@ -49,85 +65,226 @@ async def deploy(
         err_console.print(f"[red]{error}")
         raise typer.Exit(1)
 
-    agent_zip_path = "/tmp/libertai-agent.zip"
-    create_agent_zip(path, agent_zip_path)
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{config.AGENTS_BACKEND_URL}/agents/{libertai_config.agent_id}",
-            headers={"accept": "application/json"},
-        ) as response:
-            if response.status != HTTPStatus.OK:
-                try:
-                    error_message = (await response.json()).get(
-                        "detail", "An unknown error occurred."
-                    )
-                except aiohttp.ContentTypeError:
-                    error_message = await response.text()
-                err_console.print(
-                    f"[red]Fetching agent details failed: {error_message}"
-                )
-                raise typer.Exit(1)
+    # Unique remote path so several agents can be deployed in parallel
+    remote_dir = f"/tmp/libertai-deploy-{uuid.uuid4().hex}"
 
-            agent_data = GetAgentResponse(**(await response.json()))
-            if agent_data.instance_hash is None:
-                err_console.print("[red]Agent has no instance linked to it.")
-                raise typer.Exit(1)
-            elif agent_data.subscription_status == "inactive":
-                err_console.print("[red]Agent subscription is inactive.")
-                raise typer.Exit(1)
-            elif agent_data.instance_ip is None:
-                err_console.print(
-                    "[red]Agent instance doesn't seem to be allocated yet, wait a few minutes and try again."
-                )
-                raise typer.Exit(1)
-            else:
-                rich.print(f"[green]Agent '{agent_data.name}' found, deploying...")
+    await _deploy(
+        libertai_config.agent_id,
+        path,
+        ssh_key_filename,
+        remote_dir,
+    )
 
-            # Create a Paramiko SSH client
-            ssh_client = paramiko.SSHClient()
-            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
+async def _deploy(
+    agent_id: str,
+    path: str,
+    ssh_key_filename: Path | None,
+    remote_dir: str,
+) -> None:
+    # Unchanged code is reused from the artifact cache instead of zipped again
+    agent_zip_path = str(pack_agent_zip(path))
+
+    async with http_sessions.session() as session:
+        # A fresh cached entry is only trusted if it is deployable, otherwise re-query
+        agent_data = load_cached_agent(agent_id)
+        if agent_data is None or agent_data.instance_ip is None:
             try:
-                # Connect to the server
-                ssh_client.connect(
-                    hostname=agent_data.instance_ip,
-                    username="root",
-                    key_filename=str(ssh_key_filename) if ssh_key_filename else None,
-                )
-            except AuthenticationException:
-                err_console.print(
-                    "[red]SSH authentication failed, please use the --ssh-key option to specify your private key file if necessary."
-                )
+                agent_data = await fetch_agent(session, agent_id, max_age=0)
+            except BackendError as error:
+                err_console.print(f"[red]Fetching agent details failed: {error}")
                 raise typer.Exit(1)
 
-            # Send the zip with the code
-            sftp = ssh_client.open_sftp()
-            remote_path = "/tmp/libertai-agent.zip"
-            sftp.put(agent_zip_path, remote_path)
-            sftp.close()
+        if agent_data.instance_hash is None:
+            err_console.print("[red]Agent has no instance linked to it.")
+            raise typer.Exit(1)
+        elif agent_data.subscription_status == "inactive":
+            err_console.print("[red]Agent subscription is inactive.")
+            raise typer.Exit(1)
+        elif agent_data.instance_ip is None:
+            err_console.print(
+                "[red]Agent instance doesn't seem to be allocated yet, wait a few minutes and try again."
+            )
+            raise typer.Exit(1)
+        else:
+            rich.print(f"[green]Agent '{agent_data.name}' found, deploying...")
+
+        try:
+            deploy_script_path = await fetch_deploy_script(session)
+        except aiohttp.ClientError as error:
+            err_console.print(f"[red]Fetching the deploy script failed: {error}")
+            raise typer.Exit(1)
+
+        key_filename = str(ssh_key_filename) if ssh_key_filename else None
+        try:
+            # Connect to the server, a running daemon keeps the session for the next deploy
+            async with ssh_sessions.session(
+                (agent_data.instance_ip, key_filename),
+                connect,
+                hostname=agent_data.instance_ip,
+                port=config.SSH_PORT,
+                username="root",
+                key_filename=key_filename,
+            ) as ssh_client:
+                # Send the zip with the code and the deploy script
+                mkdir = await ssh_client.exec(f"mkdir -p {remote_dir}")
+                if not mkdir.ok:
+                    err_console.print(
+                        f"[red]Creating {remote_dir} on the instance failed: {mkdir.stderr.decode().strip()}"
+                    )
+                    raise typer.Exit(1)
+                remote_path = f"{remote_dir}/libertai-agent.zip"
+                script_path = f"{remote_dir}/deploy-agent.sh"
+                await ssh_client.call(put_file, deploy_script_path, script_path)
+                with Status("Uploading agent code...", console=console) as status:
+                    progress = await ssh_client.call(
+                        put_file,
+                        agent_zip_path,
+                        remote_path,
+                        on_progress=lambda p: status.update(
+                            f"Uploading agent code... {p.describe()}"
+                        ),
+                    )
+                rich.print(
+                    f"[green]Agent code uploaded ({format_bytes(progress.total)} at {format_bytes(progress.rate)}/s)"
+                )
 
-            script_path = "/tmp/deploy-agent.sh"
+                # The deploy script only reads the archive from the legacy fixed path, the
+                # lock serializes concurrent deploys targeting the same instance
+                deploy_command = f"cp {remote_path} /tmp/libertai-agent.zip && {script_path}"
 
-            # Execute the command
-            _stdin, _stdout, stderr = ssh_client.exec_command(
-                f"wget {config.DEPLOY_SCRIPT_URL} -O {script_path} -q --no-cache && chmod +x {script_path} && {script_path}"
+                # Execute the command and wait for it to complete to get error logs
+                result = await ssh_client.exec(
+                    f"chmod +x {script_path} && flock /tmp/libertai-agent.lock sh -c {shlex.quote(deploy_command)}; "
+                    f"status=$?; rm -rf {remote_dir}; exit $status"
+                )
+        except AuthenticationException:
+            err_console.print(
+                "[red]SSH authentication failed, please use the --ssh-key option to specify your private key file if necessary."
             )
-            # Waiting for the command to complete to get error logs
-            stderr.channel.recv_exit_status()
+            raise typer.Exit(1)
+
+        error_log = result.stderr
+
+        if len(error_log) > 0:
+            # Errors occurred
+            err_console.print(f"[red]Error log:\n{error_log.decode()}")
+            warning_text = "Some errors occurred during the deployment, please check the logs above and make sure your agent is running correctly. If not, try to redeploy it and contact the LibertAI team if the issue persists."
+            rich.print(f"[yellow]{warning_text}")
+        else:
+            success_text = f"Agent successfully deployed on the instance (IPv6: {agent_data.instance_ip})"
+            rich.print(f"[green]{success_text}")
+
+
+def _agent_ids_from_file(ids_file: Path) -> list[str]:
+    lines = ids_file.read_text().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
 
-            # Close the connection
-            ssh_client.close()
+MaxAgeOption = Annotated[
+    float | None,
+    typer.Option(
+        "--max-age",
+        help="Reuse cached agent details younger than this many seconds (0 to always refetch)",
+    ),
+]
+JsonOption = Annotated[bool, typer.Option("--json", help="Print the result as JSON")]
 
-            error_log = stderr.read()
 
-            if len(error_log) > 0:
-                # Errors occurred
-                err_console.print(f"[red]Error log:\n{error_log.decode()}")
-                warning_text = "Some errors occurred during the deployment, please check the logs above and make sure your agent is running correctly. If not, try to redeploy it and contact the LibertAI team if the issue persists."
-                rich.print(f"[yellow]{warning_text}")
+@app.command(name="list")
+async def list_agents(
+    agent_ids: Annotated[
+        list[str] | None, typer.Argument(help="IDs of the agents to fetch")
+    ] = None,
+    ids_file: Annotated[
+        Path | None,
+        typer.Option(
+            "--ids-file",
+            help="File containing one agent ID per line",
+            callback=validate_optional_file_path_argument,
+        ),
+    ] = None,
+    max_age: MaxAgeOption = None,
+    concurrency: Annotated[
+        int, typer.Option(help="Maximum number of concurrent requests")
+    ] = 16,
+    as_json: JsonOption = False,
+):
+    """
+    Show the state of several agents
+    """
+    ids = list(agent_ids or [])
+    if ids_file is not None:
+        ids += _agent_ids_from_file(ids_file)
+    if len(ids) == 0:
+        err_console.print("[red]No agent ID given, pass them as arguments or with --ids-file.")
+        raise typer.Exit(1)
+
+    results = await fetch_agents(list(dict.fromkeys(ids)), max_age, concurrency)
+    failed = any(isinstance(result, Exception) for result in results.values())
+
+    if as_json:
+        output = {
+            agent_id: result.model_dump(mode="json")
+            if isinstance(result, GetAgentResponse)
+            else {"error": str(result)}
+            for agent_id, result in results.items()
+        }
+        print(json.dumps(output, indent=2))
+    else:
+        table = Table("ID", "Name", "Subscription", "Paid until", "Instance IP")
+        for agent_id, result in results.items():
+            if isinstance(result, GetAgentResponse):
+                table.add_row(
+                    agent_id,
+                    result.name,
+                    result.subscription_status.value,
+                    result.paid_until.strftime("%Y-%m-%d"),
+                    result.instance_ip or "[dim]not allocated[/dim]",
+                )
             else:
-                success_text = f"Agent successfully deployed on the instance (IPv6: {agent_data.instance_ip})"
-                rich.print(f"[green]{success_text}")
+                table.add_row(agent_id, f"[red]{result}[/red]", "", "", "")
+        console.print(table)
+
+    if failed:
+        raise typer.Exit(1)
+
+
+@app.command()
+async def status(
+    path: Annotated[str, typer.Argument(help="Path to the root of your project")] = ".",
+    agent_id: Annotated[
+        str | None,
+        typer.Option("--id", help="Agent ID, instead of reading it from the project"),
+    ] = None,
+    max_age: MaxAgeOption = None,
+    as_json: JsonOption = False,
+):
+    """
+    Show the state of an agent
+    """
+    if agent_id is None:
+        try:
+            libertai_env_path = get_full_path(path, ".env")
+            agent_id = parse_agent_config_env(dotenv_values(libertai_env_path)).agent_id
+        except (FileNotFoundError, EnvironmentError) as error:
+            err_console.print(f"[red]{error}")
+            raise typer.Exit(1)
+
+    async with http_sessions.session() as session:
+        try:
+            agent_data = await fetch_agent(session, agent_id, max_age)
+        except (BackendError, aiohttp.ClientError) as error:
+            err_console.print(f"[red]Fetching agent details failed: {error}")
+            raise typer.Exit(1)
+
+    if as_json:
+        print(agent_data.model_dump_json(indent=2))
+        return
 
-    os.remove(agent_zip_path)
+    rich.print(f"[bold]{agent_data.name}[/bold] ({agent_data.id})")
+    rich.print(f"  Subscription:  {agent_data.subscription_status.value}")
+    rich.print(f"  Paid until:    {agent_data.paid_until:%Y-%m-%d %H:%M}")
+    rich.print(f"  Monthly cost:  {agent_data.monthly_cost}")
+    rich.print(f"  Instance hash: {agent_data.instance_hash or '[dim]none[/dim]'}")
+    rich.print(f"  Instance IP:   {agent_data.instance_ip or '[dim]not allocated[/dim]'}")
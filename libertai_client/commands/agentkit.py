@@ -1,46 +1,70 @@
 import asyncio
+import json
 import os
+import time
+from contextlib import nullcontext
+from dataclasses import asdict
 from pathlib import Path
+from typing import Any
 
-import paramiko
 import typer
-from dotenv import dotenv_values
-from libertai_x402 import create_payment_client
+from aleph.sdk.chains.ethereum import ETHAccount
 from rich import print as rprint
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
+from rich.table import Table
+from watchfiles import awatch
 
-from libertai_client.agentkit.chain.balance import get_usdc_balance, wait_for_usdc_funding
-from libertai_client.agentkit.chain.wallet import generate_wallet, load_existing_wallet
+from libertai_client.agentkit.bench import run_load
+from libertai_client.agentkit.chain.wallet import load_existing_wallet
+from libertai_client.agentkit.compose import (
+    diff_manifests,
+    find_compose_file,
+    load_services,
+    plan_restart,
+)
+from libertai_client.agentkit.deployer import Deployer, DeployError
 from libertai_client.agentkit.infra.aleph import (
     DEFAULT_CRN,
-    buy_credits,
+    ExistingResources,
     check_existing_resources,
-    create_instance,
+    confirm_all,
     delete_existing_resources,
+    find_instance_ip,
     get_aleph_account,
-    get_credit_balance,
     get_user_ssh_pubkey,
-    notify_allocation,
-    wait_for_instance,
 )
 from libertai_client.agentkit.infra.ssh import (
-    deploy_code,
-    install_docker,
-    start_agent,
-    upload_agent,
+    agent_file_filter,
+    agent_manifest,
+    container_services,
+    pause_agent,
+    push_files,
+    read_remote_manifest,
+    restart_services,
+    resume_agent,
+    service_states,
+    stream_container_stats,
+    update_manifest,
     verify_service,
     wait_for_ssh,
+    write_remote_manifest,
 )
-from libertai_client.agentkit.ui import _fail, _run_step
+from libertai_client.agentkit.journal import DeployJournal
+from libertai_client.agentkit.pool import PoolSettings, WarmPool
+from libertai_client.agentkit.state import AgentState, AgentStatus
+from libertai_client.agentkit.top import ContainerSample, StatsAggregator, UsageRow
+from libertai_client.agentkit.ui import DeployRenderer, _fail, _run_step
+from libertai_client.utils.poll import Backoff
+from libertai_client.utils.sftp import format_bytes
+from libertai_client.utils.ssh import AsyncSSHClient, ssh_sessions
 from libertai_client.utils.typer import AsyncTyper, validate_optional_file_path_argument
 
 app: AsyncTyper = AsyncTyper(name="agentkit", help="Deploy and manage AgentKit agents on Aleph Cloud")
 
 console = Console()
 
-MIN_USDC_FUNDING = 1.0
-
 
 @app.command()
 async def deploy(
@@ -64,265 +88,134 @@ async def deploy(
         "--register-only",
         help="Only create the Aleph instance, skip SSH deployment",
     ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue an interrupted deploy from its journal instead of starting over",
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="Refetch Aleph metadata instead of using the local cache",
+    ),
+    full_rebuild: bool = typer.Option(
+        False,
+        "--full-rebuild",
+        help="Rebuild every compose service, even those whose files didn't change",
+    ),
+    replicas: int = typer.Option(
+        1,
+        "--replicas",
+        min=1,
+        help="Number of instances to deploy the agent on, each on a distinct CRN",
+    ),
+    vcpus: int = typer.Option(
+        None,
+        "--vcpus",
+        min=1,
+        help="vCPUs of the instance (default: sized from docker-compose.yml)",
+    ),
+    memory: int = typer.Option(
+        None,
+        "--memory",
+        min=512,
+        help="Memory of the instance in MiB (default: sized from docker-compose.yml)",
+    ),
+    no_pool: bool = typer.Option(
+        False,
+        "--no-pool",
+        help="Create a new instance even if the warm pool has one ready",
+    ),
 ) -> None:
     """Deploy an AgentKit agent to Aleph Cloud with credit-based payment."""
-    if path is None:
-        path = Path.cwd()
-    path = path.resolve()
-    env_path = path / ".env.prod"
+    renderer = DeployRenderer()
 
-    if not register_only:
-        compose_file = path / "docker-compose.yml"
-        if not compose_file.exists():
-            compose_file = path / "docker-compose.yaml"
-        if not compose_file.exists():
-            rprint(
-                "[red]No docker-compose.yml found in agent directory. "
-                "A docker-compose.yml is required for deployment.[/red]"
-            )
-            raise typer.Exit(1)
-
-    console.rule("[bold blue]LibertAI AgentKit Deployment")
-    rprint()
-
-    step = 0
-    ssh_client: paramiko.SSHClient | None = None
+    async def confirm_delete(resources: ExistingResources) -> bool:
+        return typer.confirm("  Delete existing resources and proceed?", default=True)
 
     try:
-        # Step 1: Wallet setup
-        step += 1
-        rprint(f"[bold]Step {step}:[/bold] Setting up Base wallet...")
-        try:
-            existing = load_existing_wallet(path)
-            if existing:
-                address, private_key = existing
-                rprint(f"  [green]Using existing wallet:[/green] {address}")
-                env_vars = None
-            else:
-                address, private_key = generate_wallet()
-                rprint(f"  [green]Wallet generated:[/green] {address}")
-                env_vars = {"WALLET_PRIVATE_KEY": private_key}
-        except Exception as e:
-            _fail("Setting up Base wallet", e)
-        rprint()
-
-        # Step 2: Write .env.prod (only if new wallet)
-        if env_vars is not None:
-            step += 1
-            rprint(f"[bold]Step {step}:[/bold] Configuring agent environment...")
-            try:
-                existing_env: dict[str, str | None] = {}
-                if env_path.exists():
-                    existing_env = dict(dotenv_values(env_path))
-                existing_env.update(env_vars)
-                env_content = (
-                    "\n".join(f"{k}={v}" for k, v in existing_env.items() if v) + "\n"
-                )
-                os.makedirs(path, exist_ok=True)
-                fd = os.open(env_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
-                with os.fdopen(fd, "w") as f:
-                    f.write(env_content)
-                rprint(
-                    f"  [green]Saved to {env_path}[/green] "
-                    "[yellow](contains wallet private key — keep secure)[/yellow]"
-                )
-            except Exception as e:
-                _fail("Configuring agent environment", e)
-            rprint()
-
-        # Step 3: Check existing Aleph resources
-        account = get_aleph_account(private_key)
-        crn = DEFAULT_CRN
-
-        resources = await _run_step(
-            "Checking for existing Aleph resources",
-            fn=lambda: check_existing_resources(account),
+        deployer = Deployer(
+            path if path is not None else Path.cwd(),
+            ssh_pubkey_path=ssh_pubkey_path,
+            credits_amount=credits_amount,
+            register_only=register_only,
+            resume=resume,
+            refresh_metadata=no_cache,
+            full_rebuild=full_rebuild,
+            replicas=replicas,
+            vcpus=vcpus,
+            memory=memory,
+            on_event=renderer,
+            confirm_delete=confirm_delete,
+            pool=None if no_pool else WarmPool(),
         )
+    except ValueError as e:
+        rprint(f"[red]{e}[/red]")
+        raise typer.Exit(1) from None
 
-        if resources.has_any:
-            rprint(f"  [yellow]Found existing resources: {resources.summary}[/yellow]")
-            delete = typer.confirm(
-                "  Delete existing resources and proceed?", default=True
-            )
-            if not delete:
-                rprint(
-                    "  [red]Cannot proceed with existing resources. Use a different wallet.[/red]"
-                )
-                raise typer.Exit(1)
-            await _run_step(
-                "Deleting existing resources",
-                fn=lambda: delete_existing_resources(account, resources),
-            )
-        rprint()
-
-        # Step 4: Check USDC balance
-        usdc_balance = get_usdc_balance(address)
-
-        if usdc_balance < MIN_USDC_FUNDING:
-            step += 1
-            rprint(f"[bold]Step {step}:[/bold] Fund your agent wallet")
-            rprint()
-            rprint(
-                Panel(
-                    f"[bold]Send USDC (Base) to:[/bold]\n\n"
-                    f"  [cyan]{address}[/cyan]\n\n"
-                    f"This USDC will be used to buy Aleph Cloud credits.\n\n"
-                    f"[dim]Minimum required: {MIN_USDC_FUNDING} USDC[/dim]",
-                    title="[bold yellow]Fund Agent Wallet[/bold yellow]",
-                    border_style="yellow",
-                )
-            )
-            rprint()
-            usdc_balance = await asyncio.to_thread(
-                wait_for_usdc_funding, address, MIN_USDC_FUNDING
-            )
-            rprint(f"  [green]Received {usdc_balance:.2f} USDC[/green]")
-        else:
-            rprint(f"  [dim]USDC balance: {usdc_balance:.2f} — sufficient[/dim]")
-        rprint()
-
-        # Step 5: Check / buy Aleph credits
-        step += 1
-        rprint(f"[bold]Step {step}:[/bold] Aleph credits...")
-        rprint()
+    console.rule("[bold blue]LibertAI AgentKit Deployment")
+    rprint()
+    try:
+        result = await deployer.run()
+    except DeployError as e:
+        renderer.fail(e)
+    finally:
+        renderer.close()
 
-        try:
-            balance_usd = await get_credit_balance(address)
-            rprint(f"  [dim]Current balance: ${balance_usd:.2f}[/dim]")
-        except Exception:
-            balance_usd = 0.0
-            rprint("  [dim]Could not fetch credit balance, will purchase[/dim]")
-
-        if balance_usd < credits_amount:
-            payment_client = create_payment_client(private_key)
-            result = await _run_step(
-                f"Buying ${credits_amount:.2f} of Aleph credits",
-                fn=lambda: buy_credits(payment_client, address, credits_amount),
-            )
-            rprint(f"  [dim]Credits purchased: {result}[/dim]")
-        else:
-            rprint(f"  [dim]Balance ${balance_usd:.2f} — sufficient, skipping purchase[/dim]")
+    if result.replicas:
+        healthy = [replica for replica in result.replicas if replica.ok]
         rprint()
-
-        # Step 6: Create Aleph Cloud instance
-        step += 1
-        rprint(f"[bold]Step {step}:[/bold] Creating Aleph Cloud instance...")
+        console.rule(
+            "[bold green]Deployment Complete"
+            if result.ok
+            else "[bold yellow]Deployment Partially Complete"
+        )
         rprint()
-
-        if ssh_pubkey_path is not None:
-            ssh_pubkey = ssh_pubkey_path.expanduser().read_text().strip()
-        else:
-            ssh_pubkey = get_user_ssh_pubkey()
-
-        if not ssh_pubkey:
-            _fail(
-                "Resolving SSH public key",
-                RuntimeError(
-                    "No SSH public key found. Use --ssh-key or generate one (e.g. ssh-keygen)"
-                ),
-            )
-
-        instance_msg = await _run_step(
-            "Creating Aleph instance",
-            fn=lambda: create_instance(account, crn, ssh_pubkey=ssh_pubkey),
+        endpoints = "\n".join(
+            f"  {replica.instance_ip}  [dim]{replica.instance_hash}[/dim]" for replica in healthy
         )
-        instance_hash = instance_msg.item_hash
-        explorer_url = f"https://explorer.aleph.cloud/address/ETH/{address}/message/INSTANCE/{instance_hash}"
         rprint(
-            f"  [dim]Instance: [link={explorer_url}]{instance_hash}[/link][/dim]"
-        )
-
-        await _run_step(
-            "Notifying CRN for allocation",
-            fn=lambda: notify_allocation(crn, instance_hash),
-        )
-
-        instance_ip = await _run_step(
-            "Waiting for instance to come up",
-            fn=lambda: wait_for_instance(crn, instance_hash),
-        )
-        rprint(f"  [dim]Instance IP: {instance_ip}[/dim]")
-
-        if register_only:
-            rprint()
-            console.rule("[bold green]Instance Registered")
-            rprint()
-            rprint(
-                Panel(
-                    f"[bold]Agent Address:[/bold]    [cyan]{address}[/cyan]\n"
-                    f"[bold]Instance IP:[/bold]      {instance_ip}\n"
-                    f"[bold]Instance Hash:[/bold]    {instance_hash}\n"
-                    f"[bold]Network:[/bold]          Base Mainnet\n"
-                    f"\n"
-                    f"[dim]Use 'libertai agentkit deploy' without --register-only to also deploy code.[/dim]",
-                    title="[bold green]LibertAI AgentKit Instance[/bold green]",
-                    border_style="green",
-                )
+            Panel(
+                f"[bold]Agent Address:[/bold]    [cyan]{result.address}[/cyan]\n"
+                f"[bold]Replicas:[/bold]         {len(healthy)}/{replicas} running\n"
+                f"[bold]Network:[/bold]          Base Mainnet\n"
+                f"[bold]Endpoints:[/bold]\n{endpoints or '  none'}",
+                title="[bold green]LibertAI AgentKit Agent[/bold green]",
+                border_style="green" if result.ok else "yellow",
             )
-            return
-
-        # Step 7: Deploy agent code via SSH
-        step += 1
-        rprint()
-        rprint(f"[bold]Step {step}:[/bold] Deploying agent code...")
-        rprint()
-
-        ssh_key_path = ssh_pubkey_path if ssh_pubkey_path is not None else None
-        ssh_client = await _run_step(
-            "Waiting for SSH",
-            fn=lambda: asyncio.to_thread(wait_for_ssh, instance_ip, ssh_key_path),
         )
-        assert ssh_client is not None
-        client = ssh_client
-
-        await _run_step(
-            "Uploading agent code",
-            fn=lambda: asyncio.to_thread(upload_agent, client, path),
-        )
-        await _run_step(
-            "Deploying agent code",
-            fn=lambda: asyncio.to_thread(deploy_code, client),
-        )
-        await _run_step(
-            "Installing Docker",
-            fn=lambda: asyncio.to_thread(install_docker, client),
-        )
-        await _run_step(
-            "Starting agent",
-            fn=lambda: asyncio.to_thread(start_agent, client),
-        )
-
-        is_active = await _run_step(
-            "Verifying agent is running",
-            fn=lambda: asyncio.to_thread(verify_service, client),
-        )
-        if not is_active:
-            _fail(
-                "Verifying agent is running",
-                RuntimeError("libertai-agentkit service failed to start"),
-            )
-
-        ssh_client.close()
-        ssh_client = None
+        if not result.ok:
+            raise typer.Exit(1)
+        return
 
-        # Step 8: Success summary
-        rprint()
-        console.rule("[bold green]Deployment Complete")
+    details = (
+        f"[bold]Agent Address:[/bold]    [cyan]{result.address}[/cyan]\n"
+        f"[bold]Instance IP:[/bold]      {result.instance_ip}\n"
+        f"[bold]Instance Hash:[/bold]    {result.instance_hash}\n"
+        f"[bold]Network:[/bold]          Base Mainnet\n"
+    )
+    rprint()
+    if result.registered_only:
+        console.rule("[bold green]Instance Registered")
         rprint()
         rprint(
             Panel(
-                f"[bold]Agent Address:[/bold]    [cyan]{address}[/cyan]\n"
-                f"[bold]Instance IP:[/bold]      {instance_ip}\n"
-                f"[bold]Instance Hash:[/bold]    {instance_hash}\n"
-                f"[bold]Network:[/bold]          Base Mainnet\n"
-                f"[bold]Service:[/bold]          [green]Docker (running)[/green]",
-                title="[bold green]LibertAI AgentKit Agent[/bold green]",
+                f"{details}\n"
+                f"[dim]Use 'libertai agentkit deploy --resume' without --register-only to also deploy code.[/dim]",
+                title="[bold green]LibertAI AgentKit Instance[/bold green]",
                 border_style="green",
             )
         )
-    finally:
-        if ssh_client is not None:
-            ssh_client.close()
+        return
+    console.rule("[bold green]Deployment Complete")
+    rprint()
+    rprint(
+        Panel(
+            f"{details}[bold]Service:[/bold]          [green]Docker (running)[/green]",
+            title="[bold green]LibertAI AgentKit Agent[/bold green]",
+            border_style="green",
+        )
+    )
 
 
 @app.command()
@@ -355,13 +248,21 @@ async def stop(
         fn=lambda: check_existing_resources(account),
     )
 
-    if not resources.has_any:
+    pool = WarmPool()
+    claimed = pool.claimed_by(path)
+    if claimed is not None:
+        rprint(f"  Warm pool instance: {claimed.instance_hash}")
+
+    if not resources.has_any and claimed is None:
         rprint()
         rprint("[green]No active resources found — nothing to stop.[/green]")
         raise typer.Exit(0)
 
     rprint()
-    rprint(f"  [yellow]Will stop: {resources.summary}[/yellow]")
+    summary = resources.summary if resources.has_any else ""
+    if claimed is not None:
+        summary = f"{summary} and the warm pool instance" if summary else "the warm pool instance"
+    rprint(f"  [yellow]Will stop: {summary}[/yellow]")
     rprint()
 
     confirm = typer.confirm("  Proceed with stopping the agent?", default=False)
@@ -371,12 +272,757 @@ async def stop(
 
     rprint()
 
-    await _run_step(
-        "Deleting resources",
-        fn=lambda: delete_existing_resources(account, resources),
-    )
+    async def delete_resources() -> None:
+        await confirm_all(await delete_existing_resources(account, resources))
+
+    await _run_step("Deleting resources", fn=delete_resources)
+    if claimed is not None:
+        await _run_step("Deleting the warm pool instance", fn=lambda: pool.release(path))
+    journal = DeployJournal.load(path)
+    if journal is not None:
+        journal.clear()
+    AgentState.clear(path)
 
     rprint()
     console.rule("[bold green]Agent Stopped")
     rprint()
     rprint(f"  [green]All resources for {address} have been cleaned up.[/green]")
+
+
+async def _resolve_hosts(path: Path, host: str | None) -> list[str]:
+    """IPs of the agent instances: --host, the last deploy's, or looked up from the wallet."""
+    if host is not None:
+        return [host]
+    state = AgentState.load(path)
+    if state is not None and state.hosts:
+        return state.hosts
+    existing = load_existing_wallet(path)
+    if not existing:
+        rprint("[red]No wallet found in .env.prod or .env, pass the instance IP with --host.[/red]")
+        raise typer.Exit(1)
+    account = get_aleph_account(existing[1])
+    return await _run_step(
+        "Looking up the agent instances",
+        fn=lambda: _agent_hosts(path, account),
+    )
+
+
+def _on_hosts(hosts: list[str]) -> str:
+    return hosts[0] if len(hosts) == 1 else f"{len(hosts)} instances"
+
+
+def _record_status(path: Path, status: AgentStatus, hosts: list[str]) -> None:
+    """Record the agent-level status, unless some of its known instances were left out."""
+    state = AgentState.load(path)
+    if state is not None and not set(state.hosts) <= set(hosts):
+        rprint(
+            "  [dim]Its other instances were left as they are, "
+            "the recorded agent state is unchanged.[/dim]"
+        )
+        return
+    instance_ip = hosts[0] if state is None and len(hosts) == 1 else None
+    AgentState.record(path, status, instance_ip=instance_ip)
+
+
+@app.command()
+async def pause(
+    path: Path = typer.Argument(
+        None,
+        help="Path to agent directory (default: current working directory)",
+    ),
+    ssh_pubkey_path: Path = typer.Option(
+        None,
+        "--ssh-key",
+        help="Path to SSH public key file (default: auto-detect from ~/.ssh/)",
+        callback=validate_optional_file_path_argument,
+    ),
+    host: str = typer.Option(
+        None,
+        "--host",
+        help="IP of the instance (default: every instance of the last deploy)",
+    ),
+) -> None:
+    """Stop the agent containers, keeping the instance and its Docker build cache."""
+    path = (path or Path.cwd()).resolve()
+    hosts = await _resolve_hosts(path, host)
+
+    async def pause_host(instance_ip: str) -> None:
+        async with ssh_sessions.session(
+            (instance_ip, ssh_pubkey_path), wait_for_ssh, instance_ip, ssh_pubkey_path, 60
+        ) as client:
+            await client.call(pause_agent)
+
+    await _run_step(
+        f"Stopping the agent containers on {_on_hosts(hosts)}",
+        fn=lambda: asyncio.gather(*(pause_host(ip) for ip in hosts)),
+    )
+    rprint(
+        f"  [green]Agent paused on {_on_hosts(hosts)}.[/green] "
+        "[dim]The instances keep running and billing, `agentkit resume` starts it again.[/dim]"
+    )
+    _record_status(path, "paused", hosts)
+
+
+@app.command()
+async def resume(
+    path: Path = typer.Argument(
+        None,
+        help="Path to agent directory (default: current working directory)",
+    ),
+    ssh_pubkey_path: Path = typer.Option(
+        None,
+        "--ssh-key",
+        help="Path to SSH public key file (default: auto-detect from ~/.ssh/)",
+        callback=validate_optional_file_path_argument,
+    ),
+    host: str = typer.Option(
+        None,
+        "--host",
+        help="IP of the instance (default: every instance of the last deploy)",
+    ),
+) -> None:
+    """Start the containers of a paused agent again."""
+    path = (path or Path.cwd()).resolve()
+    hosts = await _resolve_hosts(path, host)
+    started_at = time.monotonic()
+
+    async def resume_host(instance_ip: str) -> None:
+        async with ssh_sessions.session(
+            (instance_ip, ssh_pubkey_path), wait_for_ssh, instance_ip, ssh_pubkey_path, 60
+        ) as client:
+            await client.call(resume_agent)
+            if not await client.call(verify_service):
+                raise RuntimeError(f"libertai-agentkit service failed to start on {instance_ip}")
+
+    await _run_step(
+        f"Starting the agent containers on {_on_hosts(hosts)}",
+        fn=lambda: asyncio.gather(*(resume_host(ip) for ip in hosts)),
+    )
+    rprint(
+        f"  [green]Agent running again on {_on_hosts(hosts)} "
+        f"after {time.monotonic() - started_at:.1f}s.[/green]"
+    )
+    _record_status(path, "running", hosts)
+
+
+async def _host_status(
+    instance_ip: str, ssh_pubkey_path: Path | None
+) -> dict[str, Any]:
+    services: dict[str, str] | None = None
+    error = None
+    try:
+        async with ssh_sessions.session(
+            (instance_ip, ssh_pubkey_path), wait_for_ssh, instance_ip, ssh_pubkey_path, 30
+        ) as client:
+            services = await client.call(service_states)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e or repr(e)}"
+
+    if services is None:
+        current = "unreachable"
+    elif services and all(value == "running" for value in services.values()):
+        current = "running"
+    elif any(value == "running" for value in services.values()):
+        current = "degraded"
+    elif services:
+        current = "paused"
+    else:
+        current = "no containers"
+    return {"instance_ip": instance_ip, "status": current, "services": services, "error": error}
+
+
+@app.command()
+async def status(
+    path: Path = typer.Argument(
+        None,
+        help="Path to agent directory (default: current working directory)",
+    ),
+    ssh_pubkey_path: Path = typer.Option(
+        None,
+        "--ssh-key",
+        help="Path to SSH public key file (default: auto-detect from ~/.ssh/)",
+        callback=validate_optional_file_path_argument,
+    ),
+    host: str = typer.Option(
+        None,
+        "--host",
+        help="IP of the instance (default: every instance of the last deploy)",
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Print the status as JSON"),
+) -> None:
+    """Show whether the agent is running or paused, as recorded and as seen on the instances."""
+    path = (path or Path.cwd()).resolve()
+    state = AgentState.load(path)
+    if state is None and host is None:
+        if as_json:
+            print(json.dumps({"status": "not deployed"}))
+        else:
+            rprint("Agent not deployed from this directory, or stopped")
+        raise typer.Exit(1)
+    hosts = await _resolve_hosts(path, host)
+    instances = await asyncio.gather(*(_host_status(ip, ssh_pubkey_path) for ip in hosts))
+
+    # What the instances report wins over the local record, e.g. after a reboot
+    statuses = {instance["status"] for instance in instances}
+    current = statuses.pop() if len(statuses) == 1 else "mixed"
+    recorded = state.status if state is not None else None
+    crns = {r.instance_ip: r.crn_url for r in state.replicas} if state is not None else {}
+
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "status": current,
+                    "recorded_status": recorded,
+                    "instance_hash": state.instance_hash if state else None,
+                    "instances": [
+                        {**instance, "crn_url": crns.get(instance["instance_ip"])}
+                        for instance in instances
+                    ],
+                },
+                indent=2,
+            )
+        )
+    else:
+        color = {"running": "green", "paused": "yellow"}.get(current, "red")
+        rprint(f"[bold]Agent:[/bold]     [{color}]{current}[/{color}]")
+        if recorded is not None and recorded != current:
+            rprint(f"  [dim]Recorded as {recorded} by the last deploy, pause or resume[/dim]")
+        if state is not None and state.instance_hash and not state.replicas:
+            rprint(f"[bold]Instance:[/bold]  {state.instance_hash}")
+        for instance in instances:
+            crn = crns.get(instance["instance_ip"])
+            rprint(
+                f"[bold]IP:[/bold]        {instance['instance_ip']}"
+                + (f" [dim]on {crn}[/dim]" if crn else "")
+                + (f" ({instance['status']})" if len(instances) > 1 else "")
+            )
+            for service, service_state in sorted((instance["services"] or {}).items()):
+                rprint(f"  {service}: {service_state}")
+            if instance["error"] is not None:
+                rprint(f"  [red]{instance['error']}[/red]")
+    if current not in ("running", "paused"):
+        raise typer.Exit(1)
+
+
+async def _agent_hosts(path: Path, account: ETHAccount) -> list[str]:
+    """IPs of the agent instances, the primary first.
+
+    Replicas can be on any CRN, so the ones recorded by the last deploy come
+    first, then the instance claimed from the warm pool, then the one owned by
+    the agent wallet on the default CRN.
+    """
+    state = AgentState.load(path)
+    if state is not None and state.hosts:
+        return state.hosts
+    claimed = WarmPool().claimed_by(path)
+    if claimed is not None and claimed.instance_ip is not None:
+        return [claimed.instance_ip]
+    return [await find_instance_ip(account, DEFAULT_CRN)]
+
+
+async def _agent_instance_ip(path: Path, account: ETHAccount) -> str:
+    """IP of the primary agent instance."""
+    return (await _agent_hosts(path, account))[0]
+
+
+async def _sync_changes(
+    client: AsyncSSHClient,
+    instance_ip: str,
+    path: Path,
+    compose_file: Path,
+    changed: set[str],
+    manifest: dict[str, str] | None,
+) -> None:
+    """Push changed paths and restart what they affect, keeping the remote manifest current.
+
+    Without a known remote `manifest`, none is written and the next deploy
+    rebuilds everything.
+    """
+    started_at = time.monotonic()
+    plan = plan_restart(compose_file.name, load_services(compose_file), changed)
+    size = await client.call(push_files, path, changed)
+    await client.call(restart_services, plan)
+    if manifest is not None:
+        await asyncio.to_thread(update_manifest, manifest, path, changed)
+        await client.call(write_remote_manifest, manifest)
+    rprint(
+        f"  [green]✔[/green] Synced {len(changed)} file{'s' if len(changed) > 1 else ''} "
+        f"to {instance_ip} "
+        f"[dim]({format_bytes(size)}), restarted {plan.summary} "
+        f"in {time.monotonic() - started_at:.1f}s[/dim]"
+    )
+
+
+@app.command()
+async def dev(
+    path: Path = typer.Argument(
+        None,
+        help="Path to agent directory (default: current working directory)",
+    ),
+    ssh_pubkey_path: Path = typer.Option(
+        None,
+        "--ssh-key",
+        help="Path to SSH public key file (default: auto-detect from ~/.ssh/)",
+        callback=validate_optional_file_path_argument,
+    ),
+    host: str = typer.Option(
+        None,
+        "--host",
+        help="IP of the instance (default: every instance of the last deploy)",
+    ),
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        help="Keep running and sync every change as it happens",
+    ),
+    debounce_ms: int = typer.Option(
+        300,
+        "--debounce-ms",
+        help="Quiet period in milliseconds grouping a burst of changes into one sync",
+    ),
+) -> None:
+    """Push local changes to a deployed agent and restart only the services they affect."""
+    if path is None:
+        path = Path.cwd()
+    path = path.resolve()
+
+    compose_file = find_compose_file(path)
+    if compose_file is None:
+        rprint("[red]No docker-compose.yml found in agent directory.[/red]")
+        raise typer.Exit(1)
+
+    # Replicas all get the same changes
+    hosts = await _resolve_hosts(path, host)
+
+    if not watch:
+
+        async def sync_host(instance_ip: str, local_manifest: dict[str, str]) -> None:
+            # A running daemon keeps the session open for the next sync
+            async with ssh_sessions.session(
+                (instance_ip, ssh_pubkey_path),
+                wait_for_ssh,
+                instance_ip,
+                ssh_pubkey_path,
+                60,
+            ) as ssh_client:
+                # Without a remote manifest every file counts as changed
+                remote_manifest = await ssh_client.call(read_remote_manifest) or {}
+                changed = diff_manifests(remote_manifest, local_manifest)
+                if not changed:
+                    rprint(f"  [green]✔[/green] Agent on {instance_ip} already up to date")
+                    return
+                await _sync_changes(
+                    ssh_client, instance_ip, path, compose_file, changed, remote_manifest
+                )
+
+        try:
+            local_manifest = await asyncio.to_thread(agent_manifest, path)
+            await asyncio.gather(*(sync_host(ip, local_manifest) for ip in hosts))
+        except Exception as e:
+            _fail("Syncing agent code", e)
+        return
+
+    async def connect(instance_ip: str) -> AsyncSSHClient:
+        return await AsyncSSHClient.open(wait_for_ssh, instance_ip, ssh_pubkey_path, 60)
+
+    connected = await _run_step(
+        f"Connecting over SSH to {_on_hosts(hosts)}",
+        fn=lambda: asyncio.gather(*(connect(ip) for ip in hosts)),
+    )
+    clients: dict[str, AsyncSSHClient] = dict(zip(hosts, connected))
+
+    async def watch_sync(instance_ip: str, changed: set[str]) -> None:
+        try:
+            client = clients[instance_ip]
+            if not client.is_active:
+                await client.close()
+                client = clients[instance_ip] = await connect(instance_ip)
+            await _sync_changes(
+                client, instance_ip, path, compose_file, changed, manifests[instance_ip]
+            )
+        except Exception as e:
+            # Keep watching, the next save usually fixes it
+            console.print(f"  [red]✘[/red] Syncing {len(changed)} changed files to {instance_ip}")
+            console.print(f"    [red]{type(e).__name__}: {e or repr(e)}[/red]")
+
+    try:
+        manifests = {ip: await client.call(read_remote_manifest) for ip, client in clients.items()}
+        is_agent_file = agent_file_filter(path)
+        rprint(f"  [dim]Watching {path} for changes, press Ctrl+C to stop[/dim]")
+        async for changes in awatch(
+            path,
+            watch_filter=lambda _change, changed_path: is_agent_file(
+                os.path.relpath(changed_path, path)
+            ),
+            debounce=debounce_ms,
+        ):
+            # Only the final state of each path matters, whatever happened in between
+            changed = {os.path.relpath(changed_path, path) for _change, changed_path in changes}
+            await asyncio.gather(*(watch_sync(ip, changed) for ip in clients))
+    finally:
+        for client in clients.values():
+            await client.close()
+
+
+@app.command()
+async def bench(
+    path: Path = typer.Argument(
+        None,
+        help="Path to agent directory (default: current working directory)",
+    ),
+    url: str = typer.Option(
+        None,
+        "--url",
+        help="URL to load (default: first published port of the deployed agent)",
+    ),
+    endpoint: str = typer.Option("/", "--endpoint", help="Path requested on the agent"),
+    method: str = typer.Option("GET", "--method", help="HTTP method"),
+    body: str = typer.Option(None, "--body", help="Request body"),
+    concurrency: int = typer.Option(10, "--concurrency", min=1, help="Requests in flight at most"),
+    rps: float = typer.Option(
+        None, "--rps", min=0.1, help="Target request rate (default: as fast as concurrency allows)"
+    ),
+    requests: int = typer.Option(
+        None, "--requests", min=1, help="Number of requests to send (default: 200)"
+    ),
+    duration: float = typer.Option(
+        None, "--duration", min=0.1, help="Seconds to run for instead of a request count"
+    ),
+    timeout: float = typer.Option(30.0, "--timeout", help="Timeout of each request in seconds"),
+    as_json: bool = typer.Option(False, "--json", help="Print the report as JSON"),
+) -> None:
+    """Load test a deployed agent and report latency percentiles, throughput and errors."""
+    if path is None:
+        path = Path.cwd()
+    path = path.resolve()
+
+    if url is None:
+        compose_file = find_compose_file(path)
+        ports = [
+            port
+            for service in (load_services(compose_file) if compose_file else [])
+            for port in service.published_ports
+        ]
+        if not ports:
+            rprint("[red]No published port found in docker-compose.yml, pass --url.[/red]")
+            raise typer.Exit(1)
+        existing = load_existing_wallet(path)
+        if not existing:
+            rprint("[red]No wallet found in .env.prod or .env, pass --url.[/red]")
+            raise typer.Exit(1)
+        account = get_aleph_account(existing[1])
+        try:
+            instance_ip = await _agent_instance_ip(path, account)
+        except Exception as e:
+            _fail("Looking up the agent instance", e)
+        url = f"http://[{instance_ip}]:{ports[0]}/{endpoint.lstrip('/')}"
+
+    if requests is None and duration is None:
+        requests = 200
+    if not as_json:
+        target = f"{requests} requests" if requests is not None else f"{duration:g}s"
+        rate = f"{rps:g} req/s" if rps is not None else "closed loop"
+        rprint(f"  [dim]Loading {url} for {target}, {concurrency} concurrent, {rate}[/dim]")
+
+    result = await run_load(
+        url,
+        method=method.upper(),
+        concurrency=concurrency,
+        rps=rps,
+        total=requests,
+        duration=duration,
+        timeout=timeout,
+        body=body.encode() if body is not None else None,
+    )
+
+    if as_json:
+        print(json.dumps({"url": url, **result.as_dict()}, indent=2))
+    else:
+        table = Table("Metric", "Value", title="Load test")
+        table.add_row("Requests", str(result.requests))
+        table.add_row("Duration", f"{result.duration:.2f}s")
+        table.add_row("Throughput", f"{result.throughput:.1f} req/s")
+        for q in [50, 95, 99]:
+            latency = result.percentile(q)
+            table.add_row(f"p{q}", f"{latency * 1000:.1f} ms" if latency is not None else "-")
+        table.add_row("Error rate", f"{result.error_rate:.1%}")
+        for status, count in sorted(result.statuses.items()):
+            table.add_row(f"HTTP {status}", str(count))
+        for error, count in result.errors.most_common():
+            table.add_row(error, str(count))
+        console.print(table)
+
+    if result.requests and result.failures == result.requests:
+        raise typer.Exit(1)
+
+
+def _top_table(rows: list[UsageRow], connections: dict[str, str], interval: float) -> Table:
+    table = Table(
+        "Service",
+        "Containers",
+        "CPU",
+        "Memory",
+        "Net in",
+        "Net out",
+        title=f"AgentKit top [dim](every {interval:g}s, Ctrl+C to quit)[/dim]",
+        box=None,
+        padding=(0, 2),
+    )
+    previous_scope = "service"
+    for row in rows:
+        # Services first, then one line per instance and the total
+        if row.scope != previous_scope:
+            table.add_section()
+            previous_scope = row.scope
+        table.add_row(
+            f"[cyan]{row.name}[/cyan]" if row.scope == "instance" else row.name,
+            str(row.containers),
+            f"{row.cpu_percent:.1f}%",
+            format_bytes(row.memory),
+            f"{format_bytes(row.net_rx_rate)}/s",
+            f"{format_bytes(row.net_tx_rate)}/s",
+            style="bold" if row.scope == "total" else None,
+        )
+    for host, state in sorted(connections.items()):
+        if state != "streaming":
+            table.add_row(f"[cyan]{host}[/cyan]", f"[yellow]{state}[/yellow]")
+    return table
+
+
+async def _stream_stats(
+    client: AsyncSSHClient,
+    host: str,
+    aggregator: StatsAggregator,
+    connections: dict[str, str],
+) -> None:
+    loop = asyncio.get_running_loop()
+    services = await client.call(container_services)
+    refreshing: set[str] = set()
+
+    async def refresh_services(container: str) -> None:
+        # A container started since the stream began, e.g. a recreated service
+        services.update(await client.call(container_services))
+        refreshing.discard(container)
+
+    def handle(report: dict[str, Any], at: float) -> None:
+        sample = ContainerSample.from_report(
+            host, report, services.get(str(report.get("Name"))), at
+        )
+        if sample.container not in services and sample.container not in refreshing:
+            refreshing.add(sample.container)
+            asyncio.ensure_future(refresh_services(sample.container))
+        connections[host] = "streaming"
+        aggregator.add(sample)
+
+    await client.call(
+        stream_container_stats,
+        # Called on the SSH executor, the samples are handled on the loop
+        lambda report: loop.call_soon_threadsafe(handle, report, time.monotonic()),
+    )
+
+
+async def _stream_instance(
+    host: str,
+    ssh_pubkey_path: Path | None,
+    aggregator: StatsAggregator,
+    connections: dict[str, str],
+) -> None:
+    """Feed the aggregator from one instance, reconnecting whenever the stream drops."""
+    delays = Backoff(initial=1.0, maximum=30.0).delays()
+    while True:
+        connections[host] = "connecting"
+        try:
+            client = await AsyncSSHClient.open(wait_for_ssh, host, ssh_pubkey_path, 60)
+            async with client:
+                await _stream_stats(client, host, aggregator, connections)
+            error = "stream closed"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e or repr(e)}"
+        aggregator.forget_host(host)
+        connections[host] = f"reconnecting ({error})"
+        await asyncio.sleep(next(delays))
+
+
+@app.command()
+async def top(
+    path: Path = typer.Argument(
+        None,
+        help="Path to agent directory (default: current working directory)",
+    ),
+    ssh_pubkey_path: Path = typer.Option(
+        None,
+        "--ssh-key",
+        help="Path to SSH public key file (default: auto-detect from ~/.ssh/)",
+        callback=validate_optional_file_path_argument,
+    ),
+    hosts: list[str] = typer.Option(
+        None,
+        "--host",
+        help="IP of an instance, repeat for several (default: look up the wallet's Aleph instance)",
+    ),
+    interval: float = typer.Option(2.0, "--interval", min=0.2, help="Seconds between refreshes"),
+    output: Path = typer.Option(
+        None,
+        "--output",
+        help="Append every refresh to this file, one JSON line per row",
+    ),
+) -> None:
+    """Stream CPU, memory and network use of the agent containers, per service and instance."""
+    if path is None:
+        path = Path.cwd()
+    path = path.resolve()
+
+    if not hosts:
+        existing = load_existing_wallet(path)
+        if not existing:
+            rprint("[red]No wallet found in .env.prod or .env, pass the instance IP with --host.[/red]")
+            raise typer.Exit(1)
+        account = get_aleph_account(existing[1])
+        hosts = await _run_step(
+            "Looking up the agent instances",
+            fn=lambda: _agent_hosts(path, account),
+        )
+
+    aggregator = StatsAggregator(stale_after=max(15.0, interval * 3))
+    connections: dict[str, str] = {}
+    streams = [
+        asyncio.create_task(_stream_instance(host, ssh_pubkey_path, aggregator, connections))
+        for host in dict.fromkeys(hosts)
+    ]
+    try:
+        with (
+            open(output, "a") if output is not None else nullcontext() as series,
+            Live(console=console, auto_refresh=False) as live,
+        ):
+            while True:
+                rows = aggregator.rows(time.monotonic())
+                live.update(_top_table(rows, connections, interval), refresh=True)
+                if series is not None and rows[-1].containers:
+                    now = time.time()
+                    for row in rows:
+                        series.write(json.dumps({"time": now, **row.as_dict()}) + "\n")
+                    series.flush()
+                await asyncio.sleep(interval)
+    finally:
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+
+
+pool_app: AsyncTyper = AsyncTyper(
+    name="pool", help="Keep Docker-ready instances warm so that deploys skip provisioning"
+)
+app.add_typer(pool_app)
+
+
+@pool_app.command("fill")
+async def pool_fill(
+    size: int = typer.Option(..., "--size", min=0, help="Number of warm instances to keep"),
+    ssh_pubkey_path: Path = typer.Option(
+        None,
+        "--ssh-key",
+        help="Path to SSH public key file (default: auto-detect from ~/.ssh/)",
+        callback=validate_optional_file_path_argument,
+    ),
+    vcpus: int = typer.Option(2, "--vcpus", min=1, help="vCPUs of the warm instances"),
+    memory: int = typer.Option(4096, "--memory", min=512, help="Memory of the warm instances in MiB"),
+    credits_amount: float = typer.Option(
+        1.0,
+        "--credits",
+        help="Amount in USD of Aleph credits to buy per instance",
+    ),
+) -> None:
+    """Provision warm instances until the pool holds --size of them.
+
+    The pool wallet pays for them, deploys then keep it at that size in the background.
+    Only deploys using the same SSH key can claim the instances.
+    """
+    if ssh_pubkey_path is not None:
+        ssh_pubkey = ssh_pubkey_path.expanduser().read_text().strip()
+    else:
+        ssh_pubkey = get_user_ssh_pubkey()
+    if not ssh_pubkey:
+        rprint("[red]No SSH public key found. Use --ssh-key or generate one (e.g. ssh-keygen)[/red]")
+        raise typer.Exit(1)
+
+    console.rule("[bold blue]LibertAI AgentKit Warm Pool")
+    rprint()
+    renderer = DeployRenderer()
+    pool = WarmPool(on_event=renderer)
+    try:
+        instances = await pool.fill(
+            PoolSettings(
+                size=size,
+                vcpus=vcpus,
+                memory=memory,
+                ssh_pubkey=ssh_pubkey,
+                ssh_pubkey_path=str(ssh_pubkey_path) if ssh_pubkey_path is not None else None,
+                credits_amount=credits_amount,
+            )
+        )
+    except DeployError as e:
+        renderer.fail(e)
+    finally:
+        renderer.close()
+    if any(instance.status == "failed" for instance in instances):
+        raise typer.Exit(1)
+
+
+@pool_app.command("status")
+def pool_status(
+    as_json: bool = typer.Option(False, "--json", help="Print the pool as JSON"),
+) -> None:
+    """Show the warm instances and the agents that claimed them."""
+    pool = WarmPool()
+    settings, instances = pool.instances()
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "size": settings.size,
+                    "instances": [asdict(instance) for instance in instances],
+                },
+                indent=2,
+            )
+        )
+        return
+
+    table = Table("ID", "Status", "Size", "Instance IP", "Age", "Claimed by", box=None, padding=(0, 2))
+    now = time.time()
+    for instance in instances:
+        status: str = "stale" if instance.stale else instance.status
+        if status == "ready":
+            status = "[green]ready[/green]"
+        elif status in ("failed", "stale"):
+            status = f"[red]{status}[/red] [dim]{instance.error or ''}[/dim]"
+        table.add_row(
+            instance.id,
+            status,
+            f"{instance.vcpus} vCPU, {instance.memory} MiB",
+            instance.instance_ip or "-",
+            f"{(now - instance.created_at) / 60:.0f} min",
+            instance.claimed_by or "-",
+        )
+    ready = sum(1 for instance in instances if instance.status == "ready")
+    rprint(f"[bold]Warm pool:[/bold] {ready}/{settings.size} ready")
+    if instances:
+        console.print(table)
+
+
+@pool_app.command("drain")
+async def pool_drain() -> None:
+    """Stop refilling the pool and delete the instances no agent claimed."""
+    pool = WarmPool()
+    _settings, instances = pool.instances()
+    unclaimed = [instance for instance in instances if instance.status != "claimed"]
+    if unclaimed and not typer.confirm(
+        f"  Delete {len(unclaimed)} unclaimed warm instances?", default=False
+    ):
+        rprint("  [dim]Aborted.[/dim]")
+        raise typer.Exit(0)
+    deleted = await _run_step("Draining the warm pool", fn=pool.drain)
+    kept = len(unclaimed) - len(deleted)
+    rprint(f"  [green]Deleted {len(deleted)} warm instances.[/green]")
+    if kept:
+        rprint(f"  [yellow]{kept} instances are still being provisioned, drain again once they are done.[/yellow]")
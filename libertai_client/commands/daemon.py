@@ -0,0 +1,104 @@
+import subprocess
+import sys
+from typing import Any
+
+import rich
+import typer
+from rich.console import Console
+
+from libertai_client.cli import DAEMON_COMMANDS, connect_daemon, daemon_request
+from libertai_client.config import config
+from libertai_client.utils.poll import Backoff, Deadline, poll_blocking
+from libertai_client.utils.typer import AsyncTyper
+
+app = AsyncTyper(
+    name="daemon",
+    help="Keep a background process with warm sessions to speed up repeated commands",
+)
+
+err_console = Console(stderr=True)
+
+DAEMON_START_TIMEOUT = 30
+
+
+def _request(message: dict[str, Any]) -> dict[str, Any] | None:
+    """Reply of the daemon, None when it isn't running."""
+    try:
+        with connect_daemon(timeout=5) as sock:
+            return next(daemon_request(sock, message), None)
+    except OSError:
+        return None
+
+
+def _wait_until(running: bool) -> bool:
+    try:
+        poll_blocking(
+            lambda: (_request({"op": "ping"}) is not None) == running,
+            "Daemon " + ("start" if running else "stop"),
+            Deadline(DAEMON_START_TIMEOUT),
+            Backoff(initial=0.05, factor=1.5, maximum=1.0),
+        )
+    except TimeoutError:
+        return False
+    return True
+
+
+@app.command()
+def start():
+    """
+    Start the daemon in the background
+
+    It keeps running until stopped or after an hour without commands. It reads
+    the LIBERTAI_CLIENT_* settings once, restart it after changing them.
+    """
+    info = _request({"op": "ping"})
+    if info is not None:
+        rich.print(f"[green]Daemon already running (PID {info['pid']})")
+        return
+
+    log_path = config.CACHE_DIR / "daemon.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "ab") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "libertai_client.daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+    if not _wait_until(running=True):
+        err_console.print(f"[red]The daemon didn't start, see {log_path}")
+        raise typer.Exit(1)
+    commands = ", ".join(" ".join(command) for command in sorted(DAEMON_COMMANDS))
+    rich.print(f"[green]Daemon started, listening on {config.DAEMON_SOCKET}")
+    rich.print(f"[dim]Served by the daemon: {commands}")
+
+
+@app.command()
+def stop():
+    """
+    Stop the daemon
+    """
+    if _request({"op": "shutdown"}) is None:
+        rich.print("Daemon not running")
+        return
+    if not _wait_until(running=False):
+        err_console.print("[red]The daemon didn't stop in time")
+        raise typer.Exit(1)
+    rich.print("[green]Daemon stopped")
+
+
+@app.command()
+def status():
+    """
+    Show whether the daemon is running
+    """
+    info = _request({"op": "ping"})
+    if info is None:
+        rich.print("Daemon not running, commands run in-process")
+        raise typer.Exit(1)
+    rich.print(f"[bold]Daemon running[/bold] (PID {info['pid']})")
+    rich.print(f"  Socket:        {info['socket']}")
+    rich.print(f"  Uptime:        {info['uptime'] / 60:.0f} min")
+    rich.print(f"  Commands:      {info['commands']}")
+    rich.print(f"  SSH sessions:  {info['ssh_sessions']}")
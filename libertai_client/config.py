@@ -1,9 +1,23 @@
 import os
+from pathlib import Path
 
 
 class _Config:
     AGENTS_BACKEND_URL: str
     DEPLOY_SCRIPT_URL: str
+    CACHE_DIR: Path
+    AGENT_CACHE_TTL: float
+    METADATA_CACHE_MAX_BYTES: int
+    ARTIFACT_CACHE_MAX_BYTES: int
+    SSH_PORT: int
+    DAEMON_SOCKET: Path
+    DAEMON_IDLE_TIMEOUT: float
+    USE_DAEMON: bool
+    BASE_RPC_URL: str
+    LIBERTAI_API_BASE: str
+    ALEPH_API_URLS: list[str]
+    CRN_URL: str
+    CRN_LIST_URL: str
 
     def __init__(self):
         self.AGENTS_BACKEND_URL = os.getenv(
@@ -13,6 +27,53 @@ class _Config:
             "LIBERTAI_CLIENT_DEPLOY_SCRIPT_URL",
             "https://raw.githubusercontent.com/Libertai/libertai-agents/refs/heads/main/deployment/deploy.sh",
         )
+        self.CACHE_DIR = Path(
+            os.getenv(
+                "LIBERTAI_CLIENT_CACHE_DIR",
+                Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "libertai",
+            )
+        )
+
+        self.AGENT_CACHE_TTL = float(
+            os.getenv("LIBERTAI_CLIENT_AGENT_CACHE_TTL", "30")
+        )
+        self.METADATA_CACHE_MAX_BYTES = int(
+            os.getenv("LIBERTAI_CLIENT_METADATA_CACHE_MAX_BYTES", str(1024 * 1024))
+        )
+        self.ARTIFACT_CACHE_MAX_BYTES = int(
+            os.getenv("LIBERTAI_CLIENT_ARTIFACT_CACHE_MAX_BYTES", str(512 * 1024 * 1024))
+        )
+        self.SSH_PORT = int(os.getenv("LIBERTAI_CLIENT_SSH_PORT", "22"))
+
+        runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+        self.DAEMON_SOCKET = Path(
+            os.getenv(
+                "LIBERTAI_CLIENT_DAEMON_SOCKET",
+                Path(runtime_dir) / "libertai" / "daemon.sock"
+                if runtime_dir
+                else self.CACHE_DIR / "daemon.sock",
+            )
+        )
+        self.DAEMON_IDLE_TIMEOUT = float(
+            os.getenv("LIBERTAI_CLIENT_DAEMON_IDLE_TIMEOUT", str(60 * 60))
+        )
+        self.USE_DAEMON = os.getenv("LIBERTAI_CLIENT_NO_DAEMON", "") in ("", "0")
+
+        # Endpoints used by AgentKit, the offline harness points them at its stand-ins
+        self.BASE_RPC_URL = os.getenv(
+            "LIBERTAI_CLIENT_BASE_RPC_URL", "https://mainnet.base.org"
+        )
+        self.LIBERTAI_API_BASE = os.getenv(
+            "LIBERTAI_CLIENT_API_BASE", "https://api.libertai.io"
+        )
+        self.ALEPH_API_URLS = os.getenv(
+            "LIBERTAI_CLIENT_ALEPH_API_URLS",
+            "https://api2.aleph.im,https://api3.aleph.im",
+        ).split(",")
+        self.CRN_URL = os.getenv("LIBERTAI_CLIENT_CRN_URL", "https://crn10.leviathan.so")
+        self.CRN_LIST_URL = os.getenv(
+            "LIBERTAI_CLIENT_CRN_LIST_URL", "https://crns-list.aleph.sh/crns.json"
+        )
 
 
 config = _Config()
@@ -0,0 +1,265 @@
+"""Resident process serving `libertai` commands over a Unix socket.
+
+Started in the background by `libertai daemon start`, or in the foreground
+with `python -m libertai_client.daemon`. Commands run one at a time on a
+long-lived event loop, so they reuse the imported SDKs, the shared HTTP
+session and the SSH sessions opened by the previous commands. Their output is
+streamed back to the `libertai` process that sent them.
+"""
+
+import asyncio
+import io
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+from collections.abc import Coroutine
+from concurrent.futures import CancelledError, Future
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from libertai_client.cli import connect_daemon, daemon_eligible
+from libertai_client.config import config
+from libertai_client.utils.http import http_sessions
+from libertai_client.utils.ssh import ssh_sessions
+from libertai_client.utils.typer import set_coroutine_runner
+
+# How often the idle timeout is checked
+IDLE_CHECK_INTERVAL = 30
+
+
+class _Request:
+    """A command being run for a client, which receives its output."""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        writer: asyncio.StreamWriter,
+        tty: bool,
+    ) -> None:
+        self.loop = loop
+        self.writer = writer
+        self.tty = tty
+        self.cancelled = False
+        self.futures: list[Future[Any]] = []
+
+    def send(self, reply: dict[str, Any]) -> None:
+        """Queue a reply to the client, safe to call from any thread."""
+        data = json.dumps(reply).encode() + b"\n"
+        self.loop.call_soon_threadsafe(self._write, data)
+
+    def _write(self, data: bytes) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        for future in self.futures:
+            future.cancel()
+
+
+class _RoutedStream(io.TextIOBase):
+    """Replaces stdout or stderr, sending what is written to the current client.
+
+    Requests are served one at a time, so whatever thread writes, the output
+    belongs to the current request. Outside of a request it goes to the log.
+    """
+
+    def __init__(self, daemon: "Daemon", name: str, fallback: Any) -> None:
+        self._daemon = daemon
+        self._name = name
+        self._fallback = fallback
+
+    def write(self, text: str) -> int:
+        request = self._daemon.current
+        if request is None:
+            return self._fallback.write(text)
+        request.send({self._name: text})
+        return len(text)
+
+    def flush(self) -> None:
+        if self._daemon.current is None:
+            self._fallback.flush()
+
+    def isatty(self) -> bool:
+        request = self._daemon.current
+        # Consoles created on import pick their color system from TERM
+        return True if request is None else request.tty
+
+
+class Daemon:
+    def __init__(self, socket_path: Path, idle_timeout: float) -> None:
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.started_at = time.time()
+        self.commands_served = 0
+        self.current: _Request | None = None
+        self._last_active = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "socket": str(self.socket_path),
+            "uptime": time.time() - self.started_at,
+            "commands": self.commands_served,
+            "ssh_sessions": len(ssh_sessions),
+        }
+
+    def _claim_socket(self) -> None:
+        if self.socket_path.exists():
+            try:
+                connect_daemon(timeout=1).close()
+            except OSError:
+                # Left behind by a daemon that didn't exit cleanly
+                self.socket_path.unlink()
+            else:
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    def _run_coroutine(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Run an async command on the daemon loop, from the request thread."""
+        request = self.current
+        if request is not None and request.cancelled:
+            coro.close()
+            raise CancelledError()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if request is not None:
+            request.futures.append(future)
+        return future.result()
+
+    def _invoke(self, command: Any, argv: list[str], message: dict[str, Any]) -> int:
+        os.chdir(message["cwd"])
+        # Read by the rich consoles for their width
+        for name in ("COLUMNS", "LINES"):
+            if message.get(name.lower()):
+                os.environ[name] = str(message[name.lower()])
+            else:
+                os.environ.pop(name, None)
+        try:
+            command.main(args=argv, prog_name="libertai", standalone_mode=True)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            print(e.code, file=sys.stderr)
+            return 1
+        except CancelledError:
+            return 130
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+    async def _run(
+        self,
+        command: Any,
+        message: dict[str, Any],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        argv = [str(arg) for arg in message.get("argv", [])]
+        if not daemon_eligible(argv):
+            writer.write(b'{"stderr": "This command can\'t run in the daemon.\\n"}\n')
+            writer.write(b'{"exit": 2}\n')
+            return
+
+        async with self._lock:
+            request = self.current = _Request(
+                self.loop, writer, bool(message.get("tty"))
+            )
+            try:
+                invocation = asyncio.ensure_future(
+                    asyncio.to_thread(self._invoke, command, argv, message)
+                )
+                # The client only closes its end when it gives up on the command
+                disconnected = asyncio.ensure_future(reader.read())
+                await asyncio.wait(
+                    {invocation, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not invocation.done():
+                    request.cancel()
+                disconnected.cancel()
+                exit_code = await invocation
+            finally:
+                self.current = None
+                self.commands_served += 1
+                self._last_active = time.monotonic()
+            # After the output, which reaches the writer through the loop's queue
+            await asyncio.sleep(0)
+            writer.write(json.dumps({"exit": exit_code}).encode() + b"\n")
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            message = json.loads(await reader.readline())
+            op = message.get("op")
+            if op == "run":
+                await self._run(self._command, message, reader, writer)
+            elif op == "ping":
+                writer.write(json.dumps(self.describe()).encode() + b"\n")
+            elif op == "shutdown":
+                writer.write(b'{"ok": true}\n')
+                self._stopping.set()
+            else:
+                writer.write(json.dumps({"error": f"Unknown operation {op!r}"}).encode() + b"\n")
+            await writer.drain()
+        except (ValueError, AttributeError, ConnectionError):
+            # Malformed request or the client went away
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        # Imported here so that the consoles are created with the routed streams
+        from libertai_client.main import app
+
+        self._command = typer.main.get_command(app)
+        http_sessions.keep_alive()
+        ssh_sessions.keep_alive()
+        set_coroutine_runner(self._run_coroutine)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self._stopping.set)
+
+        self._claim_socket()
+        # Only the user may talk to the daemon, it acts with their keys
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        finally:
+            os.umask(umask)
+
+        print(f"libertai daemon {os.getpid()} listening on {self.socket_path}", flush=True)
+        try:
+            async with server:
+                while not self._stopping.is_set():
+                    try:
+                        await asyncio.wait_for(
+                            self._stopping.wait(), timeout=IDLE_CHECK_INTERVAL
+                        )
+                    except TimeoutError:
+                        idle = time.monotonic() - self._last_active
+                        if not self._lock.locked() and idle > self.idle_timeout:
+                            print("Idle timeout reached, exiting", flush=True)
+                            break
+        finally:
+            self.socket_path.unlink(missing_ok=True)
+            await http_sessions.close()
+            await ssh_sessions.close()
+
+
+def run_daemon() -> None:
+    daemon = Daemon(config.DAEMON_SOCKET, config.DAEMON_IDLE_TIMEOUT)
+    sys.stdout = _RoutedStream(daemon, "stdout", sys.stdout)
+    sys.stderr = _RoutedStream(daemon, "stderr", sys.stderr)
+    asyncio.run(daemon.serve())
+
+
+if __name__ == "__main__":
+    run_daemon()
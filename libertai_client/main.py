@@ -1,8 +1,9 @@
 import typer
 
-from libertai_client.commands import agent, agentkit
+from libertai_client.commands import agent, agentkit, daemon
 
 app = typer.Typer(help="Simple CLI to interact with LibertAI products")
 
 app.add_typer(agent.app)
 app.add_typer(agentkit.app)
+app.add_typer(daemon.app)
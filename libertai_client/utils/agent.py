@@ -1,10 +1,16 @@
+import json
 import os
-import zipfile
+from collections.abc import Iterator
+from http import HTTPStatus
+from pathlib import Path
 
+import aiohttp
 from pathspec import pathspec
 
+from libertai_client.config import config
 from libertai_client.interfaces.agent import AgentConfig
-from libertai_client.utils.system import get_full_path
+from libertai_client.utils.artifacts import artifact_cache, manifest_key, write_zip
+from libertai_client.utils.system import get_full_path, write_file_atomic
 
 
 def parse_agent_config_env(env: dict[str, str | None]) -> AgentConfig:
@@ -22,7 +28,8 @@ AGENT_ZIP_BLACKLIST = [".git", ".idea", ".vscode"]
 AGENT_ZIP_WHITELIST = [".env"]
 
 
-def create_agent_zip(src_dir: str, zip_name: str):
+def iter_agent_zip_files(src_dir: str) -> Iterator[str]:
+    """Relative paths of the files of a project that go into its zip."""
     try:
         # Read and parse the .gitignore file
         with open(get_full_path(src_dir, ".gitignore"), "r") as gitignore_file:
@@ -35,15 +42,59 @@ def create_agent_zip(src_dir: str, zip_name: str):
         "gitwildmatch", gitignore_patterns.splitlines() + AGENT_ZIP_BLACKLIST
     )
 
-    with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(src_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, src_dir)
-
-                # Check if the file matches any .gitignore pattern
-                if (
-                    not spec.match_file(relative_path)
-                    or relative_path in AGENT_ZIP_WHITELIST
-                ):
-                    zipf.write(file_path, arcname=relative_path)
+    for root, _, files in os.walk(src_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, src_dir)
+
+            # Check if the file matches any .gitignore pattern
+            if not spec.match_file(relative_path) or relative_path in AGENT_ZIP_WHITELIST:
+                yield relative_path
+
+
+def pack_agent_zip(src_dir: str) -> Path:
+    """Zip of a project, packed once per version of its files and kept in the artifact cache."""
+    files = list(iter_agent_zip_files(src_dir))
+    archive, _cached = artifact_cache.get_or_pack(
+        manifest_key(Path(src_dir), files, "agent.zip"),
+        ".zip",
+        lambda f: write_zip(Path(src_dir), files, f),
+    )
+    return archive
+
+
+async def fetch_deploy_script(session: aiohttp.ClientSession) -> str:
+    """Return the local path of the deploy script, revalidating the cached copy with its ETag."""
+    cache_dir = config.CACHE_DIR / "deploy-script"
+    script_path = cache_dir / "deploy.sh"
+    meta_path = cache_dir / "deploy.json"
+
+    meta: dict[str, str] = {}
+    if script_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            meta = {}
+        if meta.get("url") != config.DEPLOY_SCRIPT_URL:
+            meta = {}
+
+    headers = {"If-None-Match": meta["etag"]} if "etag" in meta else {}
+    try:
+        async with session.get(config.DEPLOY_SCRIPT_URL, headers=headers) as response:
+            if response.status == HTTPStatus.NOT_MODIFIED and meta:
+                return str(script_path)
+            response.raise_for_status()
+            content = await response.read()
+            etag = response.headers.get("ETag")
+    except aiohttp.ClientError:
+        # Keep deploying with the last known script if GitHub is unreachable
+        if meta:
+            return str(script_path)
+        raise
+
+    write_file_atomic(script_path, content)
+    new_meta = {"url": config.DEPLOY_SCRIPT_URL}
+    if etag is not None:
+        new_meta["etag"] = etag
+    write_file_atomic(meta_path, json.dumps(new_meta).encode())
+    return str(script_path)
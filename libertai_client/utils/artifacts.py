@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import BinaryIO
+
+from libertai_client.config import config
+from libertai_client.utils.cache import evict_lru
+
+# Timestamp of every archive entry, the earliest one zip files can hold
+ARCHIVE_MTIME = 315532800  # 1980-01-01
+# Bumped when the archive layout changes, so older cached archives are not reused
+ARCHIVE_FORMAT_VERSION = 1
+
+
+def manifest_key(root: Path, files: Iterable[str], kind: str) -> str:
+    """Key of an archive of `files`, from their path, size, mtime and mode.
+
+    Reading the stat of every file is much cheaper than packing them, and any
+    edit changes the size or the mtime.
+    """
+    entries = []
+    for rel in sorted(files):
+        stat = os.lstat(root / rel)
+        entries.append([Path(rel).as_posix(), stat.st_size, stat.st_mtime_ns, stat.st_mode])
+    payload = json.dumps([ARCHIVE_FORMAT_VERSION, kind, entries]).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def write_tar_gz(root: Path, files: Iterable[str], f: BinaryIO) -> None:
+    """Pack files into a gzipped tarball which only depends on their content and mode."""
+    with (
+        gzip.GzipFile(filename="", mode="wb", fileobj=f, mtime=0) as gz,
+        tarfile.open(fileobj=gz, mode="w", format=tarfile.PAX_FORMAT) as tf,
+    ):
+        for rel in sorted(files):
+            info = tf.gettarinfo(root / rel, arcname=Path(rel).as_posix())
+            info.mtime = ARCHIVE_MTIME
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            if info.isreg():
+                with open(root / rel, "rb") as source:
+                    tf.addfile(info, source)
+            else:
+                tf.addfile(info)
+
+
+def write_zip(root: Path, files: Iterable[str], f: BinaryIO) -> None:
+    """Pack files into a zip archive which only depends on their content and mode."""
+    with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as zf:
+        for rel in sorted(files):
+            info = zipfile.ZipInfo(Path(rel).as_posix(), date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (os.stat(root / rel).st_mode & 0xFFFF) << 16
+            with open(root / rel, "rb") as source, zf.open(info, "w") as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+class ArtifactCache:
+    """On-disk cache of packed agent archives, keyed by `manifest_key`.
+
+    Deploying the same tree to several instances, or again after a failure,
+    packs it once. Evicted like `MetadataCache` once past `max_bytes`.
+    Archives can hold the agent's .env.prod, so only the user can read them.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        self.directory = directory or config.CACHE_DIR / "artifacts"
+        self.max_bytes = (
+            max_bytes if max_bytes is not None else config.ARTIFACT_CACHE_MAX_BYTES
+        )
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get_or_pack(
+        self, key: str, suffix: str, pack: Callable[[BinaryIO], None]
+    ) -> tuple[Path, bool]:
+        """Path of the cached archive and whether it was already there, packing it otherwise.
+
+        Concurrent calls for one key in this process pack it only once.
+        """
+        path = self.directory / f"{key}{suffix}"
+        with self._lock(key):
+            try:
+                os.utime(path)
+                return path, True
+            except FileNotFoundError:
+                pass
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pack(f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        # Temporary files of concurrent packs start with a dot
+        archives = (p for p in self.directory.iterdir() if not p.name.startswith("."))
+        evict_lru(archives, self.max_bytes, keep=path)
+        return path, False
+
+    def clear(self) -> None:
+        if self.directory.exists():
+            for path in self.directory.iterdir():
+                path.unlink(missing_ok=True)
+
+
+artifact_cache = ArtifactCache()
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import time
+from http import HTTPStatus
+from pathlib import Path
+from uuid import UUID
+
+import aiohttp
+from pydantic import ValidationError
+
+from libertai_client.config import config
+from libertai_client.interfaces.agent import GetAgentResponse
+from libertai_client.utils.http import http_sessions
+from libertai_client.utils.system import write_file_atomic
+
+
+class BackendError(Exception):
+    pass
+
+
+def _agent_cache_path(agent_id: str) -> Path:
+    # One directory per backend so switching backends doesn't serve the other one's agents
+    backend = hashlib.sha256(config.AGENTS_BACKEND_URL.encode()).hexdigest()[:16]
+    # Normalizing through UUID also guarantees a safe file name
+    return config.CACHE_DIR / "agents" / backend / f"{UUID(agent_id)}.json"
+
+
+def load_cached_agent(
+    agent_id: str, max_age: float | None = None
+) -> GetAgentResponse | None:
+    """Return the cached agent payload if it is younger than max_age seconds."""
+    if max_age is None:
+        max_age = config.AGENT_CACHE_TTL
+    if max_age <= 0:
+        return None
+    try:
+        data = json.loads(_agent_cache_path(agent_id).read_text())
+        if time.time() - data["fetched_at"] > max_age:
+            return None
+        return GetAgentResponse(**data["agent"])
+    except (
+        FileNotFoundError,
+        ValueError,
+        KeyError,
+        TypeError,
+        ValidationError,
+    ):
+        return None
+
+
+def store_cached_agent(agent: GetAgentResponse) -> None:
+    payload = {"fetched_at": time.time(), "agent": agent.model_dump(mode="json")}
+    write_file_atomic(_agent_cache_path(str(agent.id)), json.dumps(payload).encode())
+
+
+async def fetch_agent(
+    session: aiohttp.ClientSession, agent_id: str, max_age: float | None = None
+) -> GetAgentResponse:
+    try:
+        UUID(agent_id)
+    except ValueError:
+        raise BackendError(f"Invalid agent ID '{agent_id}'")
+
+    cached = load_cached_agent(agent_id, max_age)
+    if cached is not None:
+        return cached
+
+    async with session.get(
+        f"{config.AGENTS_BACKEND_URL}/agents/{agent_id}",
+        headers={"accept": "application/json"},
+    ) as response:
+        if response.status != HTTPStatus.OK:
+            try:
+                error_message = (await response.json()).get(
+                    "detail", "An unknown error occurred."
+                )
+            except aiohttp.ContentTypeError:
+                error_message = await response.text()
+            raise BackendError(error_message)
+        agent = GetAgentResponse(**(await response.json()))
+
+    store_cached_agent(agent)
+    return agent
+
+
+async def fetch_agents(
+    agent_ids: list[str], max_age: float | None = None, concurrency: int = 16
+) -> dict[str, GetAgentResponse | Exception]:
+    """Fetch several agents concurrently over one pooled session, keyed by the requested ID."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(session: aiohttp.ClientSession, agent_id: str) -> GetAgentResponse:
+        async with semaphore:
+            return await fetch_agent(session, agent_id, max_age)
+
+    async with http_sessions.session() as session:
+        results = await asyncio.gather(
+            *(limited(session, agent_id) for agent_id in agent_ids),
+            return_exceptions=True,
+        )
+    output: dict[str, GetAgentResponse | Exception] = {}
+    for agent_id, result in zip(agent_ids, results):
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            raise result
+        output[agent_id] = result
+    return output
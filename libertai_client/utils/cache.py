@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+from libertai_client.config import config
+from libertai_client.utils.system import write_file_atomic
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def evict_lru(paths: Iterable[Path], max_bytes: int, keep: Path | None = None) -> None:
+    """Delete the least recently used files, by mtime, until they fit in `max_bytes`.
+
+    `keep` counts towards the size but is never deleted.
+    """
+    entries = []
+    total = 0
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        total += stat.st_size
+        if path != keep:
+            entries.append((stat.st_mtime, stat.st_size, path))
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+class MetadataCache:
+    """On-disk cache of small JSON values that rarely change, like Aleph metadata.
+
+    Each entry is a file holding its own TTL and a checksum of its value, so a
+    truncated or edited entry is treated as a miss. Reads refresh the file's
+    mtime, which is used to evict the least recently used entries once the
+    directory grows past `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        self.directory = directory or config.CACHE_DIR / "metadata"
+        self.max_bytes = (
+            max_bytes if max_bytes is not None else config.METADATA_CACHE_MAX_BYTES
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get(self, key: str) -> Any | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+            if entry["key"] != key or _digest(entry["value"]) != entry["sha256"]:
+                path.unlink(missing_ok=True)
+                return None
+            if time.time() - entry["stored_at"] > entry["ttl"]:
+                return None
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        entry = {
+            "key": key,
+            "stored_at": time.time(),
+            "ttl": ttl,
+            "sha256": _digest(value),
+            "value": value,
+        }
+        try:
+            write_file_atomic(self._path(key), json.dumps(entry).encode())
+            evict_lru(self.directory.glob("*.json"), self.max_bytes)
+        except OSError:
+            # A read-only or full cache directory must not break the lookup itself
+            pass
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        ttl: float,
+        fetch: Callable[[], Awaitable[Any]],
+        refresh: bool = False,
+    ) -> Any:
+        """Return the cached value, or fetch and store it. `refresh` skips the lookup."""
+        value = None if refresh else self.get(key)
+        if value is None:
+            value = await fetch()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,45 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+# Long enough for a burst of commands to reuse the TLS connections
+SHARED_KEEPALIVE_TIMEOUT = 300
+
+
+class SessionPool:
+    """Hands out aiohttp sessions to commands.
+
+    By default every command gets its own session, closed when it is done. The
+    daemon calls `keep_alive` so that commands share one session instead, and
+    with it the open connections to the backend, Aleph and the CRNs.
+    """
+
+    def __init__(self) -> None:
+        self.shared = False
+        self._session: aiohttp.ClientSession | None = None
+
+    def keep_alive(self) -> None:
+        self.shared = True
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[aiohttp.ClientSession]:
+        if not self.shared:
+            async with aiohttp.ClientSession() as session:
+                yield session
+            return
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    keepalive_timeout=SHARED_KEEPALIVE_TIMEOUT
+                )
+            )
+        yield self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+http_sessions = SessionPool()
@@ -0,0 +1,116 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import dataclass
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """Point in time shared by several waits so that they draw from one budget."""
+
+    def __init__(self, timeout: float | None = None) -> None:
+        self.started_at = time.monotonic()
+        self.expires_at = math.inf if timeout is None else self.started_at + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def cap(self, seconds: float) -> float:
+        return min(seconds, self.remaining())
+
+
+@dataclass
+class Backoff:
+    """Exponential delays between attempts, each randomized by +/- `jitter`."""
+
+    initial: float = 0.5
+    factor: float = 2.0
+    maximum: float = 10.0
+    jitter: float = 0.2
+
+    def delays(self) -> Iterator[float]:
+        delay = self.initial
+        while True:
+            yield delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(delay * self.factor, self.maximum)
+
+
+def _timeout_error(
+    description: str, deadline: Deadline, last_error: BaseException | None
+) -> TimeoutError:
+    message = f"{description} timed out after {deadline.elapsed:.0f}s"
+    if last_error is not None:
+        message += f": {last_error}"
+    return TimeoutError(message)
+
+
+async def poll(
+    check: Callable[[], Awaitable[T | None]],
+    description: str,
+    deadline: Deadline | None = None,
+    backoff: Backoff | None = None,
+    retry_on: tuple[type[Exception], ...] = (),
+) -> T:
+    """Call `check` until it returns a truthy value, backing off between attempts.
+
+    Exceptions listed in `retry_on` count as a failed attempt, anything else
+    propagates. Raises TimeoutError once the deadline passes. Cancelling the
+    awaiting task stops the polling immediately.
+    """
+    deadline = deadline or Deadline()
+    last_error: BaseException | None = None
+    for delay in (backoff or Backoff()).delays():
+        try:
+            result = await check()
+            if result:
+                return result
+        except retry_on as e:
+            last_error = e
+        if deadline.expired:
+            raise _timeout_error(description, deadline, last_error) from last_error
+        await asyncio.sleep(deadline.cap(delay))
+    raise AssertionError("unreachable")
+
+
+def poll_blocking(
+    check: Callable[[], T | None],
+    description: str,
+    deadline: Deadline | None = None,
+    backoff: Backoff | None = None,
+    retry_on: tuple[type[Exception], ...] = (),
+    cancelled: threading.Event | None = None,
+) -> T:
+    """Blocking counterpart of `poll`, for code running on an executor thread.
+
+    Setting `cancelled` stops the polling with an InterruptedError before the
+    next attempt, the thread can't be interrupted otherwise.
+    """
+    deadline = deadline or Deadline()
+    cancelled = cancelled or threading.Event()
+    last_error: BaseException | None = None
+    for delay in (backoff or Backoff()).delays():
+        if cancelled.is_set():
+            raise InterruptedError(f"{description} was cancelled")
+        try:
+            result = check()
+            if result:
+                return result
+        except retry_on as e:
+            last_error = e
+        if deadline.expired:
+            raise _timeout_error(description, deadline, last_error) from last_error
+        cancelled.wait(deadline.cap(delay))
+    raise AssertionError("unreachable")
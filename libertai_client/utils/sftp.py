@@ -0,0 +1,289 @@
+import hashlib
+import math
+import os
+import shlex
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import paramiko
+
+# Larger than paramiko's 2 MiB default so that high-latency links are not capped
+# by the SSH channel window before the SFTP pipeline fills up.
+SFTP_WINDOW_SIZE = 16 * 1024 * 1024
+SFTP_MAX_PACKET_SIZE = 64 * 1024
+# Range handed to an upload stream at a time, written as 32 KiB SFTP write requests
+STREAM_CHUNK_SIZE = 1024 * 1024
+DEFAULT_STREAMS = 4
+# How far below the remote size holes left by parallel streams can be
+RESUME_MARGIN = 16 * 1024 * 1024
+# Minimum delay between two progress callbacks, in seconds
+PROGRESS_INTERVAL = 0.1
+
+
+def format_bytes(size: float) -> str:
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ["KB", "MB"]:
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GB"
+
+
+@dataclass
+class TransferProgress:
+    total: int
+    transferred: int = 0
+    resumed_from: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second sent during this run, excluding the resumed prefix."""
+        elapsed = self.elapsed
+        if elapsed <= 0:
+            return 0.0
+        return (self.transferred - self.resumed_from) / elapsed
+
+    @property
+    def eta(self) -> float | None:
+        rate = self.rate
+        if rate <= 0:
+            return None
+        return (self.total - self.transferred) / rate
+
+    def describe(self) -> str:
+        text = f"{format_bytes(self.transferred)} / {format_bytes(self.total)}, {format_bytes(self.rate)}/s"
+        eta = self.eta
+        if eta is not None and self.transferred < self.total:
+            text += f", ETA {eta:.0f}s"
+        if self.resumed_from:
+            text += f" (resumed at {format_bytes(self.resumed_from)})"
+        return text
+
+
+def open_sftp(client: paramiko.SSHClient) -> paramiko.SFTPClient:
+    transport = client.get_transport()
+    if transport is None or not transport.is_active():
+        raise paramiko.SSHException("SSH session is not active")
+    sftp = paramiko.SFTPClient.from_transport(
+        transport,
+        window_size=SFTP_WINDOW_SIZE,
+        max_packet_size=SFTP_MAX_PACKET_SIZE,
+    )
+    if sftp is None:
+        raise paramiko.SSHException("Could not open an SFTP session")
+    return sftp
+
+
+def _local_prefix_sha256(local_path: str, length: int) -> str:
+    digest = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(1024 * 1024, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest.hexdigest()
+
+
+def _remote_prefix_sha256(
+    client: paramiko.SSHClient, remote_path: str, length: int
+) -> str | None:
+    _stdin, stdout, _stderr = client.exec_command(
+        f"head -c {length} {shlex.quote(remote_path)} | sha256sum"
+    )
+    output = stdout.read().decode().strip()
+    if stdout.channel.recv_exit_status() != 0 or not output:
+        return None
+    return output.split()[0]
+
+
+def _resume_offset(
+    client: paramiko.SSHClient,
+    sftp: paramiko.SFTPClient,
+    local_path: str,
+    remote_path: str,
+    total: int,
+) -> int:
+    try:
+        remote_size = sftp.stat(remote_path).st_size or 0
+    except FileNotFoundError:
+        return 0
+    if remote_size > total:
+        return 0
+    # Parallel streams may leave unwritten holes just below the remote size,
+    # fall back to a shorter prefix before starting over
+    for candidate in [remote_size, remote_size - RESUME_MARGIN]:
+        if candidate <= 0:
+            break
+        remote_hash = _remote_prefix_sha256(client, remote_path, candidate)
+        if remote_hash == _local_prefix_sha256(local_path, candidate):
+            return candidate
+    return 0
+
+
+class _ChunkDispatcher:
+    """Hands out file ranges in order to the upload streams and tracks progress."""
+
+    def __init__(
+        self,
+        progress: TransferProgress,
+        on_progress: Callable[[TransferProgress], None] | None,
+    ) -> None:
+        self.progress = progress
+        self.on_progress = on_progress
+        self._next_offset = progress.transferred
+        self._last_report = time.monotonic()
+        self._lock = threading.Lock()
+
+    def next_range(self) -> tuple[int, int] | None:
+        with self._lock:
+            offset = self._next_offset
+            if offset >= self.progress.total:
+                return None
+            size = min(STREAM_CHUNK_SIZE, self.progress.total - offset)
+            self._next_offset += size
+            return offset, size
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._next_offset = self.progress.total
+
+    def done(self, size: int) -> None:
+        with self._lock:
+            self.progress.transferred += size
+            now = time.monotonic()
+            if self.on_progress is None or now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+        self.on_progress(self.progress)
+
+
+def _write_ranges(
+    remote_file: paramiko.SFTPFile, local_path: str, dispatcher: _ChunkDispatcher
+) -> None:
+    # Pipelined mode sends write requests without waiting for each
+    # acknowledgement, so many requests stay in flight on the channel.
+    remote_file.set_pipelined(True)
+    with open(local_path, "rb") as local_file:
+        while (chunk := dispatcher.next_range()) is not None:
+            offset, size = chunk
+            data = os.pread(local_file.fileno(), size, offset)
+            remote_file.seek(offset)
+            remote_file.write(data)
+            dispatcher.done(len(data))
+
+
+def _extra_stream(
+    client: paramiko.SSHClient,
+    local_path: str,
+    remote_path: str,
+    dispatcher: _ChunkDispatcher,
+    errors: list[BaseException],
+) -> None:
+    try:
+        with (
+            open_sftp(client) as sftp,
+            sftp.open(remote_path, "r+") as remote_file,
+        ):
+            _write_ranges(remote_file, local_path, dispatcher)
+    except BaseException as e:
+        dispatcher.cancel()
+        errors.append(e)
+
+
+def _send(
+    client: paramiko.SSHClient,
+    sftp: paramiko.SFTPClient,
+    local_path: str,
+    remote_path: str,
+    progress: TransferProgress,
+    on_progress: Callable[[TransferProgress], None] | None,
+    streams: int,
+) -> None:
+    dispatcher = _ChunkDispatcher(progress, on_progress)
+    errors: list[BaseException] = []
+    threads: list[threading.Thread] = []
+    try:
+        with sftp.open(remote_path, "r+" if progress.transferred else "w") as remote_file:
+            # Extra streams get their own SSH channel and flow-control window, so
+            # the server's per-channel window no longer caps throughput on slow
+            # links. They open the file once it exists and ramp up while this
+            # stream is already sending.
+            for _ in range(streams - 1):
+                thread = threading.Thread(
+                    target=_extra_stream,
+                    args=(client, local_path, remote_path, dispatcher, errors),
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+            _write_ranges(remote_file, local_path, dispatcher)
+        # Closing the file waited for every outstanding write to be acknowledged
+    except BaseException:
+        dispatcher.cancel()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+    remote_size = sftp.stat(remote_path).st_size
+    if remote_size != progress.total:
+        raise OSError(
+            f"Size mismatch after upload of {remote_path}: "
+            f"{remote_size} != {progress.total}"
+        )
+    if on_progress is not None:
+        on_progress(progress)
+
+
+def put_file(
+    client: paramiko.SSHClient,
+    local_path: str,
+    remote_path: str,
+    on_progress: Callable[[TransferProgress], None] | None = None,
+    max_retries: int = 3,
+    streams: int = DEFAULT_STREAMS,
+) -> TransferProgress:
+    """Upload a file over SFTP, resuming from a partial remote copy when its content matches."""
+    total = os.path.getsize(local_path)
+    progress = TransferProgress(total=total)
+    last_error: Exception | None = None
+    for _attempt in range(max_retries):
+        try:
+            with open_sftp(client) as sftp:
+                offset = _resume_offset(client, sftp, local_path, remote_path, total)
+                progress.transferred = offset
+                if last_error is None:
+                    progress.resumed_from = offset
+                if on_progress is not None:
+                    on_progress(progress)
+                if offset < total:
+                    streams_needed = math.ceil((total - offset) / STREAM_CHUNK_SIZE)
+                    _send(
+                        client,
+                        sftp,
+                        local_path,
+                        remote_path,
+                        progress,
+                        on_progress,
+                        max(1, min(streams, streams_needed)),
+                    )
+            return progress
+        except (EOFError, OSError, paramiko.SSHException) as e:
+            last_error = e
+            transport = client.get_transport()
+            if transport is None or not transport.is_active():
+                break
+    raise RuntimeError(f"Upload of {remote_path} failed: {last_error}")
@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import inspect
+import threading
+from collections.abc import AsyncIterator, Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Concatenate, ParamSpec, Self, TypeVar
+
+import paramiko
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+@dataclass
+class CommandResult:
+    exit_status: int
+    stdout: bytes
+    stderr: bytes
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+
+def _exec(client: paramiko.SSHClient, command: str) -> CommandResult:
+    _stdin, stdout, stderr = client.exec_command(command)
+    out = stdout.read()
+    err = stderr.read()
+    return CommandResult(stdout.channel.recv_exit_status(), out, err)
+
+
+class AsyncSSHClient:
+    """Asyncio front for a paramiko session.
+
+    Blocking paramiko calls run on an executor owned by the session, so many
+    sessions can be driven from one event loop without stalling it. Cancelling
+    an awaiting coroutine closes the connection, which makes the blocked
+    paramiko call fail fast instead of leaking a busy thread.
+    """
+
+    def __init__(self, client: paramiko.SSHClient, max_workers: int = 4) -> None:
+        self.client = client
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="libertai-ssh"
+        )
+
+    @classmethod
+    async def open(
+        cls, factory: Callable[P, paramiko.SSHClient], *args: P.args, **kwargs: P.kwargs
+    ) -> "AsyncSSHClient":
+        """Build a session from a blocking function returning a connected client.
+
+        A factory taking a `cancelled` event, like `wait_for_ssh`, gets one set
+        when the open is cancelled so that it stops retrying. A client it still
+        returns after that is closed.
+        """
+        session = cls(client=paramiko.SSHClient())
+        cancelled = threading.Event()
+        if "cancelled" in inspect.signature(factory).parameters:
+            kwargs["cancelled"] = cancelled
+        future = session._executor.submit(functools.partial(factory, *args, **kwargs))
+        try:
+            session.client = await asyncio.wrap_future(future)
+        except BaseException:
+            cancelled.set()
+            future.add_done_callback(_close_result)
+            session._executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return session
+
+    async def _submit(self, fn: Callable[[], T]) -> T:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, fn)
+        except asyncio.CancelledError:
+            self.client.close()
+            raise
+
+    async def call(
+        self,
+        fn: Callable[Concatenate[paramiko.SSHClient, P], T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        """Run a blocking function taking the paramiko client as first argument."""
+        return await self._submit(functools.partial(fn, self.client, *args, **kwargs))
+
+    async def exec(self, command: str) -> CommandResult:
+        return await self.call(_exec, command)
+
+    @property
+    def is_active(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    async def close(self) -> None:
+        self.client.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_exc: object) -> None:
+        await self.close()
+
+
+def _close_result(future: "Future[paramiko.SSHClient]") -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def connect(**kwargs: Any) -> paramiko.SSHClient:
+    """Blocking connect with the keyword arguments of `paramiko.SSHClient.connect`."""
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(**kwargs)
+    return client
+
+
+class SSHSessionPool:
+    """Hands out SSH sessions to commands, keyed by whatever identifies the target.
+
+    By default a session is opened for the command and closed after it. The
+    daemon calls `keep_alive` so that authenticated sessions outlive the
+    command and the next one to the same target skips the handshake.
+    """
+
+    def __init__(self) -> None:
+        self.shared = False
+        self._sessions: dict[Hashable, AsyncSSHClient] = {}
+
+    def keep_alive(self) -> None:
+        self.shared = True
+
+    @asynccontextmanager
+    async def session(
+        self,
+        key: Hashable,
+        factory: Callable[P, paramiko.SSHClient],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> AsyncIterator[AsyncSSHClient]:
+        if not self.shared:
+            async with await AsyncSSHClient.open(factory, *args, **kwargs) as session:
+                yield session
+            return
+
+        client: AsyncSSHClient | None = self._sessions.pop(key, None)
+        if client is not None and not client.is_active:
+            await client.close()
+            client = None
+        if client is None:
+            client = await AsyncSSHClient.open(factory, *args, **kwargs)
+        try:
+            yield client
+        except BaseException:
+            # The command may have left the session half way through something
+            await client.close()
+            raise
+        self._sessions[key] = client
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def close(self) -> None:
+        sessions, self._sessions = self._sessions, {}
+        for client in sessions.values():
+            await client.close()
+
+
+ssh_sessions = SSHSessionPool()
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from pathlib import Path
 
 
 def __validate_path(path: str, with_file: bool = False) -> str:
@@ -19,3 +21,16 @@ def get_full_path(folder_path: str, file: str | None = None) -> str:
 
     path = os.path.abspath(f"{folder_path}/{file}")
     return __validate_path(path, with_file=True)
+
+
+def write_file_atomic(path: Path, content: bytes) -> None:
+    """Write a file through a unique temporary file so concurrent writers never expose a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
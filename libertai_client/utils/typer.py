@@ -1,9 +1,19 @@
 import asyncio
 import inspect
-from functools import wraps, partial
+from collections.abc import Callable, Coroutine
+from functools import partial, wraps
 from pathlib import Path
+from typing import Any
 
-from typer import Typer, BadParameter
+from typer import BadParameter, Typer
+
+# Replaced by the daemon, which runs commands on its own long-lived event loop
+_run_coroutine: Callable[[Coroutine[Any, Any, Any]], Any] = asyncio.run
+
+
+def set_coroutine_runner(runner: Callable[[Coroutine[Any, Any, Any]], Any]) -> None:
+    global _run_coroutine
+    _run_coroutine = runner
 
 
 class AsyncTyper(Typer):
@@ -13,7 +23,7 @@ class AsyncTyper(Typer):
 
             @wraps(f)
             def runner(*args, **kwargs):
-                return asyncio.run(f(*args, **kwargs))
+                return _run_coroutine(f(*args, **kwargs))
 
             decorator(runner)
         else:
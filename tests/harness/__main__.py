@@ -0,0 +1,275 @@
+"""Offline benchmarks of the AgentKit deploy pipeline.
+
+Usage, from the repository root: python -m tests.harness [deploy|sftp] --help
+
+Stand-ins for Aleph, the CRN, the Base RPC, the x402 credits endpoint and the
+instance SSH server run in-process, so no real funds or nodes are involved.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import statistics
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import paramiko
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from tests.harness.services import (
+    FakeServices,
+    FakeState,
+    FaultProfile,
+)
+from tests.harness.ssh_server import (
+    FakeSSHServer,
+    LatencyProxy,
+    SSHBehavior,
+)
+from tests.harness.workspace import write_agent, write_ssh_key
+
+SERVICES = ["aleph", "crn", "rpc", "credits"]
+
+
+@dataclass
+class DeployRun:
+    run: int
+    success: bool
+    wall_time: float
+    steps: list[tuple[str, float]]
+
+
+app = typer.Typer(help="Offline benchmarks of the AgentKit deploy pipeline")
+console = Console()
+
+
+def _start_ssh(
+    root: Path, behavior: SSHBehavior
+) -> tuple[FakeSSHServer, LatencyProxy | None, int]:
+    server = FakeSSHServer(root, behavior)
+    if behavior.latency > 0:
+        proxy = LatencyProxy(server.port, behavior.latency)
+        return server, proxy, proxy.port
+    return server, None, server.port
+
+
+@app.command()
+def deploy(
+    runs: int = typer.Option(1, help="Number of deploys to run"),
+    latency_ms: float = typer.Option(0, help="Latency added to every HTTP request"),
+    failure_rate: float = typer.Option(
+        0, help="Probability of an HTTP request failing with a 503"
+    ),
+    ssh_latency_ms: float = typer.Option(0, help="One-way latency of the SSH link"),
+    boot_delay: float = typer.Option(
+        0, help="Seconds between CRN notification and the instance getting an IP"
+    ),
+    confirmation_delay: float = typer.Option(
+        0, help="Seconds the network takes to process a posted message"
+    ),
+    docker_install_delay: float = typer.Option(
+        0, help="Seconds taken by the Docker installation script"
+    ),
+    payload_mb: float = typer.Option(1, help="Size of the agent code to upload"),
+    replicas: int = typer.Option(1, help="Number of replicas each deploy creates"),
+    concurrency: int = typer.Option(
+        1, min=1, help="Number of deploys run at once on the same event loop"
+    ),
+    pool: int = typer.Option(
+        0, min=0, help="Warm instances provisioned before the deploys, which claim them"
+    ),
+    quiet: bool = typer.Option(False, help="Hide the deploy output"),
+    as_json: bool = typer.Option(False, "--json", help="Print the report as JSON"),
+) -> None:
+    """Run full deploy pipelines against local stand-ins and report timings."""
+    if pool and concurrency > 1:
+        # Pool instances are bound to one SSH key, which the fake server maps to one root
+        raise typer.BadParameter("--pool can't be combined with --concurrency")
+    profile = FaultProfile(latency=latency_ms / 1000, failure_rate=failure_rate)
+    services = FakeServices(
+        state=FakeState(boot_delay=boot_delay, confirmation_delay=confirmation_delay),
+        profiles={name: profile for name in SERVICES},
+    )
+    services.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        ssh_server, proxy, ssh_port = _start_ssh(
+            tmp_path / "remote",
+            SSHBehavior(
+                latency=ssh_latency_ms / 1000,
+                command_delays={"install-docker": docker_install_delay},
+            ),
+        )
+        os.environ.update(services.env())
+        os.environ["LIBERTAI_CLIENT_SSH_PORT"] = str(ssh_port)
+        os.environ["LIBERTAI_CLIENT_CACHE_DIR"] = str(tmp_path / "cache")
+
+        # Imported late so the client reads the stand-in endpoints from the environment
+        from libertai_client.agentkit.deployer import Deployer, DeployError, DeployEvent
+        from libertai_client.agentkit.pool import PoolSettings, WarmPool
+        from libertai_client.agentkit.ui import DeployRenderer
+
+        agent_paths = [write_agent(tmp_path / f"agent-{run}", payload_mb) for run in range(runs)]
+        # One key per run, the SSH server keeps the files of every key apart
+        ssh_pubkeys = [write_ssh_key(tmp_path / f"key-{run}") for run in range(runs)]
+        warm_pool = None
+        if pool:
+            ssh_pubkeys = [ssh_pubkeys[0]] * runs
+            warm_pool = WarmPool(tmp_path / "pool", background_refill=False)
+            pool_started_at = time.monotonic()
+            asyncio.run(
+                warm_pool.fill(
+                    PoolSettings(
+                        size=pool,
+                        ssh_pubkey=ssh_pubkeys[0].read_text().strip(),
+                        ssh_pubkey_path=str(ssh_pubkeys[0]),
+                    )
+                )
+            )
+            console.print(f"Filled the pool with {pool} instances in {time.monotonic() - pool_started_at:.3f}s")
+
+        def on_event(run: int, event: DeployEvent) -> None:
+            if event.kind == "step_finished":
+                console.print(f"  [dim]#{run}[/dim] [green]✔[/green] {event.message}")
+            elif event.kind == "warning":
+                console.print(f"  [dim]#{run}[/dim] [yellow]{event.message}[/yellow]")
+
+        async def deploy_one(run: int, slots: asyncio.Semaphore) -> DeployRun:
+            # Concurrent deploys can't share the spinners, they print one line per step
+            renderer = DeployRenderer() if concurrency == 1 and not quiet else None
+            deployer = Deployer(
+                agent_paths[run],
+                ssh_pubkey_path=ssh_pubkeys[run],
+                replicas=replicas,
+                pool=warm_pool,
+                on_event=renderer or (None if quiet else functools.partial(on_event, run)),
+            )
+            async with slots:
+                started_at = time.monotonic()
+                try:
+                    result = await deployer.run()
+                    success = result.ok
+                except DeployError as e:
+                    console.print(f"[red]#{run} {e.step}: {e}[/red]")
+                    success = False
+                finally:
+                    if renderer is not None:
+                        renderer.close()
+            return DeployRun(
+                run=run,
+                success=success,
+                wall_time=time.monotonic() - started_at,
+                steps=deployer.steps,
+            )
+
+        async def deploy_all() -> list[DeployRun]:
+            slots = asyncio.Semaphore(concurrency)
+            return list(
+                await asyncio.gather(*(deploy_one(run, slots) for run in range(runs)))
+            )
+
+        batch_started_at = time.monotonic()
+        results = asyncio.run(deploy_all())
+        batch_time = time.monotonic() - batch_started_at
+
+        ssh_server.close()
+        if proxy is not None:
+            proxy.close()
+    services.stop()
+
+    if as_json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+        return
+
+    steps: dict[str, list[float]] = {}
+    for result in results:
+        for label, seconds in result.steps:
+            steps.setdefault(label, []).append(seconds)
+    table = Table("Step", "Mean (s)", "Max (s)", title="Per-step breakdown")
+    for label, durations in steps.items():
+        table.add_row(label, f"{statistics.mean(durations):.3f}", f"{max(durations):.3f}")
+    console.print(table)
+    wall_times = [result.wall_time for result in results]
+    succeeded = sum(1 for result in results if result.success)
+    console.print(
+        f"End-to-end: mean {statistics.mean(wall_times):.3f}s, "
+        f"max {max(wall_times):.3f}s, {succeeded}/{runs} succeeded"
+    )
+    if concurrency > 1:
+        console.print(f"All {runs} deploys, {concurrency} at a time: {batch_time:.3f}s")
+
+
+@app.command()
+def sftp(
+    size_mb: float = typer.Option(16, help="Size of the uploaded file"),
+    latency_ms: float = typer.Option(25, help="One-way latency of the SSH link"),
+) -> None:
+    """Compare a plain paramiko put with the pipelined, resumable upload."""
+    from libertai_client.utils.sftp import format_bytes, put_file
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        ssh_server, proxy, ssh_port = _start_ssh(
+            tmp_path / "remote", SSHBehavior(latency=latency_ms / 1000)
+        )
+        ssh_pubkey = write_ssh_key(tmp_path)
+        local_file = tmp_path / "payload.bin"
+        local_file.write_bytes(os.urandom(int(size_mb * 1024 * 1024)))
+        remote_file = "/tmp/payload.bin"
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            "::1",
+            port=ssh_port,
+            username="root",
+            key_filename=str(ssh_pubkey.with_suffix("")),
+            look_for_keys=False,
+            allow_agent=False,
+        )
+
+        table = Table("Method", "Time (s)", "Throughput")
+        size = local_file.stat().st_size
+
+        started_at = time.monotonic()
+        with client.open_sftp() as plain:
+            plain.put(str(local_file), remote_file)
+        elapsed = time.monotonic() - started_at
+        table.add_row("sftp.put", f"{elapsed:.2f}", f"{format_bytes(size / elapsed)}/s")
+
+        key = paramiko.RSAKey.from_private_key_file(str(ssh_pubkey.with_suffix("")))
+        remote_local = ssh_server.root_for(key) / remote_file.lstrip("/")
+        remote_local.unlink()
+        progress = put_file(client, str(local_file), remote_file)
+        table.add_row(
+            "put_file", f"{progress.elapsed:.2f}", f"{format_bytes(progress.rate)}/s"
+        )
+
+        # Simulate a dropped upload by keeping only the first half of the file
+        with open(remote_local, "r+b") as f:
+            f.truncate(size // 2)
+        progress = put_file(client, str(local_file), remote_file)
+        table.add_row(
+            "put_file (resumed at 50%)",
+            f"{progress.elapsed:.2f}",
+            f"{format_bytes(progress.rate)}/s",
+        )
+        if remote_local.read_bytes() != local_file.read_bytes():
+            raise RuntimeError("Resumed upload does not match the local file")
+
+        client.close()
+        ssh_server.close()
+        if proxy is not None:
+            proxy.close()
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    app()
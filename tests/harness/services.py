@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiohttp import web
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# The client passes the STORE message size straight through as the rootfs size in MiB
+ROOTFS_SIZE = 20_480
+USDC_DECIMALS = 6
+ALEPH_CREDITS_DECIMALS = 6
+CRN_COUNT = 8
+
+
+@dataclass
+class FaultProfile:
+    """Latency in seconds added to every request and probability of failing it."""
+
+    latency: float = 0.0
+    failure_rate: float = 0.0
+
+
+@dataclass
+class FakeState:
+    """State shared by the stand-in services, inspectable by benchmarks and tests."""
+
+    usdc_balance: float = 10.0
+    credit_balance: float = 0.0
+    boot_delay: float = 0.0
+    confirmation_delay: float = 0.0
+    messages: dict[str, dict[str, Any]] = field(default_factory=dict)
+    forgotten: set[str] = field(default_factory=set)
+    allocations: dict[str, float] = field(default_factory=dict)
+    # Monotonic time at which each message posted without `sync` gets processed
+    processed_at: dict[str, float] = field(default_factory=dict)
+
+    def pending(self, item_hash: str) -> bool:
+        return time.monotonic() < self.processed_at.get(item_hash, 0.0)
+    requests: list[tuple[str, str]] = field(default_factory=list)
+
+
+def _fault_middleware(name: str, profile: FaultProfile, state: FakeState):
+    @web.middleware
+    async def middleware(
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        state.requests.append((name, f"{request.method} {request.path}"))
+        if profile.latency:
+            await asyncio.sleep(profile.latency)
+        if random.random() < profile.failure_rate:
+            return web.json_response({"detail": "injected failure"}, status=503)
+        return await handler(request)
+
+    return middleware
+
+
+def _store_message(item_hash: str) -> dict[str, Any]:
+    content = json.dumps(
+        {
+            "address": ZERO_ADDRESS,
+            "time": time.time(),
+            "item_type": "storage",
+            "item_hash": item_hash,
+            "size": ROOTFS_SIZE,
+        }
+    )
+    return {
+        "chain": "ETH",
+        "sender": ZERO_ADDRESS,
+        "type": "STORE",
+        "channel": "TEST",
+        "item_type": "inline",
+        "item_content": content,
+        "item_hash": hashlib.sha256(content.encode()).hexdigest(),
+        "time": time.time(),
+        "signature": "0x" + "00" * 65,
+        "content": json.loads(content),
+    }
+
+
+def aleph_app(state: FakeState, profile: FaultProfile) -> web.Application:
+    """Aleph API: messages, message lookup, submission (incl. forgets) and balance."""
+
+    async def list_messages(request: web.Request) -> web.Response:
+        params = request.query
+        addresses = set(filter(None, params.get("addresses", "").split(",")))
+        types = set(filter(None, params.get("msgTypes", "").split(",")))
+        channels = set(filter(None, params.get("channels", "").split(",")))
+        statuses = set(filter(None, params.get("msgStatuses", "").split(",")))
+        page = int(params.get("page", "1"))
+        per_page = int(params.get("pagination", "200"))
+        matching = [
+            message
+            for message in state.messages.values()
+            if message["item_hash"] not in state.forgotten
+            and (not addresses or message["sender"] in addresses)
+            and (not types or message["type"] in types)
+            and (not channels or message["channel"] in channels)
+            and (
+                not statuses
+                or ("pending" if state.pending(message["item_hash"]) else "processed")
+                in statuses
+            )
+        ]
+        start = (page - 1) * per_page
+        return web.json_response(
+            {
+                "messages": matching[start : start + per_page],
+                "pagination_page": page,
+                "pagination_total": len(matching),
+                "pagination_per_page": per_page,
+                "pagination_item": "messages",
+            }
+        )
+
+    async def get_message(request: web.Request) -> web.Response:
+        item_hash = request.match_info["item_hash"]
+        message = state.messages.get(item_hash)
+        if message is None:
+            # Any unknown hash is served as the rootfs STORE message
+            message = _store_message(item_hash)
+        status = "forgotten" if item_hash in state.forgotten else "processed"
+        return web.json_response(
+            {
+                "status": status,
+                "item_hash": item_hash,
+                "message": message,
+                "forgotten_by": [],
+                "reason": [],
+            }
+        )
+
+    async def get_message_status(request: web.Request) -> web.Response:
+        item_hash = request.match_info["item_hash"]
+        if state.pending(item_hash):
+            status = "pending"
+        elif item_hash in state.forgotten:
+            status = "forgotten"
+        else:
+            status = "processed"
+        return web.json_response({"item_hash": item_hash, "status": status})
+
+    async def post_message(request: web.Request) -> web.Response:
+        body = await request.json()
+        message = dict(body["message"])
+        content = json.loads(message["item_content"])
+        message["content"] = content
+        if message["type"] == "FORGET":
+            state.forgotten.update(content.get("hashes", []))
+        else:
+            state.messages[message["item_hash"]] = message
+        if state.confirmation_delay and not body.get("sync"):
+            state.processed_at[message["item_hash"]] = (
+                time.monotonic() + state.confirmation_delay
+            )
+            return web.json_response(
+                {
+                    "publication_status": {"status": "success", "failed": []},
+                    "message_status": "pending",
+                },
+                status=202,
+            )
+        await asyncio.sleep(state.confirmation_delay)
+        return web.json_response(
+            {
+                "publication_status": {"status": "success", "failed": []},
+                "message_status": "processed",
+            }
+        )
+
+    async def get_balance(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "address": request.match_info["address"],
+                "balance": 0,
+                "locked_amount": 0,
+                "credit_balance": int(state.credit_balance * 10**ALEPH_CREDITS_DECIMALS),
+            }
+        )
+
+    app = web.Application(middlewares=[_fault_middleware("aleph", profile, state)])
+    app.router.add_get("/api/v0/messages.json", list_messages)
+    app.router.add_get("/api/v0/messages/{item_hash}/status", get_message_status)
+    app.router.add_get("/api/v0/messages/{item_hash}", get_message)
+    app.router.add_post("/api/v0/messages", post_message)
+    app.router.add_get("/api/v0/addresses/{address}/balance", get_balance)
+    return app
+
+
+def crn_app(state: FakeState, profile: FaultProfile) -> web.Application:
+    """CRN: allocation notification, executions list and the CRN list.
+
+    An instance gets its network `boot_delay` seconds after being notified, which
+    is refused until the network processed its message.
+    """
+
+    async def notify(request: web.Request) -> web.Response:
+        body = await request.json()
+        if state.pending(body["instance"]):
+            return web.json_response({"detail": "Instance message not processed yet"}, status=404)
+        state.allocations.setdefault(body["instance"], time.monotonic())
+        return web.json_response({"success": True})
+
+    async def executions(_request: web.Request) -> web.Response:
+        now = time.monotonic()
+        return web.json_response(
+            {
+                instance_hash: {"networking": {"ipv6": "::/124"}}
+                for instance_hash, notified_at in state.allocations.items()
+                if now - notified_at >= state.boot_delay
+            }
+        )
+
+    async def crn_list(request: web.Request) -> web.Response:
+        # Every listed node is this stand-in, under a distinct hash
+        origin = str(request.url.origin())
+        return web.json_response(
+            {
+                "crns": [
+                    {
+                        "hash": hashlib.sha256(f"crn-{index}".encode()).hexdigest(),
+                        "name": f"fake-crn-{index}",
+                        "address": origin,
+                        "payment_receiver_address": ZERO_ADDRESS,
+                        "score": 1 - index / CRN_COUNT,
+                        "qemu_support": True,
+                        "ipv6_check": {"host": True, "vm": True},
+                    }
+                    for index in range(CRN_COUNT)
+                ]
+            }
+        )
+
+    app = web.Application(middlewares=[_fault_middleware("crn", profile, state)])
+    app.router.add_get("/crns.json", crn_list)
+    app.router.add_post("/control/allocation/notify", notify)
+    app.router.add_get("/about/executions/list", executions)
+    return app
+
+
+def rpc_app(state: FakeState, profile: FaultProfile) -> web.Application:
+    """Base JSON-RPC answering the USDC balanceOf eth_call."""
+
+    async def rpc(request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get("method") != "eth_call":
+            return web.json_response(
+                {"jsonrpc": "2.0", "id": body.get("id"), "error": {"message": "unsupported"}}
+            )
+        raw = int(state.usdc_balance * 10**USDC_DECIMALS)
+        return web.json_response(
+            {"jsonrpc": "2.0", "id": body.get("id"), "result": hex(raw)}
+        )
+
+    app = web.Application(middlewares=[_fault_middleware("rpc", profile, state)])
+    app.router.add_post("/", rpc)
+    return app
+
+
+def credits_app(state: FakeState, profile: FaultProfile) -> web.Application:
+    """x402 credits endpoint, paid without a payment challenge."""
+
+    async def buy(request: web.Request) -> web.Response:
+        body = await request.json()
+        amount = float(body["amount"])
+        state.usdc_balance -= amount
+        state.credit_balance += amount
+        return web.json_response({"address": body["address"], "amount": amount})
+
+    app = web.Application(middlewares=[_fault_middleware("credits", profile, state)])
+    app.router.add_post("/libertai/aleph-credits", buy)
+    return app
+
+
+class FakeServices:
+    """Runs the HTTP stand-ins on an event loop in a background thread."""
+
+    def __init__(
+        self,
+        state: FakeState | None = None,
+        profiles: dict[str, FaultProfile] | None = None,
+    ) -> None:
+        self.state = state or FakeState()
+        self.profiles = profiles or {}
+        self.urls: dict[str, str] = {}
+        self._loop = asyncio.new_event_loop()
+        self._runners: list[web.AppRunner] = []
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def _profile(self, name: str) -> FaultProfile:
+        return self.profiles.get(name, FaultProfile())
+
+    async def _start(self) -> None:
+        apps = {
+            "aleph": aleph_app(self.state, self._profile("aleph")),
+            "crn": crn_app(self.state, self._profile("crn")),
+            "rpc": rpc_app(self.state, self._profile("rpc")),
+            "credits": credits_app(self.state, self._profile("credits")),
+        }
+        for name, app in apps.items():
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            self.urls[name] = f"http://127.0.0.1:{port}"
+            self._runners.append(runner)
+
+    async def _stop(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def env(self) -> dict[str, str]:
+        """Environment variables pointing the client at the stand-ins."""
+        return {
+            "LIBERTAI_CLIENT_ALEPH_API_URLS": self.urls["aleph"],
+            "LIBERTAI_CLIENT_CRN_URL": self.urls["crn"],
+            "LIBERTAI_CLIENT_CRN_LIST_URL": f"{self.urls['crn']}/crns.json",
+            "LIBERTAI_CLIENT_BASE_RPC_URL": self.urls["rpc"],
+            "LIBERTAI_CLIENT_API_BASE": self.urls["credits"],
+        }
@@ -0,0 +1,411 @@
+import hashlib
+import io
+import json
+import os
+import queue
+import random
+import re
+import socket
+import tarfile
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import paramiko
+from paramiko.sftp import SFTP_FAILURE, SFTP_NO_SUCH_FILE, SFTP_OK
+
+from tests.harness.services import FaultProfile
+
+_PREFIX_HASH_COMMAND = re.compile(r"^head -c (\d+) (\S+) \| sha256sum$")
+_EXTRACT_COMMAND = re.compile(r"^cd (\S+) && tar xzf -")
+# How the deploy manifest is written and read back
+_WRITE_COMMAND = re.compile(r"^mkdir -p \S+ && cat > \S+ && mv \S+ (\S+)$")
+_READ_COMMAND = re.compile(r"^cat (\S+)$")
+# Containers reported by the fake `docker ps` and `docker stats`
+_CONTAINERS = {"libertai-agentkit-agent-1": "agent", "libertai-agentkit-redis-1": "redis"}
+STATS_INTERVAL = 0.5
+
+
+@dataclass
+class SSHBehavior(FaultProfile):
+    """Fault profile of the fake SSH host.
+
+    `latency` is the one-way network delay added by the proxy, `failure_rate`
+    the probability that a command exits with an error and `command_delays`
+    maps a substring of a command to the time it takes to run.
+    """
+
+    command_delays: dict[str, float] = field(default_factory=dict)
+
+
+def _errno_to_sftp(error: OSError) -> int:
+    return paramiko.SFTPServer.convert_errno(error.errno or 0)
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def stat(self) -> paramiko.SFTPAttributes | int:
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return _errno_to_sftp(e)
+
+    def chattr(self, attr: paramiko.SFTPAttributes) -> int:
+        return SFTP_OK
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    """SFTP server mapping remote absolute paths into a local root directory."""
+
+    root: Path
+
+    def __init__(self, server: "_ServerInterface", *args, **kwargs) -> None:
+        super().__init__(server, *args, **kwargs)
+        self.root = server.root
+
+    def _local(self, path: str) -> str:
+        return str(self.root / path.lstrip("/"))
+
+    def list_folder(self, path: str) -> list[paramiko.SFTPAttributes] | int:
+        local = self._local(path)
+        try:
+            result = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                result.append(attr)
+            return result
+        except OSError as e:
+            return _errno_to_sftp(e)
+
+    def stat(self, path: str) -> paramiko.SFTPAttributes | int:
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return _errno_to_sftp(e)
+
+    lstat = stat
+
+    def open(
+        self, path: str, flags: int, attr: paramiko.SFTPAttributes
+    ) -> paramiko.SFTPHandle | int:
+        local = self._local(path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        try:
+            fd = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o644)
+        except OSError as e:
+            return _errno_to_sftp(e)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = _SFTPHandle(flags)
+        handle.filename = local
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path: str) -> int:
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return _errno_to_sftp(e)
+        return SFTP_OK
+
+    def rename(self, oldpath: str, newpath: str) -> int:
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return _errno_to_sftp(e)
+        return SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path: str, attr: paramiko.SFTPAttributes) -> int:
+        try:
+            os.makedirs(self._local(path))
+        except FileExistsError:
+            return SFTP_FAILURE
+        except OSError as e:
+            return _errno_to_sftp(e)
+        return SFTP_OK
+
+    def rmdir(self, path: str) -> int:
+        try:
+            os.rmdir(self._local(path))
+        except FileNotFoundError:
+            return SFTP_NO_SUCH_FILE
+        except OSError as e:
+            return _errno_to_sftp(e)
+        return SFTP_OK
+
+    def chattr(self, path: str, attr: paramiko.SFTPAttributes) -> int:
+        return SFTP_OK
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, fake: "FakeSSHServer") -> None:
+        self.fake = fake
+        self.root = fake.root
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        self.root = self.fake.root_for(key)
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "publickey"
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel: paramiko.Channel, command: bytes) -> bool:
+        threading.Thread(
+            target=self.fake.run_command,
+            args=(channel, command.decode(), self.root),
+            daemon=True,
+        ).start()
+        return True
+
+
+class FakeSSHServer:
+    """In-process SSH server accepting any public key.
+
+    SFTP is served from a local root directory and commands are answered by
+    the handlers the deploy flow relies on instead of being executed. Every
+    client key gets its own root, so that concurrent deploys using distinct
+    keys don't share their remote files, like deploys to distinct instances.
+    """
+
+    def __init__(self, root: Path, behavior: SSHBehavior | None = None) -> None:
+        self.root = root
+        self.behavior = behavior or SSHBehavior()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.commands: list[str] = []
+        self._socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("::1", 0))
+        self._socket.listen(16)
+        self.port: int = self._socket.getsockname()[1]
+        self._transports: list[paramiko.Transport] = []
+        self._stopped = threading.Event()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                conn, _addr = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SFTPServer)
+        self._transports.append(transport)
+        try:
+            transport.start_server(server=_ServerInterface(self))
+        except (EOFError, paramiko.SSHException):
+            # Reachability probes connect and hang up without a handshake
+            transport.close()
+
+    def root_for(self, key: paramiko.PKey) -> Path:
+        return self.root / key.get_fingerprint().hex()
+
+    def run_command(self, channel: paramiko.Channel, command: str, root: Path) -> None:
+        self.commands.append(command)
+        # paramiko sends the exec acknowledgement only once the request handler
+        # returns, give it time to go out before the channel gets closed
+        time.sleep(0.01)
+        try:
+            delay = sum(
+                seconds
+                for pattern, seconds in self.behavior.command_delays.items()
+                if pattern in command
+            )
+            if delay:
+                time.sleep(delay)
+            if random.random() < self.behavior.failure_rate:
+                channel.sendall_stderr(b"injected failure\n")
+                channel.send_exit_status(1)
+                return
+            if _EXTRACT_COMMAND.match(command):
+                self._extract_stdin(channel, command, root)
+            if _WRITE_COMMAND.match(command):
+                self._write_stdin(channel, command, root)
+            if command.startswith("docker stats"):
+                self._stream_stats(channel)
+                return
+            handler = self._handler_for(command)
+            stdout, exit_status = handler(command, root)
+            if stdout:
+                channel.sendall(stdout)
+            channel.send_exit_status(exit_status)
+        finally:
+            channel.close()
+
+    def _handler_for(self, command: str) -> Callable[[str, Path], tuple[bytes, int]]:
+        if _PREFIX_HASH_COMMAND.match(command):
+            return self._prefix_hash
+        if _READ_COMMAND.match(command):
+            return self._read_file
+        if command.startswith("docker ps"):
+            listing = "".join(f"{name} {service}\n" for name, service in _CONTAINERS.items())
+            return lambda _command, _root: (listing.encode(), 0)
+        if "docker compose" in command:
+            return self._compose
+        return lambda _command, _root: (b"", 0)
+
+    def _compose(self, command: str, root: Path) -> tuple[bytes, int]:
+        """Containers are running unless stopped, with the state kept per client root."""
+        stopped = root / ".compose-stopped"
+        if "docker compose stop" in command:
+            stopped.parent.mkdir(parents=True, exist_ok=True)
+            stopped.touch()
+        elif "docker compose up" in command or "docker compose start" in command:
+            stopped.unlink(missing_ok=True)
+        elif "docker compose ps" in command:
+            state = "exited" if stopped.exists() else "running"
+            # Without -a, compose only lists the running containers
+            if state == "running" or " -a" in command:
+                return json.dumps({"Service": "agent", "State": state}).encode() + b"\n", 0
+        return b"", 0
+
+    def _stream_stats(self, channel: paramiko.Channel) -> None:
+        """Refresh like `docker stats` until the client goes away."""
+        net = 0
+        while not channel.closed and not self._stopped.is_set():
+            net += random.randint(10_000, 100_000)
+            frame = "\x1b[2J\x1b[H" + "".join(
+                json.dumps(
+                    {
+                        "Name": name,
+                        "CPUPerc": f"{random.uniform(0, 50):.2f}%",
+                        "MemUsage": f"{random.uniform(50, 500):.1f}MiB / 3.8GiB",
+                        "NetIO": f"{net / 1000:.1f}kB / {net / 2000:.1f}kB",
+                    }
+                )
+                + "\n"
+                for name in _CONTAINERS
+            )
+            try:
+                channel.sendall(frame.encode())
+            except OSError:
+                return
+            time.sleep(STATS_INTERVAL)
+        if not channel.closed:
+            channel.send_exit_status(0)
+
+    def _extract_stdin(self, channel: paramiko.Channel, command: str, root: Path) -> None:
+        match = _EXTRACT_COMMAND.match(command)
+        assert match is not None
+        archive = io.BytesIO()
+        while data := channel.recv(65536):
+            archive.write(data)
+        archive.seek(0)
+        destination = root / match.group(1).lstrip("/")
+        destination.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(fileobj=archive, mode="r:gz") as tf:
+            tf.extractall(destination, filter="data")
+
+    def _write_stdin(self, channel: paramiko.Channel, command: str, root: Path) -> None:
+        match = _WRITE_COMMAND.match(command)
+        assert match is not None
+        content = io.BytesIO()
+        while data := channel.recv(65536):
+            content.write(data)
+        destination = root / match.group(1).lstrip("/")
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.write_bytes(content.getvalue())
+
+    def _read_file(self, command: str, root: Path) -> tuple[bytes, int]:
+        match = _READ_COMMAND.match(command)
+        assert match is not None
+        try:
+            return (root / match.group(1).lstrip("/")).read_bytes(), 0
+        except OSError:
+            return b"", 1
+
+    def _prefix_hash(self, command: str, root: Path) -> tuple[bytes, int]:
+        match = _PREFIX_HASH_COMMAND.match(command)
+        assert match is not None
+        length, path = int(match.group(1)), match.group(2).strip("'")
+        try:
+            with open(root / path.lstrip("/"), "rb") as f:
+                digest = hashlib.sha256(f.read(length)).hexdigest()
+        except OSError:
+            return b"", 1
+        return f"{digest}  -\n".encode(), 0
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._socket.close()
+        for transport in self._transports:
+            transport.close()
+
+
+class LatencyProxy:
+    """TCP proxy adding a fixed one-way delay in both directions.
+
+    Data is delayed rather than throttled, so pipelined protocols keep their
+    throughput while every round trip pays twice the latency, like a real
+    high-latency link.
+    """
+
+    def __init__(self, target_port: int, latency: float) -> None:
+        self.target_port = target_port
+        self.latency = latency
+        self._socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("::1", 0))
+        self._socket.listen(16)
+        self.port: int = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                client, _addr = self._socket.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(("::1", self.target_port))
+            for source, destination in [(client, upstream), (upstream, client)]:
+                pending: queue.Queue[tuple[float, bytes]] = queue.Queue()
+                threading.Thread(
+                    target=self._read, args=(source, pending), daemon=True
+                ).start()
+                threading.Thread(
+                    target=self._write, args=(destination, pending), daemon=True
+                ).start()
+
+    def _read(self, source: socket.socket, pending: "queue.Queue[tuple[float, bytes]]") -> None:
+        while True:
+            try:
+                data = source.recv(65536)
+            except OSError:
+                data = b""
+            pending.put((time.monotonic() + self.latency, data))
+            if not data:
+                return
+
+    @staticmethod
+    def _write(destination: socket.socket, pending: "queue.Queue[tuple[float, bytes]]") -> None:
+        while True:
+            due, data = pending.get()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                if not data:
+                    destination.shutdown(socket.SHUT_WR)
+                    return
+                destination.sendall(data)
+            except OSError:
+                return
+
+    def close(self) -> None:
+        self._socket.close()
@@ -0,0 +1,29 @@
+"""Local agent directories and SSH keys deployed by the harness."""
+
+import os
+import secrets
+from pathlib import Path
+
+import paramiko
+
+
+def write_ssh_key(directory: Path) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    key = paramiko.RSAKey.generate(2048)
+    private_path = directory / "id_rsa"
+    key.write_private_key_file(str(private_path))
+    public_path = directory / "id_rsa.pub"
+    public_path.write_text(f"{key.get_name()} {key.get_base64()} harness\n")
+    return public_path
+
+
+def write_agent(directory: Path, payload_mb: float) -> Path:
+    directory.mkdir(parents=True)
+    (directory / "docker-compose.yml").write_text(
+        "services:\n  agent:\n    build: .\n    ports:\n      - 8000:8000\n"
+        "  redis:\n    image: redis:7-alpine\n"
+    )
+    (directory / "Dockerfile").write_text("FROM python:3.12-slim\nCOPY . /app\n")
+    (directory / "payload.bin").write_bytes(os.urandom(int(payload_mb * 1024 * 1024)))
+    (directory / ".env.prod").write_text(f"WALLET_PRIVATE_KEY=0x{secrets.token_hex(32)}\n")
+    return directory
@@ -0,0 +1,101 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from libertai_client.agentkit.bench import BenchResult, run_load
+
+
+def _app(hits: list[str]) -> web.Application:
+    async def ok(request: web.Request) -> web.Response:
+        hits.append(request.path)
+        await asyncio.sleep(0.005)
+        return web.Response(text="ok")
+
+    async def flaky(request: web.Request) -> web.Response:
+        hits.append(request.path)
+        # Every other request fails
+        return web.Response(status=503 if len(hits) % 2 else 200)
+
+    async def missing(request: web.Request) -> web.Response:
+        hits.append(request.path)
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/ok", ok)
+    app.router.add_get("/flaky", flaky)
+    app.router.add_get("/missing", missing)
+    return app
+
+
+def _bench(
+    path: str, load: Callable[[str], Awaitable[BenchResult]]
+) -> tuple[BenchResult, list[str]]:
+    hits: list[str] = []
+
+    async def main() -> BenchResult:
+        async with TestServer(_app(hits)) as server:
+            return await load(str(server.make_url(path)))
+
+    return asyncio.run(main()), hits
+
+
+def test_closed_loop_total() -> None:
+    result, hits = _bench("/ok", lambda url: run_load(url, concurrency=4, total=40))
+    assert result.requests == len(hits) == 40
+    assert result.statuses == {200: 40}
+    assert result.failures == 0
+    assert len(result.latencies) == 40
+    assert result.percentile(50) is not None
+    assert result.as_dict()["requests"] == 40
+
+
+def test_rps_schedule() -> None:
+    result, hits = _bench(
+        "/ok", lambda url: run_load(url, concurrency=4, rps=50, duration=0.5)
+    )
+    # Requests start every 20 ms, the last one before the end of the run
+    assert result.requests == len(hits) == 25
+    assert result.duration >= 0.48
+    assert result.throughput == pytest.approx(50, rel=0.2)
+
+
+def test_rps_total() -> None:
+    result, hits = _bench("/ok", lambda url: run_load(url, rps=100, total=10))
+    assert result.requests == len(hits) == 10
+    assert result.duration >= 0.09
+
+
+def test_server_errors_count_as_failures() -> None:
+    result, _hits = _bench("/flaky", lambda url: run_load(url, concurrency=1, total=10))
+    assert result.statuses == {200: 5, 503: 5}
+    assert result.failures == 5
+    assert result.error_rate == 0.5
+    # Latencies only cover the successful requests
+    assert len(result.latencies) == 5
+
+
+def test_client_errors_are_not_failures() -> None:
+    result, _hits = _bench("/missing", lambda url: run_load(url, total=5))
+    assert result.statuses == {404: 5}
+    assert result.failures == 0
+
+
+def test_connection_errors() -> None:
+    async def main() -> BenchResult:
+        async with TestServer(web.Application()) as server:
+            url = str(server.make_url("/"))
+        # The server is gone, every connection is refused
+        return await run_load(url, concurrency=2, total=4, timeout=2)
+
+    result = asyncio.run(main())
+    assert result.requests == 4
+    assert result.failures == 4
+    assert result.errors == {"ClientConnectorError": 4}
+
+
+def test_requires_an_end() -> None:
+    with pytest.raises(ValueError):
+        asyncio.run(run_load("http://localhost"))
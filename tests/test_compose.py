@@ -0,0 +1,239 @@
+from pathlib import Path
+
+import pytest
+
+from libertai_client.agentkit.compose import (
+    RestartPlan,
+    diff_manifests,
+    load_services,
+    parse_memory,
+    plan_restart,
+)
+from libertai_client.agentkit.sizing import size_instance
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("512m", 512),
+        ("512M", 512),
+        ("512mb", 512),
+        ("256Mi", 256),
+        ("256MiB", 256),
+        ("1gi", 1024),
+        ("1.5Gi", 1536),
+        ("2g", 2048),
+        ("1048576", 1),
+        (1048576, 1),
+        ("100k", 1),
+    ],
+)
+def test_parse_memory(value: str | int, expected: int) -> None:
+    assert parse_memory(value) == expected
+
+
+@pytest.mark.parametrize("value", ["${MEM_LIMIT:-512m}", "$MEM_LIMIT", "lots", "512x", ""])
+def test_parse_memory_unreadable(value: str) -> None:
+    with pytest.raises(ValueError):
+        parse_memory(value)
+
+
+def _write_compose(tmp_path: Path, content: str) -> Path:
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text(content)
+    return compose_file
+
+
+def test_binary_suffixes(tmp_path: Path) -> None:
+    compose_file = _write_compose(
+        tmp_path,
+        """
+services:
+  agent:
+    image: agent
+    deploy:
+      resources:
+        limits:
+          cpus: "1.5"
+          memory: 1Gi
+        reservations:
+          memory: 256Mi
+""",
+    )
+    [service] = load_services(compose_file)
+    assert service.cpus == 1.5
+    assert service.memory_mib == 1024
+    assert service.unreadable_resources == []
+
+
+def test_interpolated_values_count_as_no_limit(tmp_path: Path) -> None:
+    compose_file = _write_compose(
+        tmp_path,
+        """
+services:
+  agent:
+    image: agent
+    cpus: ${AGENT_CPUS:-1}
+    mem_limit: ${MEM_LIMIT:-512m}
+  worker:
+    image: worker
+    deploy:
+      resources:
+        limits:
+          memory: ${WORKER_MEMORY}
+        reservations:
+          memory: 256Mi
+""",
+    )
+    agent, worker = load_services(compose_file)
+    assert agent.cpus is None
+    assert agent.memory_mib is None
+    assert agent.unreadable_resources == [
+        "cpus: ${AGENT_CPUS:-1}",
+        "mem_limit: ${MEM_LIMIT:-512m}",
+    ]
+    # The readable reservation still counts
+    assert worker.memory_mib == 256
+    assert worker.unreadable_resources == [
+        "deploy.resources.limits.memory: ${WORKER_MEMORY}"
+    ]
+
+    sizing = size_instance([agent, worker])
+    assert "agent: 0.5 vCPU, 512 MiB (assumed, no limits set)" in sizing.rationale
+    assert (
+        "agent: ignored unreadable mem_limit: ${MEM_LIMIT:-512m}, treated as no limit"
+        in sizing.rationale
+    )
+    assert (
+        "worker: ignored unreadable deploy.resources.limits.memory: ${WORKER_MEMORY}, "
+        "treated as no limit" in sizing.rationale
+    )
+
+
+def test_no_declared_limits_keep_the_default_size(tmp_path: Path) -> None:
+    compose_file = _write_compose(
+        tmp_path,
+        """
+services:
+  agent:
+    build: .
+    mem_limit: ${MEM_LIMIT:-512m}
+  redis:
+    image: redis:7-alpine
+""",
+    )
+    sizing = size_instance(load_services(compose_file))
+    assert (sizing.vcpus, sizing.memory) == (2, 4096)
+    assert sizing.rationale == [
+        "agent: ignored unreadable mem_limit: ${MEM_LIMIT:-512m}, treated as no limit",
+        (
+            "No compose service declares CPU or memory limits, "
+            "using the default 2 vCPU, 4096 MiB"
+        ),
+    ]
+
+
+def test_declared_limits_size_the_instance(tmp_path: Path) -> None:
+    compose_file = _write_compose(
+        tmp_path,
+        """
+services:
+  agent:
+    build: .
+    cpus: 4
+    mem_limit: 6g
+""",
+    )
+    sizing = size_instance(load_services(compose_file))
+    # 4.25 vCPU and 6656 MiB with the system share, plus 25%
+    assert (sizing.vcpus, sizing.memory) == (6, 12288)
+
+
+def test_overrides_skip_compose_sizing(tmp_path: Path) -> None:
+    compose_file = _write_compose(
+        tmp_path,
+        """
+services:
+  agent:
+    image: agent
+    mem_limit: 64g
+""",
+    )
+    sizing = size_instance(load_services(compose_file), vcpus=2, memory=2048)
+    assert (sizing.vcpus, sizing.memory) == (2, 2048)
+    assert sizing.rationale == ["2 vCPU, 2048 MiB set by --vcpus and --memory"]
+
+
+RESTART_COMPOSE = """
+services:
+  api:
+    build:
+      context: ./api
+      dockerfile: ../docker/api.Dockerfile
+    env_file: api.env
+  worker:
+    build: worker
+    env_file:
+      - path: ./worker.env
+    volumes:
+      - ./config:/app/config:ro
+      - data:/data
+  redis:
+    image: redis:7-alpine
+    volumes:
+      - type: bind
+        source: ./redis.conf
+        target: /usr/local/etc/redis/redis.conf
+volumes:
+  data:
+"""
+
+
+@pytest.mark.parametrize(
+    ("changed", "expected"),
+    [
+        # A file inside a build context
+        (["api/main.py"], RestartPlan(rebuild=["api"])),
+        (["worker/tasks/run.py"], RestartPlan(rebuild=["worker"])),
+        # A Dockerfile outside the context
+        (["docker/api.Dockerfile"], RestartPlan(rebuild=["api"])),
+        # env_file, short and long syntax
+        (["api.env"], RestartPlan(recreate=["api"])),
+        (["worker.env"], RestartPlan(recreate=["worker"])),
+        # Bind mounted directories and files
+        (["config/settings.toml"], RestartPlan(recreate=["worker"])),
+        (["redis.conf"], RestartPlan(recreate=["redis"])),
+        # A rebuild covers the recreate of the same service
+        (["worker/app.py", "config/a.yml"], RestartPlan(rebuild=["worker"])),
+        (
+            ["api/main.py", "redis.conf", "worker.env"],
+            RestartPlan(rebuild=["api"], recreate=["redis", "worker"]),
+        ),
+        # The compose file and the project .env
+        (["docker-compose.yml"], RestartPlan(everything=True)),
+        ([".env", "api/main.py"], RestartPlan(everything=True)),
+        # Files no service refers to
+        (["README.md"], RestartPlan()),
+        (["apix/main.py", "data/x"], RestartPlan()),
+        ([], RestartPlan()),
+    ],
+)
+def test_plan_restart(tmp_path: Path, changed: list[str], expected: RestartPlan) -> None:
+    services = load_services(_write_compose(tmp_path, RESTART_COMPOSE))
+    assert plan_restart("docker-compose.yml", services, changed) == expected
+
+
+@pytest.mark.parametrize(
+    ("old", "new", "expected"),
+    [
+        ({"a.py": "1"}, {"a.py": "1"}, set()),
+        ({"a.py": "1"}, {"a.py": "2"}, {"a.py"}),
+        ({}, {"a.py": "1"}, {"a.py"}),
+        ({"a.py": "1", "b.py": "1"}, {"b.py": "1"}, {"a.py"}),
+        ({"a.py": "1", "b.py": "1"}, {"b.py": "2", "c.py": "1"}, {"a.py", "b.py", "c.py"}),
+    ],
+)
+def test_diff_manifests(
+    old: dict[str, str], new: dict[str, str], expected: set[str]
+) -> None:
+    assert diff_manifests(old, new) == expected
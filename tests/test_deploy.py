@@ -0,0 +1,169 @@
+"""Deploy and resume flows against the offline harness stand-ins."""
+
+import asyncio
+import json
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import paramiko
+import pytest
+
+from libertai_client.agentkit.deployer import Deployer, DeployError, DeployResult
+from libertai_client.agentkit.infra import aleph
+from libertai_client.agentkit.infra.ssh import (
+    AGENT_MANIFEST_PATH,
+    agent_manifest,
+    manifest_digest,
+)
+from libertai_client.agentkit.journal import DeployJournal
+from libertai_client.agentkit.state import AgentState
+from libertai_client.config import config
+from libertai_client.utils.artifacts import artifact_cache
+from libertai_client.utils.cache import metadata_cache
+from tests.harness.services import FakeServices
+from tests.harness.ssh_server import FakeSSHServer
+from tests.harness.workspace import write_agent, write_ssh_key
+
+DEPLOY_CODE_COMMAND = "bash /tmp/libertai-agentkit-deploy-code.sh"
+
+
+@dataclass
+class Network:
+    services: FakeServices
+    ssh: FakeSSHServer
+    agent_path: Path
+    ssh_pubkey_path: Path
+
+    @property
+    def remote_root(self) -> Path:
+        key = paramiko.RSAKey.from_private_key_file(str(self.ssh_pubkey_path.with_suffix("")))
+        return self.ssh.root_for(key)
+
+    @property
+    def instance_hashes(self) -> list[str]:
+        return [
+            item_hash
+            for item_hash, message in self.services.state.messages.items()
+            if message["type"] == "INSTANCE"
+        ]
+
+    def deploy(self, resume: bool = False) -> DeployResult:
+        return asyncio.run(
+            Deployer(self.agent_path, ssh_pubkey_path=self.ssh_pubkey_path, resume=resume).run()
+        )
+
+    def remote_manifest(self) -> dict[str, str]:
+        return json.loads((self.remote_root / AGENT_MANIFEST_PATH.lstrip("/")).read_text())
+
+    def uploads(self) -> int:
+        return self.ssh.commands.count(DEPLOY_CODE_COMMAND)
+
+
+@pytest.fixture
+def network(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Network]:
+    services = FakeServices()
+    services.start()
+    ssh = FakeSSHServer(tmp_path / "remote")
+    env = {
+        **services.env(),
+        "LIBERTAI_CLIENT_SSH_PORT": str(ssh.port),
+        "LIBERTAI_CLIENT_CACHE_DIR": str(tmp_path / "cache"),
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    # The settings were read when the client was imported, point them at the stand-ins
+    for name, value in vars(type(config)()).items():
+        monkeypatch.setattr(config, name, value)
+    monkeypatch.setattr(aleph, "ALEPH_API_URL", config.ALEPH_API_URLS[0])
+    monkeypatch.setattr(aleph.DEFAULT_CRN, "url", config.CRN_URL)
+    monkeypatch.setattr(metadata_cache, "directory", tmp_path / "cache" / "metadata")
+    monkeypatch.setattr(artifact_cache, "directory", tmp_path / "cache" / "artifacts")
+    try:
+        yield Network(
+            services=services,
+            ssh=ssh,
+            agent_path=write_agent(tmp_path / "agent", payload_mb=0.1),
+            ssh_pubkey_path=write_ssh_key(tmp_path / "key"),
+        )
+    finally:
+        ssh.close()
+        services.stop()
+
+
+def _interrupt_after_upload(network: Network, result: DeployResult) -> None:
+    """Leave the journal of a deploy that failed after uploading the current code."""
+    journal = DeployJournal.start(network.agent_path.resolve(), result.address)
+    journal.record(
+        credits_purchased=True,
+        instance_hash=result.instance_hash,
+        allocation_notified=True,
+        instance_ip=result.instance_ip,
+        code_uploaded=True,
+        code_digest=manifest_digest(agent_manifest(network.agent_path.resolve())),
+        docker_installed=True,
+    )
+
+
+def test_deploy(network: Network) -> None:
+    result = network.deploy()
+
+    assert result.ok
+    assert network.instance_hashes == [result.instance_hash]
+    assert DeployJournal.load(network.agent_path) is None
+    state = AgentState.load(network.agent_path)
+    assert state is not None
+    assert state.instance_hash == result.instance_hash
+    assert network.uploads() == 1
+    assert network.remote_manifest() == agent_manifest(network.agent_path)
+
+
+def test_resume_skips_the_uploaded_code(network: Network) -> None:
+    result = network.deploy()
+    _interrupt_after_upload(network, result)
+
+    resumed = network.deploy(resume=True)
+
+    assert resumed.ok
+    assert resumed.instance_hash == result.instance_hash
+    assert network.instance_hashes == [result.instance_hash]
+    assert network.uploads() == 1
+    assert DeployJournal.load(network.agent_path) is None
+
+
+def test_resume_uploads_code_changed_since_the_failure(network: Network) -> None:
+    result = network.deploy()
+    _interrupt_after_upload(network, result)
+    (network.agent_path / "main.py").write_text("print('changed')\n")
+
+    resumed = network.deploy(resume=True)
+
+    assert resumed.ok
+    assert network.instance_hashes == [result.instance_hash]
+    assert network.uploads() == 2
+    assert "main.py" in network.remote_manifest()
+
+
+def test_resume_waits_for_a_pending_instance(network: Network) -> None:
+    result = network.deploy()
+    _interrupt_after_upload(network, result)
+    assert result.instance_hash is not None
+    # The network hasn't processed the instance message yet
+    network.services.state.processed_at[result.instance_hash] = time.monotonic() + 1
+
+    resumed = network.deploy(resume=True)
+
+    assert resumed.ok
+    assert resumed.instance_hash == result.instance_hash
+    assert network.instance_hashes == [result.instance_hash]
+    assert "Checking the journaled instance" in [label for label, _ in resumed.steps]
+
+
+def test_failed_step_raises_deploy_error(network: Network) -> None:
+    network.ssh_pubkey_path.unlink()
+
+    with pytest.raises(DeployError) as error:
+        network.deploy()
+
+    assert error.value.step == "Reading the SSH public key"